@@ -2,9 +2,23 @@ import os
 import pandas as pd
 import glob
 import re
+import sys
+import json
+import argparse
+import warnings
+import itertools
+from functools import partial
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from datetime import datetime
 from concurrent.futures import ProcessPoolExecutor
+import price_store
+import indicator_cache
+import universe_manifest
+import run_profile
+import fund_outcomes
+import engine_core
+import memory_budget
 
 # --- 实战优化配置 ---
 DATA_DIR = 'fund_data'
@@ -14,43 +28,147 @@ STOP_LOSS = -0.07             # 中线放宽止损，防止在底部被洗出
 # 量比逻辑：改为“不放量杀跌”
 VOL_LIMIT_UPPER = 1.1         # 不超过均量的1.1倍
 VOL_LIMIT_LOWER = 0.4         # 不低于0.4倍，防止僵尸股
+MIN_HISTORY = 300             # 少于300根K线的品种不参与回测
+# 评分阈值：RSI 超卖 +30，J 值超卖 +30，20日乖离过大 +40
+RSI_LIMIT = 35
+J_LIMIT = 5
+BIAS_LIMIT = -4
+# 参数扫描可调的全部配置项
+SWEEP_KEYS = ['HOLD_DAYS', 'MIN_SCORE_THRESHOLD', 'STOP_LOSS', 'VOL_LIMIT_UPPER', 'VOL_LIMIT_LOWER',
+              'RSI_LIMIT', 'J_LIMIT', 'BIAS_LIMIT']
+# 回测引擎：vector(默认，NumPy 向量化) / loop(逐行参考实现，仅用于一致性校验)
+BACKTEST_ENGINE = os.environ.get('BACKTEST_ENGINE', 'vector')
 
-def calculate_tech(df):
-    df = df.sort_values('日期').copy()
+def compute_tech(df, seed=None, start=0):
+    """RSI/KDJ/乖离/量比；seed 非空时 KDJ 从缓存的递推状态接着算（供 indicator_cache 追加新K线）"""
     # RSI & KDJ
     delta = df['收盘'].diff()
     gain = (delta.where(delta > 0, 0)).rolling(14).mean()
     loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-    df['RSI'] = 100 - (100 / (1 + (gain / loss)))
+    rsi = 100 - (100 / (1 + (gain / loss)))
     low_9 = df['收盘'].rolling(9).min()
     high_9 = df['收盘'].rolling(9).max()
-    rsv = (df['收盘'] - low_9) / (high_9 - low_9) * 100
-    df['K'] = rsv.ewm(com=2, adjust=False).mean()
-    df['D'] = df['K'].ewm(com=2, adjust=False).mean()
-    df['J'] = 3 * df['K'] - 2 * df['D']
+    rsv = ((df['收盘'] - low_9) / (high_9 - low_9) * 100).to_numpy()[start:]
+    k, k_state = indicator_cache.ewm_mean(rsv, com=2, seed=seed and seed['K'])
+    d, d_state = indicator_cache.ewm_mean(k, com=2, seed=seed and seed['D'])
+    pad = np.full(start, np.nan)
     # 乖离与量比
-    df['MA20'] = df['收盘'].rolling(20).mean()
-    df['BIAS_20'] = (df['收盘'] - df['MA20']) / df['MA20'] * 100
-    df['V_MA5'] = df['成交量'].shift(1).rolling(5).mean()
-    df['VOL_RATIO'] = df['成交量'] / df['V_MA5']
+    ma20 = df['收盘'].rolling(20).mean()
+    v_ma5 = df['成交量'].shift(1).rolling(5).mean()
+    cols = {
+        'RSI': rsi.to_numpy(),
+        'K': np.concatenate([pad, k]),
+        'D': np.concatenate([pad, d]),
+        'J': np.concatenate([pad, 3 * k - 2 * d]),
+        'MA20': ma20.to_numpy(),
+        'BIAS_20': ((df['收盘'] - ma20) / ma20 * 100).to_numpy(),
+        'V_MA5': v_ma5.to_numpy(),
+        'VOL_RATIO': (df['成交量'] / v_ma5).to_numpy(),
+    }
+    return cols, {'K': k_state, 'D': d_state}
+
+TECH_SPEC = indicator_cache.IndicatorSpec('backtest_tech', ['日期', '收盘', '成交量'], 30, compute_tech)
+
+def calculate_tech(df):
+    df = df.sort_values('日期').copy()
+    cols, _ = compute_tech(df)
+    for c, v in cols.items(): df[c] = v
+    return df
+
+def load_backtest_frame(file_path):
+    """从列式仓库读取行情并计算指标；历史不足 MIN_HISTORY 根K线的品种返回 None"""
+    df = price_store.load_fund(file_path)
+    if df is None or len(df) < MIN_HISTORY: return None
+    cols = indicator_cache.get_indicators(price_store.code_from_path(file_path), df, TECH_SPEC)
+    for c, v in cols.items(): df[c] = v
+    df['日期'] = df['日期'].dt.strftime('%Y-%m-%d')
     return df
 
 def run_single_backtest(file_path):
+    """默认入口：按 BACKTEST_ENGINE 选择向量化引擎或逐行参考实现"""
+    if BACKTEST_ENGINE == 'loop':
+        return run_single_backtest_loop(file_path)
+    return run_single_backtest_vector(file_path)
+
+def scan_signals(df, horizon=None):
+    """一次性计算全部K线的评分、量比安全区与J值拐头，返回信号所在的行号
+
+    horizon 为信号之后必须保留的K线数，默认 max(HOLD_DAYS)；组合模拟等不需要前向收益的场景传 0。
+    """
+    rsi = df['RSI'].to_numpy(dtype=float)
+    j = df['J'].to_numpy(dtype=float)
+    bias = df['BIAS_20'].to_numpy(dtype=float)
+    vol_ratio = df['VOL_RATIO'].to_numpy(dtype=float)
+
+    score = np.where(rsi < RSI_LIMIT, 30, 0) + np.where(j < J_LIMIT, 30, 0) + np.where(bias < BIAS_LIMIT, 40, 0)
+    is_vol_safe = (VOL_LIMIT_LOWER < vol_ratio) & (vol_ratio < VOL_LIMIT_UPPER)
+    j_turn = np.zeros(len(df), dtype=bool)
+    j_turn[1:] = j[1:] > j[:-1]
+
+    mask = (score >= MIN_SCORE_THRESHOLD) & is_vol_safe & j_turn
+    # 与逐行实现相同的扫描区间：[20, len - max(HOLD_DAYS))
+    if horizon is None: horizon = max(HOLD_DAYS)
+    mask[:20] = False
+    mask[max(len(df) - horizon, 0):] = False
+    return np.flatnonzero(mask)
+
+def forward_returns(df, idx):
+    """对信号行批量计算各持有期收益：前向窗口最低价触及止损则记为止损收益"""
+    close = df['收盘'].to_numpy(dtype=float)
+    low = df['最低'].to_numpy(dtype=float)
+    buy_price = close[idx]
+    out = {}
+    for d in HOLD_DAYS:
+        # windows[k] = low[k+1 : k+1+d]，即第 k 根K线之后 d 天的最低价窗口
+        windows = sliding_window_view(low[1:], d)[idx]
+        with np.errstate(all='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            period_low = np.nanmin(windows, axis=1)
+        hit_stop = (period_low - buy_price) / buy_price <= STOP_LOSS
+        ret = np.round((close[idx + d] - buy_price) / buy_price * 100, 2)
+        out[f'{d}日收益%'] = np.where(hit_stop, STOP_LOSS * 100, ret)
+    return out
+
+def run_single_backtest_vector(file_path):
+    """向量化引擎：指标、信号与前向收益全部以 NumPy 数组一次算完"""
+    try:
+        code = re.search(r'(\d{6})', os.path.basename(file_path)).group(1)
+        df = load_backtest_frame(file_path)
+        if df is None: return fund_outcomes.skip(code, fund_outcomes.no_data_reason(code, MIN_HISTORY), result=[])
+        fund_outcomes.record(code)
+        return frame_trades(code, df)
+    except Exception as e: return fund_outcomes.error(file_path, e, result=[])
+
+def frame_trades(code, df):
+    """已带指标列的行情 -> 逐笔交易明细"""
+    idx = scan_signals(df)
+    if len(idx) == 0: return []
+    dates = df['日期'].to_numpy()[idx]
+    rets = forward_returns(df, idx)
+    trades = []
+    for k in range(len(idx)):
+        res = {'代码': code, '日期': dates[k]}
+        for d in HOLD_DAYS:
+            res[f'{d}日收益%'] = rets[f'{d}日收益%'][k]
+        trades.append(res)
+    return trades
+
+def run_single_backtest_loop(file_path):
+    """逐行参考实现：保留用于与向量化引擎做交易一致性校验"""
     trades = []
     try:
         code = re.search(r'(\d{6})', os.path.basename(file_path)).group(1)
-        df = pd.read_csv(file_path)
-        if len(df) < 300: return []
-        df = calculate_tech(df)
+        df = load_backtest_frame(file_path)
+        if df is None: return fund_outcomes.skip(code, fund_outcomes.no_data_reason(code, MIN_HISTORY), result=[])
         
         for i in range(20, len(df) - max(HOLD_DAYS)):
             row = df.iloc[i]
             prev = df.iloc[i-1]
             
             score = 0
-            if row['RSI'] < 35: score += 30
-            if row['J'] < 5: score += 30
-            if row['BIAS_20'] < -4: score += 40
+            if row['RSI'] < RSI_LIMIT: score += 30
+            if row['J'] < J_LIMIT: score += 30
+            if row['BIAS_20'] < BIAS_LIMIT: score += 40
             
             # 核心改进：取消极致缩量，改为“不放量且不极端缩量”
             is_vol_safe = VOL_LIMIT_LOWER < row['VOL_RATIO'] < VOL_LIMIT_UPPER
@@ -67,34 +185,403 @@ def run_single_backtest(file_path):
                     else:
                         res[f'{d}日收益%'] = round((df.iloc[i+d]['收盘'] - buy_price) / buy_price * 100, 2)
                 trades.append(res)
-    except: pass
+        fund_outcomes.record(code)
+    except Exception as e: return fund_outcomes.error(file_path, e, result=[])
     return trades
 
-def main():
-    files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
-    all_trades = []
+def run_chunk(codes):
+    """工作进程入口：逐只回测一段代码，主进程只下发代码列表；返回 (交易明细, 逐品种处理结果)"""
+    trades = []
+    for res in run_profile.fund_map(run_single_backtest, codes): trades.extend(res)
+    return trades, fund_outcomes.drain()
+
+def summarize(res_df, hold_days=None):
+    """交易明细 -> 各持有期的月均信号/胜率/平均收益汇总表"""
+    summary = []
+    for d in hold_days or HOLD_DAYS:
+        col = f'{d}日收益%'
+        win_rate = (res_df[col] > 0).mean() * 100
+        avg_ret = res_df[col].mean()
+        # 统计时间跨度
+        total_days = (pd.to_datetime(res_df['日期'].max()) - pd.to_datetime(res_df['日期'].min())).days
+        monthly_signals = len(res_df) / (total_days / 30) if total_days > 0 else 0
+        
+        summary.append({
+            '周期': f'{d}天', 
+            '月均信号': round(monthly_signals, 1),
+            '胜率%': round(win_rate, 2), 
+            '平均收益%': round(avg_ret, 2)
+        })
+    return pd.DataFrame(summary)
+
+# ==========================================
+# --- 参数扫描：指标每只基金只算一次，所有参数组合在同一组数组上广播评估 ---
+# ==========================================
+def expand_grid(grid):
+    """{参数: [候选值...]} -> 参数组合列表；未给出的参数沿用模块默认值"""
+    unknown = set(grid) - set(SWEEP_KEYS)
+    if unknown: raise ValueError(f"未知的扫描参数: {sorted(unknown)}")
+    keys = [k for k in SWEEP_KEYS if k in grid]
+    base = {k: globals()[k] for k in SWEEP_KEYS}
+    combos = []
+    for values in itertools.product(*[grid[k] for k in keys]):
+        p = dict(base, **dict(zip(keys, values)))
+        p['HOLD_DAYS'] = [int(d) for d in p['HOLD_DAYS']]
+        combos.append(p)
+    return combos
+
+def _stack(combos, key):
+    return np.array([c[key] for c in combos], dtype=float)[:, None]
+
+def signal_masks(df, combos):
+    """返回 (组合数, K线数) 的布尔矩阵：每行是一组参数下的买点"""
+    rsi = df['RSI'].to_numpy(dtype=float)
+    j = df['J'].to_numpy(dtype=float)
+    bias = df['BIAS_20'].to_numpy(dtype=float)
+    vol_ratio = df['VOL_RATIO'].to_numpy(dtype=float)
+    n = len(df)
+
+    score = (np.where(rsi < _stack(combos, 'RSI_LIMIT'), 30, 0)
+             + np.where(j < _stack(combos, 'J_LIMIT'), 30, 0)
+             + np.where(bias < _stack(combos, 'BIAS_LIMIT'), 40, 0))
+    is_vol_safe = (_stack(combos, 'VOL_LIMIT_LOWER') < vol_ratio) & (vol_ratio < _stack(combos, 'VOL_LIMIT_UPPER'))
+    j_turn = np.zeros(n, dtype=bool)
+    j_turn[1:] = j[1:] > j[:-1]
+
+    pos = np.arange(n)
+    max_hold = np.array([max(c['HOLD_DAYS']) for c in combos])[:, None]
+    in_range = (pos >= 20) & (pos < n - max_hold)
+    return (score >= _stack(combos, 'MIN_SCORE_THRESHOLD')) & is_vol_safe & j_turn & in_range
+
+def forward_table(df, hold_days):
+    """对全部K线计算各持有期的收盘收益与期间最低价跌幅（缺失处为 NaN）"""
+    close = df['收盘'].to_numpy(dtype=float)
+    low = df['最低'].to_numpy(dtype=float)
+    n = len(close)
+    table = {}
+    for d in hold_days:
+        ret = np.full(n, np.nan)
+        drop = np.full(n, np.nan)
+        if n > d:
+            with np.errstate(all='ignore'), warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                ret[:n - d] = np.round((close[d:] - close[:n - d]) / close[:n - d] * 100, 2)
+                period_low = np.nanmin(sliding_window_view(low[1:], d), axis=1)[:n - d]
+                drop[:n - d] = (period_low - close[:n - d]) / close[:n - d]
+        table[d] = (ret, drop)
+    return table
+
+def combo_trades(df, combos, days):
+    """逐个参数组合产出 (组合序号, 信号行号, {持有期序号: 止损后收益数组})，收益只算一次供各组合复用"""
+    masks = signal_masks(df, combos)
+    if not masks.any(): return
+    table = forward_table(df, days)
+    for c, p in enumerate(combos):
+        idx = np.flatnonzero(masks[c])
+        if len(idx) == 0: continue
+        rets = {}
+        for k, d in enumerate(days):
+            if d not in p['HOLD_DAYS']: continue
+            ret, drop = table[d]
+            rets[k] = np.where(drop[idx] <= p['STOP_LOSS'], p['STOP_LOSS'] * 100, ret[idx])
+        yield c, idx, rets
+
+def sweep_days(combos):
+    return sorted({d for c in combos for d in c['HOLD_DAYS']})
+
+def sweep_fund(file_path, combos):
+    """单只基金在全部参数组合下的累计统计：信号数、首末信号日期、各持有期收益和与盈利次数"""
+    try:
+        code = price_store.code_from_path(file_path)
+        df = load_backtest_frame(file_path)
+        if df is None: return fund_outcomes.skip(code, fund_outcomes.no_data_reason(code, MIN_HISTORY), 'sweep')
+        days = sweep_days(combos)
+        dates = pd.to_datetime(df['日期']).to_numpy()
+
+        C = len(combos)
+        stats = {'count': np.zeros(C, dtype=int), 'first': np.full(C, np.datetime64('NaT'), dtype='datetime64[ns]'),
+                 'last': np.full(C, np.datetime64('NaT'), dtype='datetime64[ns]'),
+                 'sum': np.zeros((C, len(days))), 'wins': np.zeros((C, len(days))), 'days': days}
+        for c, idx, rets in combo_trades(df, combos, days):
+            stats['count'][c] = len(idx)
+            stats['first'][c], stats['last'][c] = dates[idx[0]], dates[idx[-1]]
+            for k, r in rets.items():
+                stats['sum'][c, k] = r.sum()
+                stats['wins'][c, k] = (r > 0).sum()
+        fund_outcomes.record(code, stage='sweep')
+        return stats if stats['count'].any() else None
+    except Exception as e: return fund_outcomes.error(file_path, e, 'sweep')
+
+def sweep_task(file_path, combos):
+    """工作进程入口：(单只基金的累计统计, 逐品种处理结果)"""
+    return sweep_fund(file_path, combos), fund_outcomes.drain()
+
+def run_sweep(codes, grid, max_workers=None):
+    """并行扫描全部基金并汇总，返回长表：每个参数组合 × 每个持有期一行"""
+    combos = expand_grid(grid)
+    total = None
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for stats, outcomes in run_profile.results(executor.map(run_profile.task(partial(sweep_task, combos=combos)), codes, chunksize=8)):
+            fund_outcomes.extend(outcomes)
+            if stats is None: continue
+            if total is None:
+                total = stats
+                continue
+            total['count'] = total['count'] + stats['count']
+            total['sum'] += stats['sum']
+            total['wins'] += stats['wins']
+            total['first'] = np.fmin(total['first'], stats['first'])
+            total['last'] = np.fmax(total['last'], stats['last'])
+    if total is None: return pd.DataFrame()
+
+    rows = []
+    for c, p in enumerate(combos):
+        n = int(total['count'][c])
+        span = (total['last'][c] - total['first'][c]).astype('timedelta64[D]').astype(float) if n else 0
+        for k, d in enumerate(total['days']):
+            if d not in p['HOLD_DAYS']: continue
+            row = {'组合': c}
+            row.update({key: (json.dumps(p[key]) if key == 'HOLD_DAYS' else p[key]) for key in SWEEP_KEYS})
+            row.update({
+                '周期': f'{d}天',
+                '信号数': n,
+                '月均信号': round(n / (span / 30), 1) if span > 0 else 0,
+                '胜率%': round(total['wins'][c, k] / n * 100, 2) if n else np.nan,
+                '平均收益%': round(total['sum'][c, k] / n, 2) if n else np.nan,
+            })
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+# ==========================================
+# --- 滚动前推（walk-forward）：训练窗口调参，紧随其后的测试窗口检验 ---
+# 各基金指标只算一次；全部参数组合的信号按月分桶累计，任意窗口的统计都是月桶求和，
+# 因此所有窗口的调参与检验在主进程内一次完成，无需按窗口重跑回测
+# ==========================================
+WF_DEFAULT_GRID = {
+    'MIN_SCORE_THRESHOLD': [60, 75, 90],
+    'RSI_LIMIT': [30, 35, 40],
+    'J_LIMIT': [0, 5, 10],
+    'STOP_LOSS': [-0.05, -0.07, -0.10],
+}
+
+def month_index(dates):
+    """日期 -> 自 1970-01 起的月序号"""
+    return np.asarray(dates, dtype='datetime64[M]').astype(int)
+
+def bucket_chunk(codes, combos, m0, n_months):
+    """工作进程入口：一段基金在全部参数组合下按信号月份分桶的信号数、收益和与盈利次数，以及逐品种处理结果"""
+    days = sweep_days(combos)
+    C, K = len(combos), len(days)
+    count = np.zeros((C, n_months))
+    sums, wins = np.zeros((C, K, n_months)), np.zeros((C, K, n_months))
+    for code in codes:
+        try:
+            df = load_backtest_frame(code)
+            if df is None:
+                fund_outcomes.skip(code, fund_outcomes.no_data_reason(code, MIN_HISTORY), 'walk_forward')
+                continue
+            months = month_index(df['日期'].to_numpy().astype('datetime64[D]')) - m0
+            for c, idx, rets in combo_trades(df, combos, days):
+                mi = months[idx]
+                count[c] += np.bincount(mi, minlength=n_months)
+                for k, r in rets.items():
+                    sums[c, k] += np.bincount(mi, weights=r, minlength=n_months)
+                    wins[c, k] += np.bincount(mi, weights=(r > 0), minlength=n_months)
+            fund_outcomes.record(code, stage='walk_forward')
+        except Exception as e: fund_outcomes.error(code, e, 'walk_forward')
+    return count, sums, wins, fund_outcomes.drain()
+
+def walk_windows(n_months, train, test, gap):
+    """[(训练起, 训练止, 测试起, 测试止)]，均为月桶下标、左闭右开；训练与测试之间空出 gap 个月，
+    避免训练期末尾信号的持有期与测试期重叠"""
+    windows = []
+    start = train + gap
+    while start < n_months:
+        windows.append((start - gap - train, start - gap, start, min(start + test, n_months)))
+        start += test
+    return windows
+
+def run_walk_forward(codes, grid, train=36, test=12, gap=3, target_days=20, min_trades=30):
+    combos = expand_grid(grid)
+    days = sweep_days(combos)
+    if target_days not in days: raise ValueError(f"目标持有期 {target_days} 不在扫描的 HOLD_DAYS 中")
+    kt = days.index(target_days)
+    dates = price_store.open_matrix()['dates']
+    m0 = int(month_index(dates[:1])[0])
+    n_months = int(month_index(dates[-1:])[0]) - m0 + 1
+
+    count = np.zeros((len(combos), n_months))
+    sums, wins = np.zeros((len(combos), len(days), n_months)), np.zeros((len(combos), len(days), n_months))
+    worker = partial(bucket_chunk, combos=combos, m0=m0, n_months=n_months)
     with ProcessPoolExecutor() as executor:
-        for result in executor.map(run_single_backtest, files):
-            all_trades.extend(result)
-            
-    if all_trades:
-        res_df = pd.DataFrame(all_trades).sort_values('日期')
-        summary = []
-        for d in HOLD_DAYS:
-            col = f'{d}日收益%'
-            win_rate = (res_df[col] > 0).mean() * 100
-            avg_ret = res_df[col].mean()
-            # 统计时间跨度
-            total_days = (pd.to_datetime(res_df['日期'].max()) - pd.to_datetime(res_df['日期'].min())).days
-            monthly_signals = len(res_df) / (total_days / 30) if total_days > 0 else 0
-            
-            summary.append({
-                '周期': f'{d}天', 
-                '月均信号': round(monthly_signals, 1),
-                '胜率%': round(win_rate, 2), 
-                '平均收益%': round(avg_ret, 2)
+        chunks = executor.map(run_profile.task(worker), price_store.chunk_codes(codes, (os.cpu_count() or 1) * 4))
+        for cnt, sm, wn, outcomes in run_profile.results(chunks):
+            fund_outcomes.extend(outcomes)
+            count += cnt
+            sums += sm
+            wins += wn
+
+    base = {k: globals()[k] for k in SWEEP_KEYS}
+    default = next((c for c, p in enumerate(combos) if p == dict(base, HOLD_DAYS=p['HOLD_DAYS'])), None)
+    swept = [k for k in SWEEP_KEYS if k in grid]
+    month_str = lambda m: str(np.datetime64(int(m0 + m), 'M'))
+    rows = []
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for a, b, c0, c1 in walk_windows(n_months, train, test, gap):
+            n_train = count[:, a:b].sum(axis=1)
+            avg_train = sums[:, kt, a:b].sum(axis=1) / n_train
+            eligible = (n_train >= min_trades) & np.array([target_days in p['HOLD_DAYS'] for p in combos])
+            if not eligible.any(): continue
+            best = int(np.argmax(np.where(eligible, avg_train, -np.inf)))
+            n_test = count[best, c0:c1].sum()
+            row = {'训练区间': f'{month_str(a)}~{month_str(b - 1)}', '测试区间': f'{month_str(c0)}~{month_str(c1 - 1)}'}
+            row.update({k: combos[best][k] for k in swept})
+            row.update({
+                '训练信号': int(n_train[best]),
+                '训练平均收益%': round(avg_train[best], 2),
+                '测试信号': int(n_test),
+                '测试月均信号': round(n_test / (c1 - c0), 1),
+                '测试胜率%': round(wins[best, kt, c0:c1].sum() / n_test * 100, 2) if n_test else np.nan,
+                '测试平均收益%': round(sums[best, kt, c0:c1].sum() / n_test, 2) if n_test else np.nan,
             })
-        print(pd.DataFrame(summary).to_string(index=False))
+            if default is not None:
+                n_def = count[default, c0:c1].sum()
+                row['默认参数测试收益%'] = round(sums[default, kt, c0:c1].sum() / n_def, 2) if n_def else np.nan
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+def load_grid(spec):
+    """--sweep 参数既可以是 JSON 文件路径，也可以是 JSON 字符串"""
+    if os.path.exists(spec):
+        with open(spec, encoding='utf-8') as f: return json.load(f)
+    return json.loads(spec)
+
+def check_parity(files):
+    """逐文件对比向量化引擎与逐行参考实现的交易明细，返回不一致的文件列表"""
+    mismatched = []
+    for f in files:
+        vec = pd.DataFrame(run_single_backtest_vector(f))
+        ref = pd.DataFrame(run_single_backtest_loop(f))
+        if vec.empty and ref.empty: continue
+        try:
+            pd.testing.assert_frame_equal(vec, ref, check_dtype=False)
+        except AssertionError:
+            mismatched.append(f)
+    return mismatched
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='中线抄底策略并行回测')
+    parser.add_argument('--check-parity', action='store_true', help='校验向量化引擎与逐行实现的交易是否一致')
+    parser.add_argument('--limit', type=int, default=0, help='仅处理前 N 个文件（调试用）')
+    parser.add_argument('--sweep', metavar='GRID', help='参数扫描：JSON 文件路径或字符串，如 {"STOP_LOSS": [-0.05, -0.07]}')
+    parser.add_argument('--sweep-out', default='backtest_sweep.csv', help='参数扫描结果输出路径')
+    parser.add_argument('--walk-forward', action='store_true', help='滚动前推：训练窗口调参、测试窗口检验（参数网格取 --sweep，缺省用内置网格）')
+    parser.add_argument('--train-months', type=int, default=36, help='训练窗口月数')
+    parser.add_argument('--test-months', type=int, default=12, help='测试窗口月数（也是窗口滚动步长）')
+    parser.add_argument('--gap-months', type=int, default=3, help='训练与测试之间空出的月数')
+    parser.add_argument('--target-days', type=int, default=20, help='调参目标：该持有期的平均收益')
+    parser.add_argument('--min-trades', type=int, default=30, help='训练窗口内信号数不足该值的参数组合不参与选择')
+    parser.add_argument('--wf-out', default='backtest_walkforward.csv', help='滚动前推结果输出路径')
+    parser.add_argument('--profile', action='store_true', help='开启运行剖析（等同 RUN_PROFILE=1），结果追加到运行日志')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.profile: run_profile.enable()
+    files = sorted(glob.glob(os.path.join(DATA_DIR, "*.csv")))
+    if args.limit: files = files[:args.limit]
+    with run_profile.stage('build_store'):
+        price_store.build_store(DATA_DIR)
+    # 先按品种清单剔除历史不足的基金，再派发任务
+    with run_profile.stage('select'):
+        codes = universe_manifest.select(min_rows=MIN_HISTORY, data_dir=DATA_DIR)
+    if args.limit: codes = codes[:args.limit]
+
+    if args.check_parity:
+        mismatched = check_parity(files)
+        print(f"一致性校验: {len(files) - len(mismatched)}/{len(files)} 个文件交易完全一致")
+        for f in mismatched: print(f"  ❌ {f}")
+        sys.exit(1 if mismatched else 0)
+
+    if args.walk_forward:
+        with run_profile.stage('walk_forward'):
+            wf = run_walk_forward(codes, load_grid(args.sweep) if args.sweep else WF_DEFAULT_GRID,
+                                  train=args.train_months, test=args.test_months, gap=args.gap_months,
+                                  target_days=args.target_days, min_trades=args.min_trades)
+        fund_outcomes.summarize('backtest_engine')
+        if wf.empty:
+            print("滚动前推无可用窗口")
+            return
+        wf.to_csv(args.wf_out, index=False, encoding='utf-8-sig')
+        print(f"滚动前推完成：{len(wf)} 个测试窗口，结果已写入 {args.wf_out}")
+        print(wf.to_string(index=False))
+        indicator_cache.prune_cache()
+        run_profile.finish('backtest_engine', funds=len(codes), mode='walk_forward')
+        return
+
+    if args.sweep:
+        with run_profile.stage('sweep'):
+            sweep_df = run_sweep(codes, load_grid(args.sweep))
+        fund_outcomes.summarize('backtest_engine')
+        if sweep_df.empty:
+            print("参数扫描无任何信号")
+            return
+        sweep_df.to_csv(args.sweep_out, index=False, encoding='utf-8-sig')
+        n_combo = sweep_df['组合'].nunique()
+        print(f"参数扫描完成：{n_combo} 组参数，结果已写入 {args.sweep_out}")
+        print(sweep_df.sort_values('平均收益%', ascending=False).head(20).to_string(index=False))
+        indicator_cache.prune_cache()
+        run_profile.finish('backtest_engine', funds=len(codes), mode='sweep')
+        return
+
+    all_trades, spool = [], None
+    with run_profile.stage('backtest'):
+        if memory_budget.ENABLED:
+            spool, _ = memory_budget.run_chunks(run_chunk, memory_budget.code_chunks(codes), 'backtest_engine')
+            all_trades = spool
+        else:
+            with ProcessPoolExecutor() as executor:
+                chunks = executor.map(run_profile.task(run_chunk), price_store.chunk_codes(codes, (os.cpu_count() or 1) * 4))
+                for trades, outcomes in run_profile.results(chunks):
+                    all_trades.extend(trades)
+                    fund_outcomes.extend(outcomes)
+
+    n_trades = publish(all_trades)
+    if spool: spool.close()
+    fund_outcomes.summarize('backtest_engine')
+    indicator_cache.prune_cache()
+    run_profile.finish('backtest_engine', funds=len(codes), mode=BACKTEST_ENGINE, trades=n_trades)
+
+def publish(all_trades):
+    """打印各持有期汇总表，返回交易笔数；all_trades 可为列表或逐条产出的可迭代对象"""
+    with run_profile.stage('summarize'):
+        res_df = pd.DataFrame(list(all_trades))
+        if res_df.empty: return 0
+        table = summarize(res_df.sort_values('日期'))
+    print(table.to_string(index=False))
+    return len(res_df)
+
+class BacktestStrategy(engine_core.Strategy):
+    """统一引擎内核中的 backtest_engine（向量化引擎）：指标取自共享注册表，交易与单独运行相同"""
+    name, min_bars = 'backtest_engine', MIN_HISTORY
+
+    def universe(self):
+        return universe_manifest.select(min_rows=MIN_HISTORY, data_dir=DATA_DIR)
+
+    def scan(self, code, ctx):
+        df = ctx.df.copy()
+        df['RSI'] = ctx.get('rsi_sma', 14)
+        df['K'], df['D'], df['J'] = ctx.get('kdj', 9, 2)
+        df['MA20'], df['BIAS_20'] = ctx.get('ma', 20), ctx.get('bias', 20)
+        df['V_MA5'], df['VOL_RATIO'] = ctx.get('vol_ma_prev', 5), ctx.get('vol_ratio', 5)
+        df['日期'] = df['日期'].dt.strftime('%Y-%m-%d')
+        fund_outcomes.record(code, stage=self.name)
+        return frame_trades(code, df)
+
+    def publish(self, results):
+        publish([t for trades in results for t in trades])
+
+STRATEGY = BacktestStrategy()
 
 if __name__ == "__main__":
-    main()
+    run_profile.run(main, 'backtest_engine')
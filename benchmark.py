@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import platform
+import resource
+import subprocess
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# 基准测试：在合成的 fund_data 上测量扫描与回测热路径的耗时和内存，结果存 JSON 便于跨提交对比
+# 1. [合成行情]：按指定规模（如 100 / 1500 / 10000 只 × N 年）生成与真实数据同列名的 CSV，不依赖 akshare，可离线运行
+# 2. [分阶段计时]：每个阶段在独立子进程中运行，记录端到端耗时与逐基金耗时分布（均值/P50/P95/最大）
+# 3. [峰值内存]：子进程结束前读取 ru_maxrss，各阶段互不干扰
+# 4. [回归对比]：--compare 指定基线 JSON，耗时或峰值内存超出阈值的阶段标记为回归，退出码非 0
+# ==============================================================================
+
+BENCH_DIR = '.bench'             # 合成行情缓存，同规模同种子重复使用
+RESULT_DIR = 'benchmarks'        # 基准结果 JSON
+END_DATE = '2026-01-16'          # 合成行情的最后交易日，固定以保证结果可复现
+STAGES = ['build_store', 'analyze_fund', 'process_file', 'run_single_backtest', 'update_tracker', 'get_performance_stats']
+CSV_COLS = ['日期', '开盘', '收盘', '最高', '最低', '成交量', '成交额', '振幅', '涨跌幅', '涨跌额', '换手率']
+
+# ==========================================
+# --- 1. 合成行情 ---
+# ==========================================
+def synth_fund(rng, dates):
+    """单只基金的日线：带波动率切换的几何布朗运动，保证有足够的回撤与超卖信号"""
+    n = len(dates)
+    vol = np.where(rng.random(n) < 0.1, 0.03, 0.012)
+    ret = rng.normal(0.0002, 1, n) * vol
+    close = np.round(rng.uniform(0.5, 5) * np.exp(np.cumsum(ret)), 3)
+    prev = np.concatenate([[close[0]], close[:-1]])
+    open_ = np.round(prev * (1 + rng.normal(0, 0.003, n)), 3)
+    high = np.round(np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.006, n))), 3)
+    low = np.round(np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.006, n))), 3)
+    volume = np.round(rng.lognormal(np.log(rng.uniform(1e6, 5e7)), 0.5, n))
+    return pd.DataFrame({
+        '日期': dates.strftime('%Y-%m-%d'), '开盘': open_, '收盘': close, '最高': high, '最低': low,
+        '成交量': volume.astype('int64'), '成交额': np.round(volume * close, 1),
+        '振幅': np.round((high - low) / prev * 100, 2), '涨跌幅': np.round((close - prev) / prev * 100, 2),
+        '涨跌额': np.round(close - prev, 3), '换手率': np.round(rng.uniform(0.1, 5, n), 2),
+    }, columns=CSV_COLS)
+
+def make_universe(n_funds, years, seed=0, bench_dir=BENCH_DIR):
+    """生成（或复用）合成行情目录，返回工作根目录；上市日期随机错开，约四分之一的品种历史不足一年"""
+    root = os.path.abspath(os.path.join(bench_dir, f'u{n_funds}_y{years:g}_s{seed}'))
+    done = os.path.join(root, '.complete')
+    if os.path.exists(done): return root
+    shutil.rmtree(root, ignore_errors=True)
+    data_dir = os.path.join(root, 'fund_data')
+    os.makedirs(data_dir)
+    rng = np.random.default_rng(seed)
+    all_dates = pd.bdate_range(end=END_DATE, periods=int(years * 244))
+    for i in range(n_funds):
+        start = 0 if rng.random() < 0.5 else int(rng.integers(0, len(all_dates) - 30))
+        synth_fund(rng, all_dates[start:]).to_csv(os.path.join(data_dir, f'{900000 + i}.csv'), index=False, encoding='utf-8-sig')
+    open(done, 'w').close()
+    return root
+
+def make_tracker(codes, per_fund=10, seed=0):
+    """合成胜率账本：每只基金若干历史入场记录，价格取入场日收盘"""
+    import price_store
+    rng = np.random.default_rng(seed)
+    rows = []
+    for code in codes:
+        series = price_store.matrix_series(code)
+        if series is None or len(series[0]) < 2: continue
+        dates, close = series
+        for j in rng.integers(0, len(dates), per_fund):
+            rows.append([code, code, str(dates[j]), round(float(close[j]), 3), np.nan, np.nan, np.nan, np.nan, '持有中'])
+    cols = ['代码', '简称', '入场日期', '买入价', 'T+7收益%', 'T+14收益%', 'T+20收益%', 'T+60收益%', '状态']
+    return pd.DataFrame(rows, columns=cols)
+
+def make_snapshots(codes, n_snapshots=60, per_snapshot=30, seed=0):
+    """合成 YYYY/MM/sig_*.csv 信号快照，供 get_performance_stats 归档与统计"""
+    import price_store
+    rng = np.random.default_rng(seed)
+    dates = price_store.open_matrix()['dates']
+    dates = dates[dates >= np.datetime64('2020-01-01')][:-1]  # 归档只收录 202*/ 目录下的快照
+    for day in np.sort(rng.choice(len(dates), min(n_snapshots, len(dates)), replace=False)):
+        d = pd.Timestamp(dates[day])
+        picked = rng.choice(codes, min(per_snapshot, len(codes)), replace=False)
+        rows = []
+        for code in picked:
+            series = price_store.matrix_series(code)
+            if series is None: continue
+            k = np.searchsorted(series[0], np.datetime64(d.date()))
+            if k >= len(series[0]): continue
+            rows.append({'date': str(series[0][k]), 'fund_code': code, '评分': int(rng.integers(1, 4)),
+                         'price': round(float(series[1][k]), 3)})
+        out = os.path.join(d.strftime('%Y'), d.strftime('%m'))
+        os.makedirs(out, exist_ok=True)
+        pd.DataFrame(rows).to_csv(os.path.join(out, f"sig_{d.strftime('%Y%m%d')}.csv"), index=False)
+
+# ==========================================
+# --- 2. 阶段计时（在子进程中执行，工作目录为合成行情根目录） ---
+# ==========================================
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def per_fund(func, codes):
+    """逐基金调用并记录单次耗时（毫秒），返回 (结果列表, 耗时分布)"""
+    results, cost = [], []
+    for code in codes:
+        t0 = time.perf_counter()
+        results.append(func(code))
+        cost.append((time.perf_counter() - t0) * 1000)
+    cost = np.array(cost)
+    dist = {'funds': len(codes), 'mean_ms': round(cost.mean(), 3), 'p50_ms': round(np.percentile(cost, 50), 3),
+            'p95_ms': round(np.percentile(cost, 95), 3), 'max_ms': round(cost.max(), 3)} if len(cost) else {'funds': 0}
+    return results, dist
+
+def run_stage(stage, warm=False):
+    """执行单个阶段并返回计时字典；warm=True 时先不计时跑一遍，测量指标缓存命中后的耗时"""
+    import price_store
+    t_import = time.perf_counter()
+    import backtest_engine, etf_grid_hunter, strategy_engine
+    out = {'import_s': round(time.perf_counter() - t_import, 3)}
+
+    if stage == 'build_store':
+        shutil.rmtree(price_store.STORE_DIR, ignore_errors=True)
+        t0 = time.perf_counter()
+        price_store.build_store(verbose=False)
+        out['total_s'] = round(time.perf_counter() - t0, 3)
+        out['funds'] = len(price_store.list_codes())
+        out['peak_rss_mb'] = peak_rss_mb()
+        return out
+
+    price_store.build_store(verbose=False)
+    codes = price_store.list_codes()
+    out['rss_before_mb'] = peak_rss_mb()
+    funcs = {'analyze_fund': etf_grid_hunter.analyze_fund, 'process_file': strategy_engine.process_file,
+             'run_single_backtest': backtest_engine.run_single_backtest}
+    if stage in funcs:
+        if warm: per_fund(funcs[stage], codes)
+        t0 = time.perf_counter()
+        results, dist = per_fund(funcs[stage], codes)
+        out['total_s'] = round(time.perf_counter() - t0, 3)
+        out.update(dist)
+        out['results'] = sum(r is not None for r in results)
+    elif stage == 'update_tracker':
+        analyses = [a for a in map(etf_grid_hunter.analyze_fund, codes) if a is not None]
+        make_tracker(codes).to_csv(etf_grid_hunter.TRACKER_FILE, index=False, encoding='utf-8-sig')
+        name_map = {c: c for c in codes}
+        t0 = time.perf_counter()
+        tracker = etf_grid_hunter.update_tracker(analyses, etf_grid_hunter.HistoryMap(), name_map)
+        out['total_s'] = round(time.perf_counter() - t0, 3)
+        out['rows'] = len(tracker)
+    elif stage == 'get_performance_stats':
+        shutil.rmtree(strategy_engine.signal_archive.ARCHIVE_DIR, ignore_errors=True)
+        for d in glob.glob('202*'): shutil.rmtree(d, ignore_errors=True)
+        cache = os.path.join(strategy_engine.si.STATE_DIR, strategy_engine.PERF_CACHE_FILE)
+        if os.path.exists(cache): os.remove(cache)
+        make_snapshots(codes)
+        t0 = time.perf_counter()
+        perf = strategy_engine.get_performance_stats()
+        out['total_s'] = round(time.perf_counter() - t0, 3)
+        t0 = time.perf_counter()
+        strategy_engine.get_performance_stats()
+        out['warm_s'] = round(time.perf_counter() - t0, 3)
+        out['rows'] = len(perf)
+    else:
+        raise ValueError(f"未知阶段: {stage}")
+    out['peak_rss_mb'] = peak_rss_mb()
+    return out
+
+def spawn_stage(stage, root, warm=False, cache=False):
+    """在合成行情根目录下起子进程执行单个阶段，子进程最后一行输出为结果 JSON"""
+    env = dict(os.environ, INDICATOR_CACHE='1' if (cache or warm) else '0')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)), env.get('PYTHONPATH')]))
+    cmd = [sys.executable, os.path.abspath(__file__), '--stage', stage] + (['--warm'] if warm else [])
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=root, env=env, capture_output=True, text=True)
+    wall = round(time.perf_counter() - t0, 3)
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f'exit {proc.returncode}', 'wall_s': wall}
+    res = json.loads(proc.stdout.strip().splitlines()[-1])
+    res['wall_s'] = wall
+    return res
+
+# ==========================================
+# --- 3. 结果存档与回归对比 ---
+# ==========================================
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return ''
+
+def compare(current, baseline, threshold=0.2, min_delta=0.05):
+    """逐阶段对比 total_s 与 peak_rss_mb，返回 (对比表, 是否存在回归)；耗时增加不足 min_delta 秒视为噪声"""
+    rows, regressed = [], False
+    for size, stages in current['runs'].items():
+        for stage, cur in stages.items():
+            base = baseline.get('runs', {}).get(size, {}).get(stage)
+            if not base or 'error' in cur or 'error' in base: continue
+            for metric in ('total_s', 'peak_rss_mb'):
+                if not base.get(metric) or metric not in cur: continue
+                ratio = cur[metric] / base[metric]
+                flag = ratio > 1 + threshold and (metric != 'total_s' or cur[metric] - base[metric] >= min_delta)
+                regressed |= flag
+                rows.append({'规模': size, '阶段': stage, '指标': metric, '基线': base[metric], '当前': cur[metric],
+                             '比值': round(ratio, 2), '回归': '⚠️' if flag else ''})
+    return pd.DataFrame(rows), regressed
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='扫描与回测热路径基准测试（合成行情，离线运行）')
+    parser.add_argument('--funds', type=int, nargs='+', default=[100], help='合成品种数，可给多个规模，如 100 1500 10000')
+    parser.add_argument('--years', type=float, default=10, help='每只基金最长的历史年数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--warm', action='store_true', help='逐基金阶段先预热指标缓存，测量缓存命中后的耗时')
+    parser.add_argument('--out', help=f'结果 JSON 路径（默认 {RESULT_DIR}/<时间>_<提交>.json）')
+    parser.add_argument('--compare', help='基线结果 JSON，超出阈值的阶段视为回归')
+    parser.add_argument('--threshold', type=float, default=0.2, help='回归阈值（相对基线的增幅）')
+    parser.add_argument('--min-delta', type=float, default=0.05, help='耗时增加不足该秒数时不计为回归')
+    parser.add_argument('--stage', help=argparse.SUPPRESS)  # 子进程内部使用
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.stage:
+        print(json.dumps(run_stage(args.stage, warm=args.warm)))
+        return 0
+
+    commit = git_commit()
+    result = {'meta': {'commit': commit, 'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                       'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                       'platform': platform.platform(), 'cpus': os.cpu_count(), 'years': args.years,
+                       'seed': args.seed, 'warm': args.warm}, 'runs': {}}
+    for n in args.funds:
+        size = f'{n}x{args.years:g}y'
+        t0 = time.perf_counter()
+        root = make_universe(n, args.years, args.seed)
+        print(f"🧪 合成行情 {size}: {root} ({time.perf_counter() - t0:.1f}s)")
+        runs = result['runs'][size] = {}
+        for stage in args.stages:
+            runs[stage] = r = spawn_stage(stage, root, warm=args.warm)
+            if 'error' in r: print(f"   ❌ {stage:<22} {r['error']}")
+            else: print(f"   ⏱️ {stage:<22} {r['total_s']:>8.3f}s | 峰值内存 {r['peak_rss_mb']:>7.1f}MB"
+                        + (f" | 单只 P50 {r['p50_ms']:.2f}ms P95 {r['p95_ms']:.2f}ms" if 'p50_ms' in r else ''))
+
+    out = args.out or os.path.join(RESULT_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f: json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"💾 基准结果已写入: {out}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f: baseline = json.load(f)
+        table, regressed = compare(result, baseline, args.threshold, args.min_delta)
+        if not table.empty: print(table.to_string(index=False))
+        if regressed:
+            print(f"⚠️ 存在超过 {args.threshold:.0%} 的回归")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,49 +1,132 @@
 import pandas as pd
+import numpy as np
 import akshare as ak
 import os
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import argparse
+from fetch_scheduler import run_with_failure_queue, print_report
+from universe_manifest import read_tail, update_manifest
 
 # 创建存储目录
 SAVE_DIR = "fund_data"
 if not os.path.exists(SAVE_DIR):
     os.makedirs(SAVE_DIR)
 
-def download_fund_data(fund_code):
-    """下载单个基金的历史行情并保存为CSV"""
+# 增量模式：只补齐本地最后日期之后的行情，并回溯若干根K线比对是否发生除权/前复权重算
+OVERLAP_ROWS = 5          # 与本地尾部重叠比对的K线数
+PRICE_COLS = ['开盘', '收盘', '最高', '最低']
+PRICE_TOL = 1e-4          # CSV 保留3位小数，超过该误差即视为历史价格已被重算
+
+# 同一文件的写入串行化：调度器超时后旧线程可能仍在写，新的尝试须等它写完再重读尾部
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+def file_lock(file_path):
+    with _file_locks_guard:
+        return _file_locks.setdefault(os.path.abspath(file_path), threading.Lock())
+
+def temp_path(file_path):
+    """每个线程各用一个临时文件，并发的尝试不会互相覆盖"""
+    return f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def overlap_matches(local_tail, remote_df):
+    """比较重叠区间的价格；远端缺少本地日期或价格不一致都判定为历史已重算"""
+    local = local_tail.assign(日期=pd.to_datetime(local_tail['日期']))
+    remote = remote_df.assign(日期=pd.to_datetime(remote_df['日期']))
+    merged = local.merge(remote, on='日期', how='left', suffixes=('', '_new'))
+    for col in PRICE_COLS:
+        if col not in local.columns or f'{col}_new' not in merged.columns: continue
+        new_vals = merged[f'{col}_new'].to_numpy(dtype=float)
+        if np.isnan(new_vals).any(): return False
+        if not np.allclose(merged[col].to_numpy(dtype=float), new_vals, rtol=0, atol=PRICE_TOL): return False
+    return True
+
+def append_rows(file_path, columns, new_rows):
+    """原文件字节 + 新行写入临时文件后原子替换，中途失败不会留下半截CSV"""
+    body = new_rows.reindex(columns=columns).to_csv(index=False, header=False)
+    tmp_path = temp_path(file_path)
+    with open(file_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        old = src.read()
+        dst.write(old)
+        if old and not old.endswith(b'\n'): dst.write(b'\n')
+        dst.write(body.encode('utf-8'))
+    os.replace(tmp_path, file_path)
+
+def save_full(file_path, df):
+    tmp_path = temp_path(file_path)
+    df.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+    with file_lock(file_path): os.replace(tmp_path, file_path)
+
+def update_incremental(fund_code, file_path):
+    """增量补齐；返回结果描述，需要全量重下时返回 None"""
+    tail = read_tail(file_path, OVERLAP_ROWS)
+    if tail.empty or '日期' not in tail.columns: return None
+    start = pd.to_datetime(tail['日期'].iloc[0]).strftime('%Y%m%d')
+    last_dt = pd.to_datetime(tail['日期'].iloc[-1])
+
+    df = ak.fund_etf_hist_em(symbol=fund_code, period="daily", start_date=start, end_date="20500101", adjust="qfq")
+    if df.empty: return f"{fund_code} 暂无新数据"
+    if not overlap_matches(tail, df):
+        print(f"{fund_code} 检测到除权/复权调整，转为全量下载")
+        return None
+
+    with file_lock(file_path):
+        # 加锁后重读最后日期：期间已有其他尝试追加过的行不会再写一遍
+        last_dt = max(last_dt, pd.to_datetime(read_tail(file_path, 1)['日期'].iloc[-1]))
+        fresh = df[pd.to_datetime(df['日期']) > last_dt]
+        if fresh.empty: return f"{fund_code} 已是最新"
+        append_rows(file_path, list(tail.columns), fresh)
+    return f"{fund_code} 增量更新 {len(fresh)} 行"
+
+def fetch_fund_data(fund_code, incremental=True):
+    """下载单个基金的历史行情并保存为CSV；失败直接抛出异常，交由调度器重试"""
+    fund_code = str(fund_code).strip().zfill(6)
+    file_path = os.path.join(SAVE_DIR, f"{fund_code}.csv")
+    if incremental and os.path.exists(file_path):
+        res = update_incremental(fund_code, file_path)
+        if res is not None: return res
+
+    # 使用东方财富接口获取历史行情
+    # 默认获取所有历史数据，包含日期、开盘、收盘、最高、最低等 [cite: 3541, 3543, 3544]
+    df = ak.fund_etf_hist_em(symbol=fund_code, period="daily", adjust="qfq")
+    if df.empty: raise ValueError("数据为空")
+    save_full(file_path, df)
+    return f"{fund_code} 下载成功"
+
+def download_fund_data(fund_code, incremental=True):
+    """单只下载（不重试），保留旧的返回字符串格式"""
     try:
-        fund_code = str(fund_code).strip().zfill(6)
-        print(f"正在下载: {fund_code}")
-        
-        # 使用东方财富接口获取历史行情 
-        # 默认获取所有历史数据，包含日期、开盘、收盘、最高、最低等 [cite: 3541, 3543, 3544]
-        df = ak.fund_etf_hist_em(symbol=fund_code, period="daily", adjust="qfq")
-        
-        if not df.empty:
-            file_path = os.path.join(SAVE_DIR, f"{fund_code}.csv")
-            df.to_csv(file_path, index=False, encoding='utf-8-sig')
-            return f"{fund_code} 下载成功"
-        else:
-            return f"{fund_code} 数据为空"
+        return fetch_fund_data(fund_code, incremental)
     except Exception as e:
-        return f"{fund_code} 下载失败: {str(e)}"
+        return f"{str(fund_code).strip().zfill(6)} 下载失败: {str(e)}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='下载 ETF 日线行情')
+    parser.add_argument('--full', action='store_true', help='忽略本地数据，全量重新下载')
+    parser.add_argument('--concurrency', type=int, default=10, help='并发请求数')
+    parser.add_argument('--rate', type=float, default=5.0, help='每秒最多发起的请求数，<=0 不限流')
+    parser.add_argument('--retries', type=int, default=3, help='单个代码失败后的最大重试次数')
+    args = parser.parse_args(argv)
 
-def main():
-    # 读取 etf.txt 中的基金代码 
+    # 读取 etf.txt 中的基金代码
     if not os.path.exists("etf.txt"):
         print("未找到 etf.txt 文件")
         return
 
-    # 假设 etf.txt 第一行为 'code'，后续为代码 
+    # 假设 etf.txt 第一行为 'code'，后续为代码
     codes_df = pd.read_csv("etf.txt")
-    fund_codes = codes_df['code'].unique().tolist()
+    fund_codes = [str(c).strip().zfill(6) for c in codes_df['code'].unique()]
+
+    # 限流 + 重试的并行下载，失败代码进入失败队列下轮优先重试
+    mode = "全量" if args.full else "增量"
+    print(f"开始并行{mode}下载 {len(fund_codes)} 只基金数据...")
+    report = run_with_failure_queue(lambda c: fetch_fund_data(c, incremental=not args.full), fund_codes,
+                                    concurrency=args.concurrency, rate=args.rate, max_retries=args.retries)
+    print_report(report)
 
-    # 使用线程池并行下载
-    print(f"开始并行下载 {len(fund_codes)} 只基金数据...")
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        results = list(executor.map(download_fund_data, fund_codes))
-    
-    for res in results:
-        print(res)
+    # 刷新品种清单（行数、首末日期、近期成交额），供各引擎派发前预筛选
+    ok_codes = report.loc[report['状态'] == '成功', '代码']
+    update_manifest([os.path.join(SAVE_DIR, f"{c}.csv") for c in ok_codes if os.path.exists(os.path.join(SAVE_DIR, f"{c}.csv"))])
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,243 @@
+import argparse
+import importlib
+from collections import Counter
+from multiprocessing import Pool, cpu_count
+import numpy as np
+import pandas as pd
+import price_store
+import indicator_cache
+import run_profile
+import fund_outcomes
+import memory_budget
+
+# ==============================================================================
+# 统一引擎内核：一次遍历全市场，同一份行情同时喂给所有已注册的策略
+# 1. [加载]：每只基金只从列式仓库读取一次，包成 FundContext 供各策略共享
+# 2. [指标注册表]：指标按 (名称, 参数) 登记，FundContext.get 首次访问时计算并记住；
+#    多个策略都要 MA20、同一组滚动涨跌均值或 Wilder RSI 时只算一次
+# 3. [策略接口]：Strategy.universe() 在主进程选股，scan() 在工作进程逐只产出结果，publish() 写出该策略原有的输出
+# 4. [插件]：PLUGINS 中的每个模块提供一个 STRATEGY 对象；python engine_core.py 一次跑完全部策略
+# ==============================================================================
+
+PLUGINS = ['etf_grid_hunter', 'strategy_engine', 'backtest_engine']
+
+INDICATORS = {}
+STATS = Counter()   # 当前进程内的指标 计算/复用 次数
+
+def indicator(name):
+    """登记一个指标：func(ctx, *参数) -> 与行情等长的数组（或数组元组）"""
+    def wrap(func):
+        INDICATORS[name] = func
+        return func
+    return wrap
+
+class FundContext:
+    """单只基金的共享数据：行情 DataFrame 与按 (名称, 参数) 去重的指标"""
+    def __init__(self, code, df):
+        self.code, self.df = code, df
+        self.memo = {}
+
+    def get(self, name, *params):
+        key = (name,) + params
+        if key in self.memo:
+            STATS['复用'] += 1
+            return self.memo[key]
+        STATS['计算'] += 1
+        value = self.memo[key] = INDICATORS[name](self, *params)
+        return value
+
+# ------------------------------------------------------------------------------
+# 指标：表达式与各引擎 compute_* 的全量计算逐项一致，保证统一遍历与单独运行的结果逐位相同
+# ------------------------------------------------------------------------------
+def _rolling(values, window):
+    return pd.Series(values).rolling(window=window)
+
+@indicator('close')
+def _close(ctx):
+    return ctx.df['收盘'].to_numpy(dtype=float)
+
+@indicator('delta')
+def _delta(ctx):
+    return pd.Series(ctx.get('close')).diff().to_numpy()
+
+@indicator('up')
+def _up(ctx):
+    delta = ctx.get('delta')
+    return np.where(delta > 0, delta, 0.0)
+
+@indicator('down')
+def _down(ctx):
+    delta = ctx.get('delta')
+    return -np.where(delta < 0, delta, 0.0)
+
+@indicator('avg_up_sma')
+def _avg_up_sma(ctx, period):
+    return _rolling(ctx.get('up'), period).mean().to_numpy()
+
+@indicator('avg_down_sma')
+def _avg_down_sma(ctx, period):
+    return _rolling(ctx.get('down'), period).mean().to_numpy()
+
+@indicator('avg_up_wilder')
+def _avg_up_wilder(ctx, period):
+    return indicator_cache.ewm_mean(ctx.get('up'), alpha=1/period)[0]
+
+@indicator('avg_down_wilder')
+def _avg_down_wilder(ctx, period):
+    return indicator_cache.ewm_mean(ctx.get('down'), alpha=1/period)[0]
+
+@indicator('rsi_wilder')
+def _rsi_wilder(ctx, period):
+    """etf_grid_hunter：Wilder 平滑 RSI"""
+    return 100 - (100 / (1 + ctx.get('avg_up_wilder', period) / (ctx.get('avg_down_wilder', period) + 1e-9)))
+
+@indicator('rsi_sma')
+def _rsi_sma(ctx, period):
+    """backtest_engine：简单移动平均 RSI"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - (100 / (1 + (ctx.get('avg_up_sma', period) / ctx.get('avg_down_sma', period))))
+
+@indicator('rsi_sma_z')
+def _rsi_sma_z(ctx, period):
+    """strategy_engine：简单移动平均 RSI，区间内无下跌时记为 0"""
+    down = ctx.get('avg_down_sma', period)
+    rs = ctx.get('avg_up_sma', period) / np.where(down == 0, np.nan, down)
+    return 100 - (100 / (1 + np.where(np.isnan(rs), 0, rs)))
+
+@indicator('ma')
+def _ma(ctx, window):
+    return _rolling(ctx.get('close'), window).mean().to_numpy()
+
+@indicator('bias')
+def _bias(ctx, window):
+    close, ma = ctx.get('close'), ctx.get('ma', window)
+    return ((close - ma) / ma) * 100
+
+@indicator('retr')
+def _retr(ctx, window):
+    """距 window 日最高收盘的回撤%"""
+    close = ctx.get('close')
+    max_high = _rolling(close, window).max().to_numpy()
+    return ((close - max_high) / max_high) * 100
+
+@indicator('kdj')
+def _kdj(ctx, n, com):
+    close = ctx.get('close')
+    low_n, high_n = _rolling(close, n).min().to_numpy(), _rolling(close, n).max().to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = (close - low_n) / (high_n - low_n) * 100
+    k, _ = indicator_cache.ewm_mean(rsv, com=com)
+    d, _ = indicator_cache.ewm_mean(k, com=com)
+    return k, d, 3 * k - 2 * d
+
+@indicator('vol_ma_prev')
+def _vol_ma_prev(ctx, window):
+    """不含当日的 window 日均成交量"""
+    return ctx.df['成交量'].shift(1).rolling(window).mean().to_numpy()
+
+@indicator('vol_ratio')
+def _vol_ratio(ctx, window):
+    """当日成交量 / 前 window 日均量"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return ctx.df['成交量'].to_numpy(dtype=float) / ctx.get('vol_ma_prev', window)
+
+# ------------------------------------------------------------------------------
+# 策略接口
+# ------------------------------------------------------------------------------
+class Strategy:
+    name = ''
+    min_bars = 0   # K线不足时由内核登记跳过，不调用 scan
+
+    def universe(self):
+        """主进程内选股，返回代码列表；返回 None 表示本次不参与（如配置文件缺失）"""
+        raise NotImplementedError
+
+    def scan(self, code, ctx):
+        """工作进程内处理一只基金，返回结果（None 表示无输出）；处理结果用 fund_outcomes 按 stage=self.name 登记"""
+        raise NotImplementedError
+
+    def publish(self, results):
+        """主进程内写出该策略原有的输出，results 为各基金 scan 结果（按代码顺序）"""
+        raise NotImplementedError
+
+def load_strategies(names=None):
+    """导入 PLUGINS 中的模块并取其 STRATEGY；names 非空时只保留指定策略"""
+    strategies = [importlib.import_module(m).STRATEGY for m in PLUGINS]
+    return [s for s in strategies if not names or s.name in names]
+
+def scan_chunk(args):
+    """工作进程入口：(策略名列表, [(代码, 策略序号列表)]) -> ({策略名: 结果列表}, 逐品种处理结果, 指标计数)"""
+    names, tasks = args
+    strategies = load_strategies(names)
+    which = dict(tasks)
+    out = {s.name: [] for s in strategies}
+    STATS.clear()
+
+    def step(code):
+        ctx = FundContext(code, price_store.load_fund(code))
+        for i in which[code]:
+            s = strategies[i]
+            if ctx.df is None or len(ctx.df) < s.min_bars:
+                fund_outcomes.skip(code, fund_outcomes.no_data_reason(code, s.min_bars), s.name)
+                continue
+            try: res = s.scan(code, ctx)
+            except Exception as e: res = fund_outcomes.error(code, e, s.name)
+            if res is not None: out[s.name].append(res)
+
+    for _ in run_profile.fund_map(step, list(which)): pass
+    return out, fund_outcomes.drain(), dict(STATS)
+
+def run(names=None):
+    """一次遍历：各策略选股取并集，每只基金读取一次、指标按需去重计算，最后各自落盘"""
+    strategies = load_strategies(names)
+    with run_profile.stage('build_store'):
+        price_store.build_store(price_store.DATA_DIR)
+    with run_profile.stage('select'):
+        universes = {s.name: s.universe() for s in strategies}
+    strategies = [s for s in strategies if universes[s.name] is not None]
+    if not strategies: return
+    members = {s.name: set(universes[s.name]) for s in strategies}
+    codes = sorted(set().union(*members.values()))
+    tasks = [(c, [i for i, s in enumerate(strategies) if c in members[s.name]]) for c in codes]
+    print(f"🧩 统一遍历：{len(codes)} 个品种 -> " + " | ".join(f"{s.name} {len(members[s.name])}" for s in strategies))
+
+    names = [s.name for s in strategies]
+    results, stats, spool = {n: [] for n in names}, Counter(), None
+    with run_profile.stage('scan'):
+        if memory_budget.ENABLED:
+            spool, extras = memory_budget.run_chunks(
+                scan_chunk, [(names, part) for part in memory_budget.code_chunks(tasks)], 'engine_core')
+            for (counts,) in extras: stats.update(counts)
+            # 各策略按块号顺序逐块从磁盘读回自己的结果
+            results = {n: spool.field(n) for n in names}
+        else:
+            with Pool(cpu_count()) as p:
+                chunks = p.imap(run_profile.task(scan_chunk),
+                                [(names, part) for part in price_store.chunk_codes(tasks, cpu_count() * 4)])
+                for out, outcomes, counts in run_profile.results(chunks):
+                    for n in names: results[n].extend(out[n])
+                    fund_outcomes.extend(outcomes)
+                    stats.update(counts)
+    print(f"🧮 指标注册表：计算 {stats['计算']} 次，复用 {stats['复用']} 次")
+
+    for s in strategies:
+        with run_profile.stage(f'publish_{s.name}'):
+            s.publish(results[s.name])
+    if spool: spool.close()
+    fund_outcomes.summarize('engine_core')
+    indicator_cache.prune_cache()
+    run_profile.finish('engine_core', funds=len(codes), strategies=names)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='统一引擎内核：一次遍历全市场，同时运行全部已注册策略')
+    parser.add_argument('--strategies', nargs='+', help='只运行指定策略（默认全部）：' + ' '.join(PLUGINS))
+    parser.add_argument('--profile', action='store_true', help='开启运行剖析（同 RUN_PROFILE=1）')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.profile: run_profile.enable()
+    run(args.strategies)
+
+if __name__ == "__main__":
+    run_profile.run(main, 'engine_core')
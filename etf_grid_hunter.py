@@ -1,9 +1,18 @@
 import pandas as pd
 import os
-import glob
 import numpy as np
 from datetime import datetime
 from multiprocessing import Pool, cpu_count
+import price_store
+import indicator_cache
+import universe_manifest
+import stream_indicators as si
+import run_profile
+import fund_outcomes
+import quote_feed
+import engine_core
+import fund_clusters
+import memory_budget
 
 # ==============================================================================
 # 战法说明：Alpha Hunter V8.5 终极实战版
@@ -16,6 +25,13 @@ DATA_DIR = 'fund_data'
 ETF_LIST_FILE = 'ETF列表.xlsx' 
 TRACKER_FILE = 'signal_tracker.csv'    # 历史胜率账本
 BASE_RESULT_DIR = 'results'            # 归档根目录
+# 扫描模式：stream(默认，流式状态逐日续算) / full(每只基金完整 pandas 计算)
+SCAN_MODE = os.environ.get('SCAN_MODE', 'stream')  # stream / full / intraday（盘中常驻，消费实时报价）
+STREAM_NAME = 'etf_grid_hunter'        # 流式状态文件名 .scan_state/etf_grid_hunter.json
+TRACK_DAYS = [7, 14, 20, 60]           # 账本跟踪的持有期，满 60 个交易日结项
+MIN_BARS = 60                          # K线不足60根的品种不做诊断
+QUOTE_SOURCE = os.environ.get('QUOTE_SOURCE', 'akshare')          # 盘中报价源：akshare / fake / 本地报价文件路径
+QUOTE_INTERVAL = float(os.environ.get('QUOTE_INTERVAL', '30'))    # 实盘轮询间隔（秒）
 
 def calculate_rsi(series, period=14):
     delta = series.diff()
@@ -24,45 +40,238 @@ def calculate_rsi(series, period=14):
     rs = gain / (loss + 1e-9)
     return 100 - (100 / (1 + rs))
 
+def compute_indicators(df, seed=None, start=0, period=14):
+    """全历史 Wilder RSI 与 MA20；seed 非空时 RSI 的涨跌幅均值从缓存状态接着递推"""
+    delta = df['收盘'].diff()
+    gain = (delta.where(delta > 0, 0)).to_numpy()[start:]
+    loss = (-delta.where(delta < 0, 0)).to_numpy()[start:]
+    avg_gain, gain_state = indicator_cache.ewm_mean(gain, alpha=1/period, seed=seed and seed['gain'])
+    avg_loss, loss_state = indicator_cache.ewm_mean(loss, alpha=1/period, seed=seed and seed['loss'])
+    rsi = 100 - (100 / (1 + avg_gain / (avg_loss + 1e-9)))
+    cols = {
+        'RSI': np.concatenate([np.full(start, np.nan), rsi]),
+        'MA20': df['收盘'].rolling(20).mean().to_numpy(),
+    }
+    return cols, {'gain': gain_state, 'loss': loss_state}
+
+GRID_SPEC = indicator_cache.IndicatorSpec('grid_rsi', ['日期', '收盘'], 25, compute_indicators)
+
+def build_analysis(date, code, price, rsi_val, ma20, vol_ratio):
+    """由最新一根K线的指标生成决策记录（完整计算与流式扫描共用）"""
+    bias = (price - ma20) / ma20 * 100
+
+    # --- 决策逻辑 ---
+    signal_type, reason, is_buy = "观望", "正常波动", False
+
+    if rsi_val < 43: # 买入阈值
+        signal_type, reason, is_buy = "建议买入", "情绪冰点", True
+        if rsi_val < 32: reason = "严重超跌/黄金坑"
+    elif rsi_val > 70: # 卖出阈值
+        signal_type, reason = "建议卖出", "情绪过热"
+    elif price > ma20 and vol_ratio < 0.8: # 量价背离
+        signal_type, reason = "建议卖出", "量价背离/缩量诱多"
+
+    return {
+        '日期': date, '代码': code, '价格': price, 'RSI': round(rsi_val, 1),
+        '信号': signal_type, '理由': reason, 'is_signal': is_buy,
+        '偏离度%': round(bias, 2), '人气值': round(vol_ratio, 2)
+    }
+
+def new_stream():
+    return si.FundStream({
+        'rsi': si.WilderRSI(14), 'ma20': si.RollingMean(20), 'amount': si.Window(20),
+    })
+
+def feed_stream(stream, cols, i):
+    close = cols['close'][i]
+    stream['rsi'].update(close)
+    stream['ma20'].update(close)
+    stream['amount'].update(cols['amount'][i])
+    stream.extra['close'] = close
+
+def analyze_stream(code, stream):
+    """流式版 analyze_fund：只消费新增K线，直接用状态中的最新指标做决策"""
+    stream, _ = si.advance(stream, code, new_stream, feed_stream)
+    if stream is None or stream.n < MIN_BARS: return stream, fund_outcomes.skip(code, fund_outcomes.no_data_reason(code, MIN_BARS))
+    fund_outcomes.record(code)
+    amount = np.array(stream['amount'].buf)
+    vol_ratio = amount[-5:].mean() / (amount.mean() + 1e-9)
+    rsi_val, ma20 = stream['rsi'].value, stream['ma20'].value
+    return stream, build_analysis(stream.last_date, code, stream.extra['close'], rsi_val, ma20, vol_ratio)
+
+def scan_stream(codes):
+    """在主进程内逐只推进流式状态；状态缺失或数据被改写的品种自动从头预热"""
+    states = si.load_states(STREAM_NAME)
+    analyses = []
+
+    def step(f):
+        code = price_store.code_from_path(f)
+        return code, analyze_stream(code, states.get(code))
+
+    for code, (stream, analysis) in run_profile.fund_map(step, codes):
+        if stream is not None: states[code] = stream
+        if analysis is not None: analyses.append(analysis)
+    si.save_states(STREAM_NAME, states)
+    return analyses
+
+class HistoryMap(dict):
+    """按需从全市场矩阵读取 (有序日期数组, 收盘价数组)，不必让工作进程把每只基金的历史传回主进程
+
+    收盘价保持矩阵中的 float32 原值，由 refresh_tracker 用时 decode，缓存占用减半。
+    """
+    def __missing__(self, code):
+        hist = price_store.matrix_series(code, raw=True)
+        self[code] = hist
+        return hist
+
+    def __contains__(self, code):
+        m = price_store.open_matrix()
+        return dict.__contains__(self, code) or (m is not None and code in m['col'])
+
 def analyze_fund(file_path):
     try:
-        full_df = pd.read_csv(file_path, encoding='utf-8-sig')
-        if len(full_df) < 60: return None
-        full_df.columns = [c.strip() for c in full_df.columns]
+        full_df = price_store.load_fund(file_path)
+        if full_df is None or len(full_df) < MIN_BARS: return fund_outcomes.skip(file_path, fund_outcomes.no_data_reason(file_path, MIN_BARS))
+        code = os.path.basename(file_path).replace('.csv', '')
+        ind = indicator_cache.get_indicators(code, full_df, GRID_SPEC)
+        full_df['日期'] = full_df['日期'].dt.strftime('%Y-%m-%d')
         df = full_df.tail(120).copy()
         latest = df.iloc[-1]
         
-        # --- 核心指标计算 ---
-        rsi_val = calculate_rsi(df['收盘']).iloc[-1]
-        ma20 = df['收盘'].rolling(20).mean().iloc[-1]
-        bias = (latest['收盘'] - ma20) / ma20 * 100
+        # --- 核心指标计算（RSI 取全历史 Wilder 递推，便于缓存按日追加） ---
+        rsi_val = ind['RSI'][-1]
+        ma20 = ind['MA20'][-1]
         vol_ratio = df['成交额'].tail(5).mean() / (df['成交额'].tail(20).mean() + 1e-9)
-        
-        # --- 决策逻辑 ---
-        signal_type, reason, is_buy = "观望", "正常波动", False
+        fund_outcomes.record(code)
+        return build_analysis(latest['日期'], code, latest['收盘'], rsi_val, ma20, vol_ratio)
+    except Exception as e: return fund_outcomes.error(file_path, e)
 
-        if rsi_val < 43: # 买入阈值
-            signal_type, reason, is_buy = "建议买入", "情绪冰点", True
-            if rsi_val < 32: reason = "严重超跌/黄金坑"
-        elif rsi_val > 70: # 卖出阈值
-            signal_type, reason = "建议卖出", "情绪过热"
-        elif latest['收盘'] > ma20 and vol_ratio < 0.8: # 量价背离
-            signal_type, reason = "建议卖出", "量价背离/缩量诱多"
+def analyze_chunk(codes):
+    """工作进程入口：只接收代码列表，行情由各进程自行 mmap 读取；返回 (诊断结果, 逐品种处理结果)"""
+    return [a for a in run_profile.fund_map(analyze_fund, codes) if a is not None], fund_outcomes.drain()
 
-        code = os.path.basename(file_path).replace('.csv', '')
-        return {
-            'analysis': {
-                '日期': latest['日期'] if '日期' in latest else datetime.now().strftime('%Y-%m-%d'),
-                '代码': code, '价格': latest['收盘'], 'RSI': round(rsi_val, 1), 
-                '信号': signal_type, '理由': reason, 'is_signal': is_buy,
-                '偏离度%': round(bias, 2), '人气值': round(vol_ratio, 2)
-            },
-            'history': full_df[['日期', '收盘']]
-        }
-    except: return None
+# ==========================================
+# --- 盘中模式：前一交易日收盘的指标基线常驻内存，每个报价快照向量化更新全部品种 ---
+# ==========================================
+def signal_codes(rsi, price, ma20, vol_ratio):
+    """build_analysis 决策的向量化版本：0 观望 / 1 建议买入 / 2 严重超跌 / 3 情绪过热 / 4 量价背离"""
+    return np.select([rsi < 32, rsi < 43, rsi > 70, (price > ma20) & (vol_ratio < 0.8)], [2, 1, 3, 4], 0)
+
+def ewm_peek(weighted, old_wt, cur, com):
+    """indicator_cache.ewm_step 的向量化只读版本：假设下一个点为 cur，返回递推后的均值但不改动基线"""
+    alpha = 1.0 / (1.0 + com)
+    ow = old_wt * (1.0 - alpha)
+    with np.errstate(invalid='ignore'):
+        nxt = np.where(weighted != cur, (ow * weighted + alpha * cur) / (ow + alpha), weighted)
+    return np.where(np.isnan(weighted), cur, np.where(np.isnan(cur), weighted, nxt))
+
+class IntradayBook:
+    """盘中指标基线：各品种截至 session_date 前一交易日的 Wilder RSI 递推状态、近19日收盘与成交额
+
+    报价视为当日尚未收盘的一根K线：每个快照只从基线“试算”一步，不改动基线，
+    因此同一天内价格来回波动时 RSI/MA20/BIAS 始终相对昨日收盘计算，与收盘后全量扫描口径一致。
+    """
+    def __init__(self, codes, session_date, period=14):
+        self.com = (1 - 1 / period) / (1 / period)
+        base = [b for b in map(lambda c: self._base(c, session_date), codes) if b is not None]
+        self.codes = pd.Index([b[0] for b in base])
+        self.prev_close = np.array([b[1] for b in base])
+        self.gain = np.array([b[2] for b in base])   # (n, 2): [weighted, old_wt]
+        self.loss = np.array([b[3] for b in base])
+        self.closes = np.array([b[4] for b in base])   # (n, 19)
+        self.amounts = np.array([b[5] for b in base])  # (n, 19)
+        self.last_date = np.array([b[6] for b in base], dtype='datetime64[ns]')  # 基线最后一根K线的日期
+        n = len(self.codes)
+        self.price, self.rsi, self.ma20, self.vol_ratio = (np.full(n, np.nan) for _ in range(4))
+        self.signal = np.zeros(n, dtype=int)
+
+    @staticmethod
+    def _base(code, session_date):
+        df = price_store.load_fund(code)
+        if df is None: return None
+        df = df[df['日期'] < pd.Timestamp(session_date)].reset_index(drop=True)
+        if len(df) < MIN_BARS - 1: return None
+        _, state = compute_indicators(df)
+        close = df['收盘'].to_numpy(dtype=float)
+        amount = df['成交额'].to_numpy(dtype=float)
+        return code, close[-1], state['gain'], state['loss'], close[-19:], amount[-19:], df['日期'].iloc[-1]
+
+    def fresh(self, quotes, when):
+        """只保留行情日期晚于该品种最后一根已存K线的报价；报价不带日期时以快照时间为准"""
+        pos = self.codes.get_indexer(quotes['代码'])
+        day = pd.Series(pd.Timestamp(when).normalize(), index=quotes.index)
+        if '日期' in quotes.columns: day = pd.to_datetime(quotes['日期']).fillna(day)
+        day = day.to_numpy()
+        known = pos >= 0
+        keep = ~known   # 不在基线中的代码由 update 忽略
+        keep[known] = day[known] > self.last_date[pos[known]]
+        return quotes[keep]
+
+    def update(self, quotes):
+        """消费一个报价快照，返回信号发生变化的行号"""
+        pos = self.codes.get_indexer(quotes['代码'])
+        ok = pos >= 0
+        pos, price = pos[ok], quotes['最新价'].to_numpy(dtype=float)[ok]
+        amount = quotes['成交额'].to_numpy(dtype=float)[ok]
+        delta = price - self.prev_close[pos]
+        up = ewm_peek(self.gain[pos, 0], self.gain[pos, 1], np.where(delta > 0, delta, 0.0), self.com)
+        down = ewm_peek(self.loss[pos, 0], self.loss[pos, 1], np.where(delta < 0, -delta, 0.0), self.com)
+        amounts = np.column_stack([self.amounts[pos], amount])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.rsi[pos] = 100 - (100 / (1 + up / (down + 1e-9)))
+            self.ma20[pos] = (self.closes[pos].sum(axis=1) + price) / 20
+            self.vol_ratio[pos] = amounts[:, -5:].mean(axis=1) / (amounts.mean(axis=1) + 1e-9)
+        self.price[pos] = price
+        new = signal_codes(self.rsi[pos], price, self.ma20[pos], self.vol_ratio[pos])
+        changed = pos[new != self.signal[pos]]
+        self.signal[pos] = new
+        return changed
+
+    def analysis(self, i, when):
+        """第 i 个品种的当前决策记录（与收盘扫描同一 build_analysis）"""
+        rec = build_analysis(when.strftime('%Y-%m-%d'), self.codes[i], round(float(self.price[i]), 4),
+                             self.rsi[i], self.ma20[i], self.vol_ratio[i])
+        rec['时间'] = when.strftime('%H:%M:%S')
+        return rec
+
+def run_intraday(codes, name_map, source, session_date=None):
+    """盘中常驻：逐个报价快照更新全部品种，信号变化即时输出并追加到 results/年/月/intraday_YYYYMMDD.csv"""
+    session_date = session_date or datetime.now().strftime('%Y-%m-%d')
+    t0 = datetime.now()
+    book = IntradayBook([c for c in codes if c in name_map], session_date)
+    print(f"⏱️ 盘中模式：{len(book.codes)} 个品种基线就绪（截至 {session_date} 前一交易日，耗时 {(datetime.now() - t0).total_seconds():.1f}s）")
+    out_path, n_snap, warned = None, 0, False
+    for when, quotes in source.snapshots():
+        t1 = datetime.now()
+        # 非交易日/回放旧日期：报价就是已存的最后一根K线，再试算一步会重复计入 RSI 递推
+        fresh = book.fresh(quotes, when)
+        if len(fresh) < len(quotes) and not warned:
+            print(f"⚠️ {len(quotes) - len(fresh)} 条报价的行情日期不晚于已存K线，已忽略（非交易日？）")
+            warned = True
+        if fresh.empty: continue
+        quotes = fresh
+        changed = book.update(quotes)
+        records = [dict(book.analysis(i, when), 简称=name_map.get(book.codes[i], '未知')) for i in changed]
+        cost = (datetime.now() - t1).total_seconds() * 1000
+        n_snap += 1
+        for r in records:
+            if r['信号'] == '观望': continue
+            icon = '🟢' if r['is_signal'] else '🔴'
+            print(f"{icon} {r['时间']} {r['代码']} {r['简称']:<10} | {r['价格']:<8} | RSI {r['RSI']:<5} | {r['信号']}({r['理由']})")
+        if records:
+            if out_path is None:
+                day = pd.Timestamp(when)
+                dir_path = os.path.join(BASE_RESULT_DIR, day.strftime('%Y'), day.strftime('%m'))
+                os.makedirs(dir_path, exist_ok=True)
+                out_path = os.path.join(dir_path, f"intraday_{day.strftime('%Y%m%d')}.csv")
+            pd.DataFrame(records).to_csv(out_path, mode='a', header=not os.path.exists(out_path), index=False, encoding='utf-8-sig')
+        print(f"   快照 #{n_snap} {when.strftime('%H:%M:%S')}: {len(quotes)} 条报价 | 信号变化 {len(records)} | 处理 {cost:.1f}ms")
+    buys = int(np.isin(book.signal, [1, 2]).sum())
+    print(f"🏁 盘中结束：共 {n_snap} 个快照，当前建议买入 {buys} 只" + (f"，变化记录见 {out_path}" if out_path else ""))
+    return book
 
 def update_tracker(new_results, hist_map, name_map):
-    """维护回测账本，确保列名一致性"""
+    """维护回测账本，确保列名一致性；账本按代码分组刷新，已结项记录不再重复计算"""
     cols = ['代码', '简称', '入场日期', '买入价', 'T+7收益%', 'T+14收益%', 'T+20收益%', 'T+60收益%', '状态']
     if os.path.exists(TRACKER_FILE):
         tracker = pd.read_csv(TRACKER_FILE)
@@ -72,60 +281,115 @@ def update_tracker(new_results, hist_map, name_map):
     else:
         tracker = pd.DataFrame(columns=cols)
 
-    # 1. 记录今日新买入信号
+    # 1. 记录今日新买入信号：冷却期10天，避免重复记账（代码 -> 最近一次入场日期）
+    latest = tracker.assign(代码=tracker['代码'].astype(str).str.zfill(6)).drop_duplicates('代码', keep='last')
+    last_entry = dict(zip(latest['代码'], pd.to_datetime(latest['入场日期'], errors='coerce')))
+    now = datetime.now()
+    new_rows = []
     for item in new_results:
-        if item['is_signal']:
-            recent = tracker[tracker['代码'] == item['代码']].tail(1)
-            # 冷却期10天，避免重复记账
-            if recent.empty or (datetime.now() - pd.to_datetime(recent['入场日期'].values[0])).days > 10:
-                new_row = pd.DataFrame([[
-                    item['代码'], name_map.get(item['代码'], '未知'), item['日期'], 
-                    item['价格'], np.nan, np.nan, np.nan, np.nan, '持有中'
-                ]], columns=cols)
-                tracker = pd.concat([tracker, new_row], ignore_index=True)
-
-    # 2. 刷新收益情况
-    for idx, row in tracker.iterrows():
-        code = str(row['代码']).zfill(6)
-        if code in hist_map:
-            h_df = hist_map[code].copy()
-            h_df['日期'] = pd.to_datetime(h_df['日期'])
-            buy_dt = pd.to_datetime(row['入场日期'])
-            future = h_df[h_df['日期'] > buy_dt]
-            if not future.empty:
-                for t in [7, 14, 20, 60]:
-                    col = f'T+{t}收益%'
-                    if pd.isna(row[col]) and len(future) >= t:
-                        p_t = future.iloc[t-1]['收盘']
-                        tracker.at[idx, col] = round((p_t - row['买入价']) / row['买入价'] * 100, 2)
-                if len(future) >= 60: tracker.at[idx, '状态'] = '已结项'
-    
+        if not item['is_signal']: continue
+        last = last_entry.get(item['代码'])
+        if last is None or (now - last).days > 10:
+            new_rows.append([item['代码'], name_map.get(item['代码'], '未知'), item['日期'],
+                             item['价格'], np.nan, np.nan, np.nan, np.nan, '持有中'])
+            last_entry[item['代码']] = pd.to_datetime(item['日期'])
+    if new_rows:
+        new_df = pd.DataFrame(new_rows, columns=cols)
+        tracker = new_df if tracker.empty else pd.concat([tracker, new_df], ignore_index=True)
+
+    tracker = refresh_tracker(tracker, hist_map)
     tracker.to_csv(TRACKER_FILE, index=False, encoding='utf-8-sig')
     return tracker
 
-def main():
-    # --- 加载基金列表与名称映射 ---
+def refresh_tracker(tracker, hist_map):
+    """刷新账本收益：已结项的记录跳过；其余按代码分组，在有序日期上 searchsorted 定位 T+N 收盘价"""
+    codes = tracker['代码'].astype(str).str.zfill(6).to_numpy()
+    buy_dt = pd.to_datetime(tracker['入场日期'], errors='coerce').to_numpy().astype('datetime64[D]')
+    buy_px = pd.to_numeric(tracker['买入价'], errors='coerce').to_numpy(dtype=float)
+    rets = {t: np.array(pd.to_numeric(tracker[f'T+{t}收益%'], errors='coerce'), dtype=float) for t in TRACK_DAYS}
+    closed = np.zeros(len(tracker), dtype=bool)
+    open_rows = np.flatnonzero(tracker['状态'].astype(str).to_numpy() != '已结项')
+    for code, rows in pd.Series(open_rows).groupby(codes[open_rows]):
+        if code not in hist_map: continue
+        dates, close = hist_map[code]
+        close = price_store.decode('close', close)
+        rows = rows.to_numpy()
+        pos = np.searchsorted(dates, buy_dt[rows], side='right')  # 入场日之后的第一根K线
+        n_future = len(dates) - pos
+        for t in TRACK_DAYS:
+            m = np.isnan(rets[t][rows]) & (n_future >= t)
+            idx = rows[m]
+            rets[t][idx] = np.round((close[pos[m] + t - 1] - buy_px[idx]) / buy_px[idx] * 100, 2)
+        closed[rows[n_future >= 60]] = True
+    for t in TRACK_DAYS: tracker[f'T+{t}收益%'] = rets[t]
+    tracker.loc[closed, '状态'] = '已结项'
+    return tracker
+
+def load_name_map():
+    """ETF 列表 -> {6位代码: 简称}；读取失败返回 None"""
     target_file = ETF_LIST_FILE if os.path.exists(ETF_LIST_FILE) else ETF_LIST_FILE.replace('.xlsx', '.csv')
     try:
         if target_file.endswith('.xlsx'): name_df = pd.read_excel(target_file)
         else: name_df = pd.read_csv(target_file, encoding='utf-8-sig')
         name_df.columns = [c.strip() for c in name_df.columns]
-        name_map = dict(zip(name_df['证券代码'].astype(str).str.zfill(6), name_df['证券简称']))
+        return dict(zip(name_df['证券代码'].astype(str).str.zfill(6), name_df['证券简称']))
     except:
+        return None
+
+def main():
+    # --- 加载基金列表与名称映射 ---
+    name_map = load_name_map()
+    if name_map is None:
         print("❌ 错误：无法读取 ETF 列表文件，请确认路径。")
         return
 
     # --- 并行扫描分析 ---
-    csv_files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
-    print(f"🚀 Alpha Hunter V8.5 启动：正在深度诊断 {len(csv_files)} 个品种...")
-    with Pool(cpu_count()) as p:
-        raw_output = p.map(analyze_fund, csv_files)
-    
-    results = [r['analysis'] for r in raw_output if r and r['analysis']['代码'] in name_map]
-    hist_map = {r['analysis']['代码']: r['history'] for r in raw_output if r}
+    with run_profile.stage('build_store'):
+        price_store.build_store(DATA_DIR)
+    # 按品种清单预筛选：K线不足 MIN_BARS 的品种不派发
+    with run_profile.stage('select'):
+        codes = universe_manifest.select(min_rows=MIN_BARS, data_dir=DATA_DIR)
+    if SCAN_MODE == 'intraday':
+        run_intraday(codes, name_map, quote_feed.make_source(QUOTE_SOURCE, QUOTE_INTERVAL))
+        return
+    print(f"🚀 Alpha Hunter V8.5 启动：正在深度诊断 {len(codes)} 个品种...")
+    spool = None
+    with run_profile.stage('scan'):
+        if SCAN_MODE == 'stream':
+            analyses = scan_stream(codes)
+        elif memory_budget.ENABLED:
+            spool, _ = memory_budget.run_chunks(analyze_chunk, memory_budget.code_chunks(codes), STREAM_NAME)
+            analyses = spool
+        else:
+            with Pool(cpu_count()) as p:
+                chunks = p.imap(run_profile.task(analyze_chunk), price_store.chunk_codes(codes, cpu_count() * 4))
+                analyses = []
+                for chunk, outcomes in run_profile.results(chunks):
+                    analyses.extend(chunk)
+                    fund_outcomes.extend(outcomes)
+    publish(analyses, name_map)
+    if spool: spool.close()
+    fund_outcomes.summarize('etf_grid_hunter')
+    indicator_cache.prune_cache()
+    run_profile.finish('etf_grid_hunter', funds=len(codes), mode=SCAN_MODE)
+
+def publish(analyses, name_map):
+    """诊断结果落盘：更新胜率账本、写当日 scan_YYYYMMDD.csv 并打印报告"""
+    hist_map = HistoryMap()
+
+    # 只保留有操作建议的品种（“观望”不进账本也不落盘），受限模式下逐块从磁盘读回时不必整体驻留
+    results = [a for a in analyses if a['代码'] in name_map and a['信号'] != '观望']
+
+    # --- 相关性去重：同簇（孪生 ETF）的买入只保留 RSI 最低或成交最活跃的一只 ---
+    _, dropped = fund_clusters.dedupe([r for r in results if r['is_signal']], '代码', lambda r: -r['RSI'])
+    if dropped:
+        skip = {id(r) for r in dropped}
+        results = [r for r in results if id(r) not in skip]
+        print(f"🔗 相关性去重：略过 {len(dropped)} 个与同簇品种重复的买入信号")
 
     # --- 更新胜率回测账本 ---
-    tracker_df = update_tracker(results, hist_map, name_map)
+    with run_profile.stage('tracker'):
+        tracker_df = update_tracker(results, hist_map, name_map)
 
     # --- 处理今日决策与排序 ---
     buy_list = sorted([r for r in results if r['信号'] == "建议买入"], key=lambda x: x['RSI'])
@@ -162,7 +426,7 @@ def main():
 
     # --- 胜率复盘简报 ---
     print("\n📊 历史信号可靠性报告 (Based on signal_tracker.csv):")
-    for t in [7, 14, 20, 60]:
+    for t in TRACK_DAYS:
         col = f'T+{t}收益%'
         if col in tracker_df.columns:
             valid = tracker_df[tracker_df[col].notna()]
@@ -171,5 +435,28 @@ def main():
                 avg = valid[col].astype(float).mean()
                 print(f" >> T+{t:2d}表现: 胜率 {wr:5.1f}% | 平均收益 {avg:5.2f}% (样本数:{len(valid)})")
 
+class GridStrategy(engine_core.Strategy):
+    """统一引擎内核中的 etf_grid_hunter：与 analyze_fund 同一口径，输出与单独运行相同"""
+    name, min_bars = 'etf_grid_hunter', MIN_BARS
+
+    def universe(self):
+        self.name_map = load_name_map()
+        if self.name_map is None:
+            print("❌ 错误：无法读取 ETF 列表文件，请确认路径。")
+            return None
+        return universe_manifest.select(min_rows=MIN_BARS, data_dir=DATA_DIR)
+
+    def scan(self, code, ctx):
+        df = ctx.df
+        vol_ratio = df['成交额'].tail(5).mean() / (df['成交额'].tail(20).mean() + 1e-9)
+        fund_outcomes.record(code, stage=self.name)
+        return build_analysis(df['日期'].iloc[-1].strftime('%Y-%m-%d'), code, df['收盘'].iloc[-1],
+                              ctx.get('rsi_wilder', 14)[-1], ctx.get('ma', 20)[-1], vol_ratio)
+
+    def publish(self, results):
+        publish(results, self.name_map)
+
+STRATEGY = GridStrategy()
+
 if __name__ == "__main__":
-    main()
+    run_profile.run(main, 'etf_grid_hunter')
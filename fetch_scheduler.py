@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import random
+import tempfile
+import asyncio
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+# ==============================================================================
+# 下载调度器：限流 + 重试 + 失败队列
+# 1. [并发与限流]：信号量控制并发数，令牌桶控制每秒请求数，避免被上游限流
+# 2. [重试策略]：指数退避 + 随机抖动，错峰重试
+# 3. [失败队列]：本轮最终失败的代码写入 FAILURE_FILE，下一轮优先重试
+# 4. [运行报告]：逐代码记录状态、尝试次数与耗时，写入 REPORT_FILE
+# 5. [超时]：超时只标记本次失败，工作线程无法被取消；等它真正结束后才释放并发名额并重试，
+#    同一代码的两次尝试不会同时写同一个文件
+# ==============================================================================
+
+FAILURE_FILE = 'download_failures.json'
+REPORT_FILE = 'download_report.csv'
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，capacity 为允许的突发量；rate<=0 表示不限流"""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        if self.rate <= 0: return
+        if self._lock is None: self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=30.0):
+    """第 attempt 次失败后的等待时间：指数增长封顶，再乘以 [0.5, 1.5) 的随机抖动"""
+    return min(max_delay, base_delay * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+def load_failures(path=FAILURE_FILE):
+    if not os.path.exists(path): return {}
+    try:
+        with open(path, encoding='utf-8') as f: return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_failures(failures, path=FAILURE_FILE):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(failures, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+class FetchScheduler:
+    """对每个代码调用 fetch_func(code)：成功返回描述字符串，失败抛出异常触发重试"""
+    def __init__(self, fetch_func, concurrency=8, rate=5.0, burst=None,
+                 max_retries=3, base_delay=1.0, max_delay=30.0, timeout=120.0):
+        self.fetch_func = fetch_func
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+    async def _fetch_one(self, code, sem, executor):
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        attempt, message = 0, ''
+        while True:
+            await self.bucket.acquire()
+            async with sem:
+                fut = loop.run_in_executor(executor, self.fetch_func, code)
+                try:
+                    message = await asyncio.wait_for(asyncio.shield(fut), self.timeout)
+                    status = '成功'
+                except asyncio.TimeoutError:
+                    status, message = '失败', f'超时({self.timeout}s)'
+                    # 线程仍在运行：占着名额等它结束，结果作废，之后再按退避重试
+                    await asyncio.wait([fut])
+                    if not fut.cancelled(): fut.exception()
+                except Exception as e:
+                    status, message = '失败', f'{type(e).__name__}: {e}'
+            attempt += 1
+            if status == '成功' or attempt > self.max_retries: break
+            await asyncio.sleep(backoff_delay(attempt - 1, self.base_delay, self.max_delay))
+        return {'代码': code, '状态': status, '尝试次数': attempt,
+                '耗时秒': round(time.monotonic() - start, 3), '信息': message}
+
+    async def run(self, codes):
+        sem = asyncio.Semaphore(self.concurrency)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return await asyncio.gather(*[self._fetch_one(c, sem, executor) for c in codes])
+
+def run_with_failure_queue(fetch_func, codes, failure_file=FAILURE_FILE, report_file=REPORT_FILE, **kwargs):
+    """上轮失败的代码排在最前优先重试；本轮结果写报告并刷新失败队列"""
+    failures = load_failures(failure_file)
+    code_set = set(codes)
+    queued = [c for c in failures if c not in code_set]
+    ordered = [c for c in codes if c in failures] + [c for c in codes if c not in failures] + queued
+    if failures: print(f"♻️ 失败队列中有 {len(failures)} 个代码，本轮优先重试")
+
+    report = asyncio.run(FetchScheduler(fetch_func, **kwargs).run(ordered))
+
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    new_failures = {r['代码']: {'error': r['信息'], 'last_run': now,
+                                'runs': failures.get(r['代码'], {}).get('runs', 0) + 1}
+                    for r in report if r['状态'] != '成功'}
+    save_failures(new_failures, failure_file)
+    report_df = pd.DataFrame(report)
+    if report_file: report_df.to_csv(report_file, index=False, encoding='utf-8-sig')
+    return report_df
+
+def print_report(report_df, slowest=5):
+    ok = (report_df['状态'] == '成功').sum()
+    print(f"📥 下载完成: 成功 {ok} | 失败 {len(report_df) - ok} | 重试 {(report_df['尝试次数'] > 1).sum()} 个代码")
+    if len(report_df):
+        print(f"   耗时: 中位数 {report_df['耗时秒'].median():.2f}s | 最慢 {report_df['耗时秒'].max():.2f}s")
+        for _, r in report_df.nlargest(slowest, '耗时秒').iterrows():
+            print(f"   🐢 {r['代码']} {r['耗时秒']:.2f}s ({r['尝试次数']}次) {r['信息']}")
+    for _, r in report_df[report_df['状态'] != '成功'].iterrows():
+        print(f"   ❌ {r['代码']} 下载失败: {r['信息']}")
+
+def make_fake_fetch(latency=(0.01, 0.05), error_rate=0.2, seed=None):
+    """本地假接口：随机注入延迟与异常，用于离线验证调度器的限流/重试行为"""
+    rng = random.Random(seed)
+    def fetch(code):
+        time.sleep(rng.uniform(*latency))
+        if rng.random() < error_rate: raise ConnectionError('模拟上游限流')
+        return f"{code} 下载成功"
+    return fetch
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='使用假接口离线演练下载调度器')
+    parser.add_argument('--codes', type=int, default=100)
+    parser.add_argument('--error-rate', type=float, default=0.2)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=50.0)
+    args = parser.parse_args()
+    codes = [str(510000 + i) for i in range(args.codes)]
+    report = run_with_failure_queue(make_fake_fetch(error_rate=args.error_rate), codes,
+                                    failure_file=os.path.join(tempfile.gettempdir(), 'fake_failures.json'),
+                                    report_file=None, concurrency=args.concurrency,
+                                    rate=args.rate, base_delay=0.05, max_delay=0.5)
+    print_report(report)
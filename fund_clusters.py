@@ -0,0 +1,125 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+import price_store
+
+# ==============================================================================
+# 相关性聚类与买入信号去重：同一指数、不同发行方的“孪生”ETF 只保留一只，避免重复占用 PORTFOLIO_UNIT
+# 1. [收益窗口]：从日期对齐的全市场矩阵切出最近 CORR_WINDOW 个交易日的日收益，不逐只读取行情
+# 2. [分块相关]：收益按列去均值、归一化后，按 CORR_BLOCK 列一块做矩阵乘法，只算上三角，
+#    1500×1500 的相关矩阵不必整块驻留内存；缺失日按零偏离处理，相关系数只会被低估、不会误并
+# 3. [聚类]：按近20日均成交额从高到低选簇首，与簇首相关系数 >= CORR_THRESHOLD 的品种并入该簇
+# 4. [去重]：每簇买入信号只保留一条，DEDUP_KEEP=score 取评分最优者，liquidity 取近20日均成交额最大者
+# ==============================================================================
+
+CORR_WINDOW = int(os.environ.get('CORR_WINDOW', '120'))          # 滚动相关的回看交易日数
+CORR_THRESHOLD = float(os.environ.get('CORR_THRESHOLD', '0.98'))  # 视为同一敞口的相关系数下限
+CORR_MIN_OBS = 60                                                # 窗口内有效收益不足的品种自成一簇
+CORR_BLOCK = 512                                                 # 分块矩阵乘法的列块大小
+LIQUIDITY_DAYS = 20
+DEDUP_ENABLED = os.environ.get('SIGNAL_DEDUP', '1') != '0'
+DEDUP_KEEP = os.environ.get('DEDUP_KEEP', 'score')               # score / liquidity
+CLUSTER_FILE = os.path.join('.scan_state', 'fund_clusters.csv')
+
+_cache = {}
+
+def return_window(window=CORR_WINDOW, store_dir=price_store.STORE_DIR):
+    """最近 window 个交易日的 (代码列表, 日收益矩阵 (window, 代码数), 近20日均成交额)"""
+    m = price_store.open_matrix(store_dir)
+    if m is None or not len(m['dates']): return [], np.empty((0, 0)), np.empty(0)
+    close = price_store.decode('close', m['close'][-(window + 1):]).astype(float)
+    amount = price_store.decode('amount', m['amount'][-LIQUIDITY_DAYS:]).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)   # 全 NaN 列的均值
+        rets = close[1:] / close[:-1] - 1
+        liquidity = np.nanmean(amount, axis=0)
+    return list(m['codes']), rets, liquidity
+
+def normalized(rets, min_obs=CORR_MIN_OBS):
+    """逐列去均值并缩放到单位长度（缺失记 0），有效观测不足 min_obs 或零波动的列整列置 0"""
+    valid = ~np.isnan(rets)
+    n_obs = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n_obs > 0, np.nansum(rets, axis=0) / np.maximum(n_obs, 1), 0.0)
+        z = np.where(valid, rets - mean, 0.0)
+        norm = np.sqrt((z ** 2).sum(axis=0))
+        z = np.where((n_obs >= min_obs) & (norm > 0), z / np.where(norm > 0, norm, 1.0), 0.0)
+    return z.astype(np.float32)
+
+def correlated_pairs(z, threshold=CORR_THRESHOLD, block=CORR_BLOCK):
+    """分块计算 z.T @ z 的上三角，返回相关系数 >= threshold 的 (i, j) 对"""
+    n = z.shape[1]
+    pairs = []
+    for a in range(0, n, block):
+        b = min(a + block, n)
+        corr = z[:, a:b].T @ z[:, a:]          # (b-a, n-a)，只算第 a 列之后的部分
+        i, j = np.nonzero(corr >= threshold)
+        keep = j > i                           # 去掉对角线与块内下三角
+        pairs.append(np.column_stack([i[keep] + a, j[keep] + a]))
+    return np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=int)
+
+def leader_clusters(n, pairs, order):
+    """按 order 依次把尚未归簇的品种立为簇首，与簇首相关系数达标、尚未归簇的品种并入；返回每个品种的簇首下标
+
+    与连通分量不同，簇内每只都直接与簇首高度相关，不会沿“沪深300-中证500-中证1000”一路串成大簇。
+    """
+    neighbors = [[] for _ in range(n)]
+    for i, j in pairs:
+        neighbors[i].append(j)
+        neighbors[j].append(i)
+    label = np.full(n, -1)
+    for x in order:
+        if label[x] >= 0: continue
+        label[x] = x
+        for y in neighbors[x]:
+            if label[y] < 0: label[y] = x
+    return label
+
+def cluster_table(window=CORR_WINDOW, threshold=CORR_THRESHOLD, store_dir=price_store.STORE_DIR):
+    """全市场聚类结果 DataFrame[代码, 簇, 均额20, 簇大小]（索引为代码，簇记为簇首代码），按矩阵版本在进程内缓存"""
+    m = price_store.open_matrix(store_dir)
+    key = (m and m['mtime'], window, threshold)
+    if key in _cache: return _cache[key]
+    codes, rets, liquidity = return_window(window, store_dir)
+    order = np.argsort(-np.nan_to_num(liquidity, nan=-1.0), kind='stable')
+    labels = leader_clusters(len(codes), correlated_pairs(normalized(rets), threshold), order) if codes else np.empty(0, dtype=int)
+    table = pd.DataFrame({'代码': codes, '簇': [codes[k] for k in labels], '均额20': liquidity}, index=codes)
+    table['簇大小'] = table.groupby('簇')['代码'].transform('size')
+    _cache.clear()
+    _cache[key] = table
+    return table
+
+def save_clusters(table, path=CLUSTER_FILE):
+    """多于一只的簇落盘，便于核对哪些品种被视为同一敞口"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table[table['簇大小'] > 1].sort_values(['簇', '均额20'], ascending=[True, False]) \
+        .to_csv(path, index=False, encoding='utf-8-sig')
+
+def dedupe(records, code_key, score, keep=DEDUP_KEEP):
+    """同簇的买入记录只保留一条，返回 (保留, 剔除)，两者均保持原顺序
+
+    score(record) 越大越优；keep='liquidity' 时改按近20日均成交额取舍。不在矩阵中的品种各自成簇。
+    """
+    records = list(records)
+    if not DEDUP_ENABLED or len(records) < 2: return records, []
+    table = cluster_table()
+    label, liquidity = table['簇'].to_dict(), table['均额20'].to_dict()
+    best = {}
+    for k, r in enumerate(records):
+        code = r[code_key]
+        rank = score(r) if keep == 'score' else np.nan_to_num(liquidity.get(code, np.nan), nan=-1.0)
+        c = label.get(code, code)
+        if c not in best or rank > best[c][0]: best[c] = (rank, k)
+    kept = {k for _, k in best.values()}
+    return [r for k, r in enumerate(records) if k in kept], [r for k, r in enumerate(records) if k not in kept]
+
+if __name__ == "__main__":
+    import time
+    t0 = time.perf_counter()
+    table = cluster_table()
+    save_clusters(table)
+    multi = table[table['簇大小'] > 1]
+    print(f"🔗 相关性聚类（近 {CORR_WINDOW} 日，阈值 {CORR_THRESHOLD}）: {len(table)} 只基金 -> "
+          f"{table['簇'].nunique()} 簇，其中 {multi['簇'].nunique()} 个多成员簇覆盖 {len(multi)} 只，耗时 {time.perf_counter() - t0:.2f}s")
+    print(f"   明细: {CLUSTER_FILE}")
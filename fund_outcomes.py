@@ -0,0 +1,82 @@
+import os
+from collections import Counter
+import pandas as pd
+import price_store
+
+# ==============================================================================
+# 逐品种处理结果：替代“异常一律吞掉返回空”，记录每只基金为何被跳过或出错
+# 1. [记录]：record/skip/error 在当前进程内累计 (代码, 阶段, 状态, 原因)；工作进程用 drain() 随结果一起回传，
+#    fork 出的工作进程先丢弃从主进程继承的记录（如派发前清单登记的坏文件），避免重复回传
+# 2. [解析信息]：汇总时从行情仓库补上该品种CSV使用的编码与解析耗时，隔离中的坏文件也一并列出
+# 3. [汇总]：summarize() 写出 .scan_state/outcomes_<引擎>.csv，并打印 完成/跳过/出错/隔离 计数与主要原因
+# ==============================================================================
+
+OUTCOME_DIR = '.scan_state'
+OK, SKIPPED, ERROR, QUARANTINED = '完成', '跳过', '出错', '隔离'
+COLS = ['代码', '阶段', '状态', '原因', '编码', '解析耗时s']
+
+_records = []
+_pid = os.getpid()
+
+def _own():
+    """首次在新进程中使用时清空继承自父进程的记录"""
+    global _pid
+    if _pid != os.getpid():
+        del _records[:]
+        _pid = os.getpid()
+
+def record(code, status=OK, reason='', stage='scan'):
+    _own()
+    _records.append((price_store.code_from_path(code), stage, status, reason))
+
+def skip(code, reason, stage='scan', result=None):
+    """登记跳过并返回 result，便于在各处理函数中直接 return"""
+    record(code, SKIPPED, reason, stage)
+    return result
+
+def error(code, exc, stage='scan', result=None):
+    """登记异常（类型与消息）并返回 result"""
+    record(code, ERROR, f'{type(exc).__name__}: {str(exc)[:200]}', stage)
+    return result
+
+def no_data_reason(code, min_bars):
+    """行情缺失或过短时的原因：隔离中的坏文件给出解析失败原因"""
+    bad = price_store.quarantine_reason(code)
+    if bad: return f'已隔离: {bad}'
+    return f'K线不足{min_bars}根' if price_store.fingerprint(code) else '不在行情仓库'
+
+def drain():
+    """取出并清空当前进程的记录（工作进程随结果回传）"""
+    _own()
+    out = list(_records)
+    del _records[:]
+    return out
+
+def extend(records):
+    _own()
+    _records.extend(records)
+
+def summarize(engine, outcome_dir=OUTCOME_DIR, verbose=True):
+    """合并本次运行的记录与仓库中的隔离清单，落盘并打印汇总，返回明细表"""
+    store = price_store.open_store()
+    index = store['index'] if store else {}
+    quarantine = store['quarantine'] if store else {}
+    rows = [(c, 'store', QUARANTINED, q['reason']) for c, q in sorted(quarantine.items())] + drain()
+    df = pd.DataFrame(rows, columns=COLS[:4])
+    df['编码'] = [index.get(c, quarantine.get(c, {})).get('encoding', '') for c in df['代码']]
+    df['解析耗时s'] = [index.get(c, {}).get('parse_s') for c in df['代码']]
+
+    os.makedirs(outcome_dir, exist_ok=True)
+    path = os.path.join(outcome_dir, f'outcomes_{engine}.csv')
+    df.to_csv(path, index=False, encoding='utf-8-sig')
+    if verbose:
+        print(f"🧾 处理结果（明细: {path}）: 隔离 {len(quarantine)} 个坏文件")
+        for stage, part in df[df['阶段'] != 'store'].groupby('阶段', sort=False):
+            n = Counter(part['状态'])
+            print(f"   {stage}: 完成 {n[OK]} | 跳过 {n[SKIPPED]} | 出错 {n[ERROR]}")
+        gbk = sum(1 for e in (v.get('encoding') for v in index.values()) if e == 'gbk')
+        if gbk: print(f"   ⚠️ {gbk} 个CSV需回退 gbk 编码解析")
+        for status in (ERROR, SKIPPED):
+            top = Counter(df.loc[df['状态'] == status, '原因']).most_common(3)
+            if top: print(f"   {status}原因: " + " | ".join(f"{r} ×{k}" for r, k in top))
+    return df
@@ -0,0 +1,153 @@
+import os
+import json
+import hashlib
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# 指标磁盘缓存：按 (代码, 指标, 参数, 数据指纹) 存储整段指标序列
+# 1. [命中]：行情未变直接读回，不再重算 RSI/KDJ/均线/回撤
+# 2. [追加]：新行情只在末尾追加K线（前缀指纹一致）时，只补算新增的几行：
+#    有限窗口指标（rolling）取最后 lookback 行重算，EWM 类指标从缓存的递推状态接着算
+# 3. [淘汰]：缓存目录超过 MAX_CACHE_BYTES 时按最近访问时间（LRU）删除
+# ==============================================================================
+
+CACHE_DIR = '.indicator_cache'
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+CACHE_ENABLED = os.environ.get('INDICATOR_CACHE', '1') != '0'  # 置 0 时每次全量计算，不读写磁盘
+
+# compute(df, seed, start, **params) -> (列字典, 递推状态)
+#   seed 为 None 时对整段 df 全量计算；否则 df 为“lookback 行预热 + 新增行”，
+#   只有 start 之后的行需要有效结果，EWM 从 seed 状态接着递推
+IndicatorSpec = namedtuple('IndicatorSpec', ['name', 'inputs', 'lookback', 'compute'])
+
+# ------------------------------------------------------------------------------
+# EWM 递推：逐点复刻 pandas ewm(adjust=False, ignore_na=False) 的计算顺序，
+# 保证“全量 pandas 计算”与“从状态接着算”逐位一致
+# ------------------------------------------------------------------------------
+def _ewm_com(com=None, alpha=None):
+    """与 pandas 一致：alpha 先换算成 com，递推时再用 1/(1+com) 还原"""
+    return com if alpha is None else (1 - alpha) / alpha
+
+def ewm_state(values, out, com):
+    """从 pandas 全量结果推出末端递推状态 (weighted, old_wt)"""
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0: return [float('nan'), 1.0]
+    weighted = float(np.asarray(out, dtype=float)[-1])
+    obs = np.flatnonzero(~np.isnan(values))
+    old_wt = 1.0
+    if len(obs) and not np.isnan(weighted):
+        factor = 1.0 - 1.0 / (1.0 + com)
+        for _ in range(len(values) - 1 - obs[-1]): old_wt *= factor
+    return [weighted, old_wt]
+
+def ewm_step(state, cur, com):
+    """单点递推一步，原地更新 state=[weighted, old_wt] 并返回新的均值"""
+    weighted, old_wt = state
+    if weighted == weighted:
+        alpha = 1.0 / (1.0 + com)
+        old_wt *= 1.0 - alpha
+        if cur == cur:
+            if weighted != cur:
+                weighted = old_wt * weighted + alpha * cur
+                weighted = weighted / (old_wt + alpha)
+            old_wt = 1.0
+    elif cur == cur:
+        weighted = cur
+    state[0], state[1] = weighted, old_wt
+    return weighted
+
+def ewm_continue(values, state, com):
+    """从状态 (weighted, old_wt) 开始继续递推，返回 (新结果数组, 新状态)"""
+    state = list(state)
+    out = np.empty(len(values))
+    for i, cur in enumerate(np.asarray(values, dtype=float)):
+        out[i] = ewm_step(state, float(cur), com)
+    return out, state
+
+def ewm_mean(values, com=None, alpha=None, seed=None):
+    """等价于 Series.ewm(com/alpha, adjust=False).mean()；seed 非空时从状态接着递推"""
+    com = _ewm_com(com, alpha)
+    if seed is None:
+        out = pd.Series(values, dtype=float).ewm(com=com, adjust=False).mean().to_numpy()
+        return out, ewm_state(values, out, com)
+    return ewm_continue(values, seed, com)
+
+# ------------------------------------------------------------------------------
+# 缓存读写
+# ------------------------------------------------------------------------------
+def _fingerprint(arrays, n):
+    h = hashlib.sha1()
+    for a in arrays:
+        a = a[:n]
+        if a.dtype == object: a = a.astype(str)
+        h.update(np.ascontiguousarray(a).tobytes())
+    return h.hexdigest()
+
+def _param_tag(params):
+    if not params: return 'default'
+    return hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()[:10]
+
+def _cache_path(code, spec, params, cache_dir):
+    return os.path.join(cache_dir, str(code), f"{spec.name}-{_param_tag(params)}.npz")
+
+def _load_entry(path):
+    if not os.path.exists(path): return None
+    try:
+        with np.load(path, allow_pickle=False) as z:
+            meta = json.loads(str(z['__meta__']))
+            cols = {k: z[k] for k in z.files if k != '__meta__'}
+        return meta, cols
+    except Exception:
+        return None
+
+def _save_entry(path, meta, cols):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, __meta__=np.array(json.dumps(meta)), **cols)
+    os.replace(tmp, path)
+
+def get_indicators(code, df, spec, cache_dir=CACHE_DIR, **params):
+    """返回与 df 行对齐的指标列字典；命中/追加/全量重算对调用方透明"""
+    if not CACHE_ENABLED: return spec.compute(df, None, 0, **params)[0]
+    inputs = [df[c].to_numpy() for c in spec.inputs]
+    n = len(df)
+    path = _cache_path(code, spec, params, cache_dir)
+    entry = _load_entry(path)
+    if entry is not None:
+        meta, cols = entry
+        n_old = meta['n']
+        if 0 < n_old <= n and meta['params'] == params and meta['fingerprint'] == _fingerprint(inputs, n_old):
+            if n_old == n:
+                os.utime(path)  # 记录访问时间，供 LRU 淘汰
+                return cols
+            k = n - n_old
+            tail = df.iloc[max(0, n_old - spec.lookback):]
+            new_cols, state = spec.compute(tail, meta['state'], len(tail) - k, **params)
+            cols = {c: np.concatenate([cols[c], np.asarray(new_cols[c])[-k:]]) for c in cols}
+            _save_entry(path, {'n': n, 'params': params, 'fingerprint': _fingerprint(inputs, n), 'state': state}, cols)
+            return cols
+
+    cols, state = spec.compute(df, None, 0, **params)
+    cols = {c: np.asarray(v, dtype=float) for c, v in cols.items()}
+    _save_entry(path, {'n': n, 'params': params, 'fingerprint': _fingerprint(inputs, n), 'state': state}, cols)
+    return cols
+
+def prune_cache(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """总大小超限时按访问时间从旧到新删除，返回删除的文件数"""
+    if not os.path.isdir(cache_dir): return 0
+    files = []
+    for root, _, names in os.walk(cache_dir):
+        for name in names:
+            p = os.path.join(root, name)
+            st = os.stat(p)
+            files.append((st.st_mtime, st.st_size, p))
+    total = sum(s for _, s, _ in files)
+    removed = 0
+    for _, size, p in sorted(files):
+        if total <= max_bytes: break
+        os.remove(p)
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,106 @@
+import os
+import glob
+import pickle
+import shutil
+import tempfile
+import resource
+from multiprocessing import Pool, cpu_count
+import run_profile
+import fund_outcomes
+
+# ==============================================================================
+# 内存受限执行：给整条流水线一个常驻内存预算，按固定大小的代码块分批处理
+# 1. [预算]：MEM_BUDGET_MB>0 开启；工作进程数按 (预算 - 主进程常驻) / WORKER_MB 估算，至少 1 个
+#    作用于进程池扇出（扫描器 SCAN_MODE=full、backtest_engine、engine_core）；stream 模式本就在主进程逐只推进
+# 2. [分块派发]：代码切成 CHUNK_SIZE 只一块，imap_unordered 乱序回收；工作进程处理 MAX_TASKS_PER_CHILD 块后重启，归还碎片内存
+# 3. [落盘]：每块结果到达即写入 .scan_state/spool/，主进程不累积结果列表；读回时按块号恢复原顺序，输出与常规模式一致
+# 4. [紧凑类型]：开启后工作进程读取的行情成交量降为 int32（price_store.COMPACT_DTYPES），
+#    胜率账本按需缓存的收盘价保持矩阵中的 float32 原值、用时再还原
+# ==============================================================================
+
+MEM_BUDGET_MB = float(os.environ.get('MEM_BUDGET_MB', '0') or 0)   # 0 表示不限，走常规模式
+ENABLED = MEM_BUDGET_MB > 0
+CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', '32'))          # 每个任务的代码数
+IMAP_CHUNKSIZE = int(os.environ.get('IMAP_CHUNKSIZE', '1'))   # imap_unordered 每次派给工作进程的任务数
+WORKER_MB = float(os.environ.get('WORKER_MB', '150'))         # 单个工作进程的常驻内存估计（解释器 + pandas + 热页）
+MAX_TASKS_PER_CHILD = 16
+SPOOL_DIR = os.path.join('.scan_state', 'spool')
+
+def rss_mb():
+    """当前进程的常驻内存（MB）；非 Linux 平台退回峰值常驻"""
+    try:
+        with open('/proc/self/statm') as f: pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def n_workers(budget=None):
+    """预算扣除主进程当前常驻后还能容纳的工作进程数，不超过 CPU 数"""
+    budget = budget or MEM_BUDGET_MB
+    return max(1, min(cpu_count(), int((budget - rss_mb()) // WORKER_MB)))
+
+def code_chunks(items, size=CHUNK_SIZE):
+    """固定大小切块（与 price_store.chunk_codes 的“切成 N 段”不同，块数随品种数增长，单块内存不变）"""
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+class Spool:
+    """按块号落盘的结果序列：add() 写入一块，chunks()/遍历时按块号顺序逐块读回"""
+    def __init__(self, name, spool_dir=SPOOL_DIR):
+        os.makedirs(spool_dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(spool_dir, f'{name}_*')):  # 上次异常退出遗留的暂存
+            shutil.rmtree(stale, ignore_errors=True)
+        self.dir = tempfile.mkdtemp(prefix=f'{name}_', dir=spool_dir)
+        self.n_chunks = 0
+
+    def add(self, idx, payload):
+        with open(os.path.join(self.dir, f'{idx:08d}.pkl'), 'wb') as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.n_chunks += 1
+
+    def chunks(self):
+        for path in sorted(glob.glob(os.path.join(self.dir, '*.pkl'))):
+            with open(path, 'rb') as f: yield pickle.load(f)
+
+    def __iter__(self):
+        for chunk in self.chunks(): yield from chunk
+
+    def field(self, key):
+        """每块结果为字典时，按块号顺序逐块取出 chunk[key] 中的记录"""
+        for chunk in self.chunks(): yield from chunk[key]
+
+    def close(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+class _Indexed:
+    """工作进程入口包装：(块号, 参数) -> (块号, func(参数))，乱序回收后仍能按块号排序"""
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, arg):
+        idx, task = arg
+        return idx, self.func(task)
+
+def run_chunks(func, tasks, name, budget=None):
+    """受限模式的进程池扇出
+
+    func(任务) 与各引擎的块入口一致，返回 (结果, 逐品种处理结果[, 其他...])；结果逐块写入 Spool，
+    处理结果并入 fund_outcomes，其余返回值收集成列表。返回 (spool, 其他返回值列表)。
+    """
+    spool, extras = Spool(name), []
+    workers = n_workers(budget)
+    peak, warned = rss_mb(), False
+    print(f"🧱 内存受限模式：预算 {budget or MEM_BUDGET_MB:.0f}MB，{workers} 个工作进程，{len(tasks)} 块")
+    # 重启的工作进程从主进程 fork，先清空继承来的处理结果记录，避免重复回传
+    with Pool(workers, initializer=fund_outcomes.drain, maxtasksperchild=MAX_TASKS_PER_CHILD) as p:
+        chunks = p.imap_unordered(run_profile.task(_Indexed(func)), list(enumerate(tasks)), chunksize=IMAP_CHUNKSIZE)
+        for idx, res in run_profile.results(chunks):
+            spool.add(idx, res[0])
+            fund_outcomes.extend(res[1])
+            if len(res) > 2: extras.append(res[2:])
+            peak = max(peak, rss_mb())
+            if peak > (budget or MEM_BUDGET_MB) and not warned:
+                print(f"⚠️ 主进程常驻 {peak:.0f}MB 已超出预算，可调小 CHUNK_SIZE")
+                warned = True
+    print(f"   主进程常驻峰值 {peak:.0f}MB，结果暂存于 {spool.dir}")
+    return spool, extras
@@ -0,0 +1,250 @@
+import glob
+import argparse
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from concurrent.futures import ProcessPoolExecutor
+import price_store
+import indicator_cache
+import backtest_engine
+import etf_grid_hunter
+import strategy_engine
+
+# ==============================================================================
+# 组合级逐日模拟器：把任一引擎的历史买点放进同一个资金账户里按天回放
+# 1. [资金约束]：总投入不超过 TOTAL_BUDGET_CAP，单笔固定 PORTFOLIO_UNIT，持仓平均亏损超
+#    STOP_BUY_LOSS_RATIO 时当日禁买（与 strategy_engine 的 README 风控口径一致）
+# 2. [离场规则]：复刻 strategy_engine.update_readme 中 decide_sell 的两条止盈规则
+# 3. [数据布局]：收盘价为 (日期 × 代码) 对齐矩阵，每日只做向量运算，不逐只基金切 DataFrame
+# 4. [输出]：资金曲线（含回撤、换手）与逐笔交易明细
+# ==============================================================================
+
+TOTAL_BUDGET_CAP = strategy_engine.TOTAL_BUDGET_CAP
+PORTFOLIO_UNIT = strategy_engine.PORTFOLIO_UNIT
+STOP_BUY_LOSS_RATIO = strategy_engine.STOP_BUY_LOSS_RATIO
+TAKE_PROFIT = 5.0      # 浮盈超过 5% 后才启用两条离场规则
+GIVEBACK = 3.0         # 利润回吐 3 个百分点离场
+MIN_BARS = 60          # 扫描器要求的最少K线数
+MIN_PRICE = 0.05       # 低于该价格的K线不建仓（前复权早期价格会被压到接近 0）
+EQUITY_FILE = 'portfolio_equity.csv'
+TRADES_FILE = 'portfolio_trades.csv'
+
+# ------------------------------------------------------------------------------
+# 信号源：每只基金返回 (信号日期数组, 评分数组)，评分越高越优先买入
+# ------------------------------------------------------------------------------
+def backtest_signals(code):
+    """backtest_engine 的评分买点；不需要前向收益，保留到最后一根K线"""
+    df = backtest_engine.load_backtest_frame(code)
+    if df is None: return None
+    idx = backtest_engine.scan_signals(df, horizon=0)
+    return df['日期'].to_numpy()[idx].astype('datetime64[D]'), 100 - df['RSI'].to_numpy(dtype=float)[idx]
+
+def grid_signals(code):
+    """etf_grid_hunter 的建议买入（RSI < 43），RSI 越低越优先"""
+    df = price_store.load_fund(code)
+    if df is None or len(df) < MIN_BARS: return None
+    rsi = indicator_cache.get_indicators(code, df, etf_grid_hunter.GRID_SPEC)['RSI']
+    mask = (np.arange(len(df)) >= MIN_BARS - 1) & (rsi < 43)
+    return df['日期'].to_numpy()[mask].astype('datetime64[D]'), 100 - rsi[mask]
+
+def strategy_signals(code):
+    """strategy_engine 观察池信号：逐日复刻流动性过滤、回撤观察与 build_signal 评分"""
+    df = price_store.load_fund(code)
+    if df is None or len(df) < MIN_BARS: return None
+    ind = indicator_cache.get_indicators(code, df, strategy_engine.SCAN_SPEC)
+    n = len(df)
+    close, rsi6 = df['收盘'].to_numpy(dtype=float), ind['rsi6']
+    mask = (np.arange(n) >= MIN_BARS - 1) & ind['in_watch'].astype(bool)
+    if '成交额' in df.columns:
+        mask &= ~(df['成交额'].rolling(5, min_periods=1).mean().to_numpy() < strategy_engine.LIQUIDITY_LIMIT)
+
+    # 强力底背离：第 t 天与其前 20 根K线中的最低收盘比较
+    divergence = np.zeros(n, dtype=bool)
+    if n > 20:
+        m = np.argmin(sliding_window_view(close, 21)[:, :20], axis=1) + np.arange(n - 20)
+        t = np.arange(20, n)
+        divergence[20:] = (close[t] < close[m] * 0.99) & (rsi6[t] > rsi6[m] + 5)
+    score = (1 + 2 * ((rsi6 < 30) & (ind['rsi14'] < 40)) + 2 * ((ind['bias6'] < -5) & (ind['bias20'] < -7))
+             + 2 * divergence)
+    return df['日期'].to_numpy()[mask].astype('datetime64[D]'), score[mask].astype(float)
+
+SOURCES = {'backtest': backtest_signals, 'grid': grid_signals, 'strategy': strategy_signals}
+
+def csv_signals(pattern):
+    """读取已落盘的扫描结果（sig_*.csv / scan_*.csv），只保留买入信号"""
+    frames = []
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        try: df = pd.read_csv(path, dtype={'fund_code': str, '代码': str})
+        except: continue
+        df = df.rename(columns={'date': '日期', 'fund_code': '代码'})
+        if '日期' not in df.columns or '代码' not in df.columns: continue
+        if 'is_signal' in df.columns: df = df[df['is_signal'].astype(str) == 'True']
+        if '评分' in df.columns: score = df['评分']
+        elif 'RSI' in df.columns: score = 100 - df['RSI']
+        else: score = pd.Series(0.0, index=df.index)
+        frames.append(pd.DataFrame({'日期': pd.to_datetime(df['日期']).to_numpy().astype('datetime64[D]'),
+                                    '代码': df['代码'].str.zfill(6), '评分': score.to_numpy(dtype=float)}))
+    return pd.concat(frames) if frames else pd.DataFrame(columns=['日期', '代码', '评分'])
+
+def signal_matrix(source, dates, codes):
+    """把信号摊到 (日期 × 代码) 评分矩阵上，无信号处为 NaN"""
+    scores = np.full((len(dates), len(codes)), np.nan)
+    if source in SOURCES:
+        with ProcessPoolExecutor() as executor:
+            results = executor.map(SOURCES[source], codes, chunksize=16)
+            for j, res in enumerate(results):
+                if res is None or len(res[0]) == 0: continue
+                scores[np.searchsorted(dates, res[0]), j] = res[1]
+    else:
+        col = {c: j for j, c in enumerate(codes)}
+        sig = csv_signals(source)
+        sig = sig[sig['代码'].isin(col)]
+        rows = np.searchsorted(dates, sig['日期'].to_numpy())
+        ok = (rows < len(dates)) & (dates[np.minimum(rows, len(dates) - 1)] == sig['日期'].to_numpy())
+        scores[rows[ok], sig['代码'].map(col).to_numpy()[ok]] = sig['评分'].to_numpy()[ok]
+    return scores
+
+def compact_rolling_mean(mat, window):
+    """按每只基金自身的交易日做滚动均值（跳过矩阵中的停牌/未上市空档）"""
+    out = np.full(mat.shape, np.nan)
+    for j in range(mat.shape[1]):
+        rows = np.flatnonzero(~np.isnan(mat[:, j]))
+        if len(rows) >= window:
+            out[rows, j] = pd.Series(mat[rows, j]).rolling(window).mean().to_numpy()
+    return out
+
+# ------------------------------------------------------------------------------
+# 逐日撮合：先按 decide_sell 离场，再按评分从高到低在预算内买入，均以当日收盘价成交
+# ------------------------------------------------------------------------------
+def tradable_columns(close):
+    """区间内前复权价格始终为正的基金；出现过 <=0 的价格说明复权序列已失真，整只不参与"""
+    return ~(close <= 0).any(axis=0)
+
+def simulate(dates, codes, close, scores, budget=TOTAL_BUDGET_CAP, unit=PORTFOLIO_UNIT, stop_buy=STOP_BUY_LOSS_RATIO):
+    T, N = close.shape
+    ma5, ma10 = compact_rolling_mean(close, 5), compact_rolling_mean(close, 10)
+    mark = np.maximum(pd.DataFrame(close).ffill().to_numpy(), 0)  # 停牌日按最后收盘价估值，市值不为负
+    tradable = tradable_columns(close)
+
+    held = np.zeros(N, dtype=bool)
+    shares, entry, peak = np.zeros(N), np.zeros(N), np.zeros(N)
+    bars = np.zeros(N, dtype=int)
+    entry_day = np.zeros(N, dtype=int)
+    cash, cost_open = float(budget), 0.0
+    equity_rows, trades = [], []
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for t in range(T):
+            px = close[t]
+            traded = ~np.isnan(px)
+            live = held & traded
+            bars[live] += 1
+            peak[live] = np.maximum(peak[live], px[live])
+
+            profit = (px - entry) / entry * 100
+            max_profit = (peak - entry) / entry * 100
+            # get_performance_stats 的均线从建仓日起算，满 10 根K线才有 MA10
+            dead_cross = (bars >= 10) & (ma5[t] < ma10[t])
+            reversal = live & (profit >= TAKE_PROFIT) & dead_cross
+            giveback = live & (max_profit > TAKE_PROFIT) & (profit < max_profit - GIVEBACK)
+            sold = reversal | giveback
+            sell_amount = 0.0
+            for j in np.flatnonzero(sold):
+                proceeds = shares[j] * px[j]
+                cash += proceeds
+                cost_open -= shares[j] * entry[j]
+                sell_amount += proceeds
+                trades.append({'代码': codes[j], '买入日期': dates[entry_day[j]], '买入价': entry[j],
+                               '卖出日期': dates[t], '卖出价': px[j], '持有天数': int(bars[j]),
+                               '收益%': round(profit[j], 2), '卖出原因': '趋势反转' if reversal[j] else '利润回吐'})
+            held &= ~sold
+
+            # 禁买令：持仓平均浮亏触及阈值
+            open_ret = (mark[t, held] - entry[held]) / entry[held] * 100
+            blocked = bool(held.any() and open_ret.mean() <= stop_buy)
+
+            buy_amount = 0.0
+            if not blocked:
+                # 前复权早期价格可能为负或接近 0，这类K线与复权失真的基金不允许建仓
+                cand = np.flatnonzero(~np.isnan(scores[t]) & tradable & (px >= MIN_PRICE) & ~held & ~sold)
+                for j in cand[np.argsort(-scores[t, cand], kind='stable')]:
+                    if cost_open + unit > budget + 1e-9 or cash < unit - 1e-9: break
+                    held[j], entry[j], peak[j], shares[j] = True, px[j], px[j], unit / px[j]
+                    bars[j], entry_day[j] = 1, t
+                    cash -= unit
+                    cost_open += unit
+                    buy_amount += unit
+
+            value = float((shares[held] * mark[t, held]).sum())
+            equity_rows.append({'日期': dates[t], '现金': cash, '持仓市值': value, '总资产': cash + value,
+                                '持仓数': int(held.sum()), '买入额': buy_amount, '卖出额': sell_amount, '禁买': blocked})
+
+    for j in np.flatnonzero(held):
+        trades.append({'代码': codes[j], '买入日期': dates[entry_day[j]], '买入价': entry[j],
+                       '卖出日期': None, '卖出价': mark[-1, j], '持有天数': int(bars[j]),
+                       '收益%': round((mark[-1, j] - entry[j]) / entry[j] * 100, 2), '卖出原因': '持有中'})
+
+    equity = pd.DataFrame(equity_rows)
+    if not equity.empty:
+        if (equity['总资产'] < -1e-6).any():
+            bad = equity.loc[equity['总资产'] < -1e-6, '日期'].iloc[0]
+            raise ValueError(f"资金曲线在 {bad} 出现负值，请检查价格数据")
+        equity['日期'] = pd.to_datetime(equity['日期'])
+        equity['回撤%'] = ((equity['总资产'] / equity['总资产'].cummax() - 1) * 100).round(2)
+    return equity, pd.DataFrame(trades)
+
+def summarize(equity, trades, budget=TOTAL_BUDGET_CAP):
+    """总收益、年化、最大回撤、年化换手与交易胜率"""
+    if equity.empty: return {}
+    years = max((equity['日期'].iloc[-1] - equity['日期'].iloc[0]).days / 365.25, 1e-9)
+    final = equity['总资产'].iloc[-1]
+    closed = trades[trades['卖出原因'] != '持有中'] if not trades.empty else trades
+    turnover = (equity['买入额'].sum() + equity['卖出额'].sum()) / 2 / equity['总资产'].mean() / years
+    return {
+        '区间': f"{equity['日期'].iloc[0]:%Y-%m-%d} ~ {equity['日期'].iloc[-1]:%Y-%m-%d}",
+        '期末资产': round(final, 2),
+        '总收益%': round((final / budget - 1) * 100, 2),
+        '年化收益%': round(((final / budget) ** (1 / years) - 1) * 100, 2),
+        '最大回撤%': round(equity['回撤%'].min(), 2),
+        '年化换手': round(turnover, 2),
+        '平仓笔数': len(closed),
+        '胜率%': round((closed['收益%'] > 0).mean() * 100, 2) if len(closed) else np.nan,
+        '平均持有天数': round(closed['持有天数'].mean(), 1) if len(closed) else np.nan,
+        '禁买天数%': round(equity['禁买'].mean() * 100, 2),
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='组合级逐日模拟：资金上限、单笔金额、禁买令与止盈离场')
+    parser.add_argument('--source', default='strategy',
+                        help='信号源：strategy / grid / backtest，或已落盘信号的 glob，如 "202*/**/sig_*.csv"')
+    parser.add_argument('--start', help='起始日期 YYYY-MM-DD')
+    parser.add_argument('--end', help='结束日期 YYYY-MM-DD')
+    parser.add_argument('--budget', type=float, default=TOTAL_BUDGET_CAP, help='总投入上限')
+    parser.add_argument('--unit', type=float, default=PORTFOLIO_UNIT, help='单笔买入金额')
+    parser.add_argument('--stop-buy', type=float, default=STOP_BUY_LOSS_RATIO, help='持仓平均亏损达到该百分比时禁买')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    price_store.build_store(price_store.DATA_DIR)
+    dates, codes, mats = price_store.load_matrix(('close',))
+    scores = signal_matrix(args.source, dates, codes)
+
+    keep = np.ones(len(dates), dtype=bool)
+    if args.start: keep &= dates >= np.datetime64(args.start)
+    if args.end: keep &= dates <= np.datetime64(args.end)
+    n_bad = int((~tradable_columns(mats['close'][keep])).sum())
+    if n_bad: print(f"⚠️ {n_bad} 只基金区间内前复权价格出现非正值，不参与建仓")
+    equity, trades = simulate(dates[keep], codes, mats['close'][keep], scores[keep],
+                              budget=args.budget, unit=args.unit, stop_buy=args.stop_buy)
+    if equity.empty:
+        print("所选区间内没有行情")
+        return
+    equity.to_csv(EQUITY_FILE, index=False, encoding='utf-8-sig')
+    trades.to_csv(TRADES_FILE, index=False, encoding='utf-8-sig')
+    print(f"💼 组合模拟 [{args.source}] 资金曲线 -> {EQUITY_FILE}，交易明细 -> {TRADES_FILE}")
+    for k, v in summarize(equity, trades, args.budget).items(): print(f"   {k}: {v}")
+    indicator_cache.prune_cache()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+import os
+import re
+import json
+import glob
+import hashlib
+import time
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# 列式行情仓库：把 fund_data/*.csv 编译成可内存映射的 NumPy 列文件
+# 1. [存储格式]：每个字段一个 .npy（全部基金首尾相接），index.json 记录每只基金的行区间
+# 2. [增量编译]：仅对 mtime/大小变化且内容哈希也变化的 CSV 重新解析
+# 3. [读取方式]：工作进程 mmap 打开列文件后按行区间切片，不再逐个解析文本
+# 4. [全市场矩阵]：按交易日并集对齐的 (日期 × 代码) 矩阵落盘为 memmap，
+#    多进程扇出时各进程自行映射同一份文件，任务只传代码列表，不再跨进程序列化行情
+# 5. [隔离]：解析失败的 CSV 连同原因登记在 index.json 的 quarantine 中，内容不变就不再重复解析
+# ==============================================================================
+
+DATA_DIR = 'fund_data'
+STORE_DIR = '.fund_store'
+INDEX_FILE = 'index.json'
+STORE_VERSION = 1
+
+# 字段名 -> (CSV列名, 存储类型)；价格用 float32，成交额含小数且量级过亿，保留 float64
+FIELDS = {
+    'date':   ('日期', 'datetime64[D]'),
+    'open':   ('开盘', 'float32'),
+    'close':  ('收盘', 'float32'),
+    'high':   ('最高', 'float32'),
+    'low':    ('最低', 'float32'),
+    'volume': ('成交量', 'int64'),
+    'amount': ('成交额', 'float64'),
+}
+PRICE_FIELDS = ['open', 'close', 'high', 'low']
+PRICE_DECIMALS = 4  # float32 还原到4位小数即可与 CSV 原值逐位一致
+MATRIX_DIR = 'matrix'  # 仓库下的子目录
+# 矩阵字段 -> 存储类型；NaN 表示该日未上市/停牌/已退市，因此成交量也以浮点保存
+MATRIX_FIELDS = {'close': 'float32', 'high': 'float32', 'low': 'float32', 'volume': 'float64', 'amount': 'float64'}
+
+# 内存受限模式（memory_budget）下 load_fund 把成交量降为 int32；价格仍还原为 float64，保证指标逐位一致
+COMPACT_DTYPES = float(os.environ.get('MEM_BUDGET_MB', '0') or 0) > 0
+
+_STORE_CACHE = {}
+_MATRIX_CACHE = {}
+
+def code_from_path(file_path):
+    """从文件名或代码字符串中提取6位基金代码"""
+    name = os.path.splitext(os.path.basename(str(file_path)))[0]
+    m = re.search(r'(\d{6})', name)
+    return m.group(1) if m else name.zfill(6)
+
+def parse_fund_csv(file_path):
+    """解析单个行情CSV：编码兜底、净值类文件改名、按日期排序
+
+    返回 (DataFrame, 实际使用的编码, 失败原因)；表头缺少日期/收盘列时 DataFrame 为 None。
+    """
+    encoding = 'utf-8-sig'
+    try: df = pd.read_csv(file_path, encoding=encoding)
+    except UnicodeDecodeError:
+        encoding = 'gbk'
+        df = pd.read_csv(file_path, encoding=encoding)
+    df.columns = [str(c).strip() for c in df.columns]
+    if 'net_value' in df.columns: df = df.rename(columns={'date': '日期', 'net_value': '收盘'})
+    if '日期' not in df.columns or '收盘' not in df.columns: return None, encoding, '缺少日期/收盘列'
+    df['日期'] = pd.to_datetime(df['日期'])
+    return df.sort_values('日期').reset_index(drop=True), encoding, ''
+
+def read_fund_csv(file_path):
+    return parse_fund_csv(file_path)[0]
+
+def _to_columns(df):
+    """DataFrame -> 字段数组；缺失的价格列填 NaN，缺失的成交量填 0"""
+    n = len(df)
+    cols = {}
+    for field, (cn, dtype) in FIELDS.items():
+        if cn in df.columns:
+            values = df[cn].to_numpy()
+        elif field == 'volume':
+            values = np.zeros(n)
+        else:
+            values = np.full(n, np.nan)
+        if field == 'volume':
+            values = np.nan_to_num(np.asarray(values, dtype=float)).astype(np.int64)
+        cols[field] = np.asarray(values).astype(dtype)
+    return cols
+
+def _is_lossless(df, cols):
+    """检查 float32 存储再按位数还原后是否与原值完全一致"""
+    for field in PRICE_FIELDS:
+        cn = FIELDS[field][0]
+        if cn not in df.columns: continue
+        orig = df[cn].to_numpy(dtype=float)
+        back = np.round(cols[field].astype(float), PRICE_DECIMALS)
+        if not np.array_equal(back, orig, equal_nan=True): return False
+    return True
+
+def _file_sha1(file_path):
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''): h.update(chunk)
+    return h.hexdigest()
+
+def _read_index(store_dir):
+    path = os.path.join(store_dir, INDEX_FILE)
+    empty = {'version': STORE_VERSION, 'codes': {}, 'quarantine': {}}
+    if not os.path.exists(path): return empty
+    try:
+        with open(path, encoding='utf-8') as f: index = json.load(f)
+    except (OSError, ValueError):
+        return empty
+    if index.get('version') != STORE_VERSION: return empty
+    index.setdefault('quarantine', {})
+    return index
+
+def _load_columns(store_dir, mmap=True):
+    cols = {}
+    for field in FIELDS:
+        path = os.path.join(store_dir, f'{field}.npy')
+        if not os.path.exists(path): return None
+        cols[field] = np.load(path, mmap_mode='r' if mmap else None)
+    return cols
+
+def build_store(data_dir=DATA_DIR, store_dir=STORE_DIR, verbose=True):
+    """增量编译列式仓库，返回 {'new': n, 'reused': n, 'removed': n, 'failed': n, 'quarantined': n}
+
+    failed 为本次新解析失败的文件数，quarantined 为内容未变、直接沿用隔离记录跳过的文件数。
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    index = _read_index(store_dir)
+    old_entries = index['codes']
+    old_quarantine = index['quarantine']
+    old_cols = _load_columns(store_dir) if old_entries else None
+    if old_cols is None: old_entries = {}
+
+    entries, parts, quarantine = {}, [], {}
+    stats = {'new': 0, 'reused': 0, 'removed': 0, 'failed': 0, 'quarantined': 0}
+    files = sorted(glob.glob(os.path.join(data_dir, '*.csv')))
+    seen = set()
+    for file_path in files:
+        code = code_from_path(file_path)
+        seen.add(code)
+        st = os.stat(file_path)
+        old = old_entries.get(code)
+        entry = {'file': file_path, 'mtime': st.st_mtime, 'size': st.st_size}
+        sha1 = None
+        bad = old_quarantine.get(code)
+        if bad is not None and old is None:
+            # 已隔离的坏文件：大小与内容哈希都没变就直接跳过，不再解析
+            if (bad['mtime'], bad['size']) != (st.st_mtime, st.st_size):
+                sha1 = _file_sha1(file_path) if bad['size'] == st.st_size else ''
+            if sha1 is None or sha1 == bad['sha1']:
+                quarantine[code] = dict(bad, mtime=st.st_mtime)
+                stats['quarantined'] += 1
+                continue
+        reuse = old is not None
+        if reuse and (old['mtime'] != st.st_mtime or old['size'] != st.st_size):
+            sha1 = _file_sha1(file_path)
+            reuse = sha1 == old.get('sha1')
+        if reuse:
+            for k in ('sha1', 'lossless', 'encoding', 'parse_s'):
+                if k in old: entry[k] = old[k]
+            entry.setdefault('lossless', True)
+            parts.append((code, entry, {f: old_cols[f][old['start']:old['stop']] for f in FIELDS}))
+            stats['reused'] += 1
+            continue
+
+        entry['sha1'] = sha1 or _file_sha1(file_path)
+        t0 = time.perf_counter()
+        encoding, reason = '', ''
+        try:
+            df, encoding, reason = parse_fund_csv(file_path)
+        except Exception as e:
+            df, reason = None, f'{type(e).__name__}: {str(e)[:200]}'
+        if df is None:
+            quarantine[code] = dict(entry, reason=reason, encoding=encoding)
+            stats['failed'] += 1
+            continue
+        entry['encoding'] = encoding
+        entry['parse_s'] = round(time.perf_counter() - t0, 4)
+        cols = _to_columns(df)
+        # 精度无法无损保存的品种只登记不入库，读取时回退解析原始CSV
+        entry['lossless'] = _is_lossless(df, cols)
+        if not entry['lossless']: cols = {f: a[:0] for f, a in cols.items()}
+        parts.append((code, entry, cols))
+        stats['new'] += 1
+    stats['removed'] = len(set(old_entries) - seen)
+
+    if stats['new'] or {code for code, _, _ in parts} != set(old_entries):
+        offset = 0
+        merged = {f: [] for f in FIELDS}
+        for code, entry, cols in parts:
+            n = len(cols['date'])
+            entry['start'], entry['stop'] = offset, offset + n
+            offset += n
+            entries[code] = entry
+            for f in FIELDS: merged[f].append(np.asarray(cols[f]))
+        for f, (_, dtype) in FIELDS.items():
+            arr = np.concatenate(merged[f]) if merged[f] else np.empty(0, dtype=dtype)
+            tmp = os.path.join(store_dir, f'{f}.tmp.npy')
+            np.save(tmp, arr.astype(dtype, copy=False))
+            os.replace(tmp, os.path.join(store_dir, f'{f}.npy'))
+    else:
+        # 内容未变，仅刷新 mtime 记录，避免下次重复计算哈希
+        for code, entry, _ in parts:
+            old = old_entries[code]
+            entry['start'], entry['stop'] = old['start'], old['stop']
+            entries[code] = entry
+
+    tmp = os.path.join(store_dir, INDEX_FILE + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': STORE_VERSION, 'codes': entries, 'quarantine': quarantine}, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(store_dir, INDEX_FILE))
+    _STORE_CACHE.pop(os.path.abspath(store_dir), None)
+
+    if verbose:
+        print(f"📦 行情仓库: 新编译 {stats['new']} | 复用 {stats['reused']} | 移除 {stats['removed']} | "
+              f"失败 {stats['failed']} | 隔离跳过 {stats['quarantined']}")
+        for code, bad in sorted(quarantine.items()):
+            if code not in old_quarantine or old_quarantine[code]['sha1'] != bad['sha1']:
+                print(f"   🚫 {code} 解析失败已隔离: {bad['reason']}")
+    build_matrix(store_dir, verbose=verbose)
+    return stats
+
+def open_store(store_dir=STORE_DIR):
+    """按进程缓存 mmap 句柄；index.json 变化后自动重新打开"""
+    key = os.path.abspath(store_dir)
+    path = os.path.join(store_dir, INDEX_FILE)
+    if not os.path.exists(path): return None
+    mtime = os.path.getmtime(path)
+    cached = _STORE_CACHE.get(key)
+    if cached and cached['mtime'] == mtime: return cached
+    cols = _load_columns(store_dir)
+    if cols is None: return None
+    index = _read_index(store_dir)
+    cached = {'mtime': mtime, 'index': index['codes'], 'quarantine': index['quarantine'], 'cols': cols}
+    _STORE_CACHE[key] = cached
+    return cached
+
+def list_codes(store_dir=STORE_DIR):
+    store = open_store(store_dir)
+    return sorted(store['index']) if store else []
+
+def quarantine_reason(code_or_path, store_dir=STORE_DIR):
+    """已隔离品种的失败原因，未隔离时返回空字符串"""
+    store = open_store(store_dir)
+    bad = store['quarantine'].get(code_from_path(code_or_path)) if store else None
+    return bad['reason'] if bad else ''
+
+def fingerprint(code_or_path, store_dir=STORE_DIR):
+    """某只基金原始CSV的内容哈希，行情有任何变化都会改变；不在仓库中时返回 None"""
+    store = open_store(store_dir)
+    entry = store['index'].get(code_from_path(code_or_path)) if store else None
+    return entry['sha1'] if entry else None
+
+def load_arrays(code_or_path, tail=None, store_dir=STORE_DIR):
+    """返回某只基金的字段数组（mmap 只读视图），不在仓库中时返回 None"""
+    store = open_store(store_dir)
+    if store is None: return None
+    entry = store['index'].get(code_from_path(code_or_path))
+    if entry is None or not entry.get('lossless', True): return None
+    start, stop = entry['start'], entry['stop']
+    if tail: start = max(start, stop - tail)
+    return {f: store['cols'][f][start:stop] for f in FIELDS}
+
+def _matrix_stamp(index):
+    """仓库内容指纹：任一品种的 CSV 哈希变化或品种增减都会触发矩阵重建"""
+    return hashlib.sha1(json.dumps(sorted((c, e['sha1']) for c, e in index.items())).encode()).hexdigest()
+
+def build_matrix(store_dir=STORE_DIR, verbose=True):
+    """把仓库编译为日期对齐的矩阵文件（列优先存储，单只基金的一列在磁盘上连续）"""
+    store = open_store(store_dir)
+    if store is None: return False
+    index = store['index']
+    mdir = os.path.join(store_dir, MATRIX_DIR)
+    meta_path = os.path.join(mdir, 'meta.json')
+    stamp = _matrix_stamp(index)
+    if os.path.exists(meta_path):
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                if json.load(f).get('stamp') == stamp: return False
+        except (OSError, ValueError):
+            pass
+
+    codes = sorted(index)
+    series = {}
+    for code in codes:
+        entry = index[code]
+        if entry.get('lossless', True):
+            series[code] = {f: store['cols'][f][entry['start']:entry['stop']] for f in FIELDS}
+        else:
+            # 未入库的品种从原始CSV补齐，保证矩阵覆盖仓库登记的全部代码
+            df = read_fund_csv(entry['file'])
+            series[code] = _to_columns(df if df is not None else pd.DataFrame())
+    dates = np.unique(np.concatenate([s['date'] for s in series.values()] + [np.empty(0, dtype='datetime64[D]')]))
+
+    os.makedirs(mdir, exist_ok=True)
+    for f, dtype in MATRIX_FIELDS.items():
+        tmp = os.path.join(mdir, f'{f}.tmp.npy')
+        mat = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=(len(dates), len(codes)), fortran_order=True)
+        mat[:] = np.nan
+        for j, code in enumerate(codes):
+            s = series[code]
+            mat[np.searchsorted(dates, s['date']), j] = decode(f, s[f])
+        mat.flush()
+        del mat
+        os.replace(tmp, os.path.join(mdir, f'{f}.npy'))
+    np.save(os.path.join(mdir, 'dates.npy'), dates)
+    tmp = meta_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f: json.dump({'stamp': stamp, 'codes': codes}, f)
+    os.replace(tmp, meta_path)
+    _MATRIX_CACHE.pop(os.path.abspath(store_dir), None)
+    if verbose: print(f"🧮 全市场矩阵: {len(dates)} 个交易日 × {len(codes)} 只基金")
+    return True
+
+def open_matrix(store_dir=STORE_DIR):
+    """按进程缓存矩阵的 mmap 句柄：{'dates', 'codes', 'col': 代码->列号, 字段: (日期数, 代码数) 只读视图}"""
+    key = os.path.abspath(store_dir)
+    mdir = os.path.join(store_dir, MATRIX_DIR)
+    meta_path = os.path.join(mdir, 'meta.json')
+    if not os.path.exists(meta_path): return None
+    mtime = os.path.getmtime(meta_path)
+    cached = _MATRIX_CACHE.get(key)
+    if cached and cached['mtime'] == mtime: return cached
+    with open(meta_path, encoding='utf-8') as f: meta = json.load(f)
+    cached = {'mtime': mtime, 'dates': np.load(os.path.join(mdir, 'dates.npy')), 'codes': meta['codes'],
+              'col': {c: j for j, c in enumerate(meta['codes'])}}
+    for f in MATRIX_FIELDS: cached[f] = np.load(os.path.join(mdir, f'{f}.npy'), mmap_mode='r')
+    _MATRIX_CACHE[key] = cached
+    return cached
+
+def chunk_codes(codes, n_chunks):
+    """把代码列表切成约 n_chunks 段，供进程池分发；任务只携带代码字符串，行情由各进程自行 mmap 读取"""
+    codes = list(codes)
+    bounds = np.linspace(0, len(codes), min(n_chunks, len(codes)) + 1).astype(int) if codes else []
+    return [codes[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+def matrix_series(code, field='close', store_dir=STORE_DIR, raw=False):
+    """单只基金在矩阵中的有效日期与取值（跳过 NaN），不在矩阵中时返回 None；raw=True 时保留存储类型，由调用方 decode"""
+    m = open_matrix(store_dir)
+    j = m['col'].get(code_from_path(code)) if m else None
+    if j is None: return None
+    values = np.asarray(m[field][:, j]) if raw else decode(field, m[field][:, j])
+    valid = ~np.isnan(values)
+    return m['dates'][valid], values[valid]
+
+def load_matrix(fields=('close',), codes=None, store_dir=STORE_DIR):
+    """日期对齐的全市场矩阵
+
+    返回 (dates, codes, {字段: (日期数, 代码数) 的 float64 数组})；dates 为全部品种交易日的并集，
+    品种未上市、已退市或停牌的日期为 NaN。价格字段已按 decode 还原。
+    """
+    m = open_matrix(store_dir)
+    if m is None: return np.empty(0, dtype='datetime64[D]'), [], {f: np.empty((0, 0)) for f in fields}
+    codes = [c for c in (codes if codes is not None else m['codes']) if c in m['col']]
+    cols = [m['col'][c] for c in codes]
+    return m['dates'], codes, {f: decode(f, m[f][:, cols]) for f in fields}
+
+def decode(field, values):
+    """存储值 -> 计算用数值：价格还原为 float64 并按位数取整，日期保持 datetime64[D]"""
+    if field in PRICE_FIELDS: return np.round(np.asarray(values, dtype=np.float64), PRICE_DECIMALS)
+    if field == 'date': return np.asarray(values)
+    return np.asarray(values, dtype=np.float64)
+
+def load_fund(code_or_path, tail=None, store_dir=STORE_DIR):
+    """读取单只基金行情为 DataFrame（中文列名、日期已解析、按日期升序）
+
+    优先从列式仓库切片；仓库缺失或该品种未入库时回退解析 fund_data 下的原始CSV。
+    """
+    arrays = load_arrays(code_or_path, tail=tail, store_dir=store_dir)
+    if arrays is None:
+        file_path = code_or_path if str(code_or_path).endswith('.csv') else \
+            os.path.join(DATA_DIR, f'{code_from_path(code_or_path)}.csv')
+        if not os.path.exists(file_path) or quarantine_reason(file_path, store_dir): return None
+        df = read_fund_csv(file_path)
+        if df is None: return None
+        return df.tail(tail).reset_index(drop=True) if tail else df
+
+    data = {}
+    for field, (cn, _) in FIELDS.items():
+        values = arrays[field]
+        if field == 'date': values = values.astype('datetime64[ns]')
+        elif field == 'volume': values = compact_volume(values) if COMPACT_DTYPES else np.array(values)
+        else: values = decode(field, values)
+        data[cn] = values
+    return pd.DataFrame(data)
+
+def compact_volume(values):
+    """成交量降为 int32；超出 int32 范围时保留原类型"""
+    values = np.asarray(values)
+    if len(values) and np.abs(values).max() > np.iinfo(np.int32).max: return np.array(values)
+    return values.astype(np.int32)
+
+if __name__ == "__main__":
+    build_store()
@@ -0,0 +1,125 @@
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import price_store
+
+# ==============================================================================
+# 行情快照源：盘中扫描按“快照”消费报价，每个快照是一批 (代码, 最新价, 累计成交额)
+# 1. [接口]：QuoteSource.snapshots() 逐个产出 (时间, DataFrame[代码, 最新价, 成交额])，扫描端不关心数据从哪来
+# 2. [回放]：ReplaySource 读取本地报价文件（时间,代码,最新价,成交额），按时间分组回放，可按原节奏或全速
+# 3. [模拟]：FakeSource 以最新收盘价为起点随机游走生成报价，离线演练用
+# 4. [实盘]：AkshareSource 轮询东方财富 ETF/LOF 实时行情，只在交易日的交易时段内产出，收盘后结束；
+#    非交易日行情接口仍返回上一交易日的报价，直接不产出，避免被当作新K线
+# 5. [行情日期]：接口带“数据日期”列时保留为“日期”，扫描端据此丢弃不晚于已存K线的旧报价
+# ==============================================================================
+
+QUOTE_COLS = ['代码', '最新价', '成交额']
+SESSIONS = [('09:30', '11:30'), ('13:00', '15:00')]
+
+def normalize(df):
+    """统一列名与类型：代码补足6位，价格/成交额转数值，去掉无效报价；有行情日期时附带“日期”列"""
+    df = df.rename(columns={'code': '代码', 'price': '最新价', 'amount': '成交额', '数据日期': '日期'})
+    out = pd.DataFrame({
+        '代码': df['代码'].astype(str).str.zfill(6),
+        '最新价': pd.to_numeric(df['最新价'], errors='coerce'),
+        '成交额': pd.to_numeric(df['成交额'], errors='coerce') if '成交额' in df.columns else np.nan,
+    }, columns=QUOTE_COLS)
+    if '日期' in df.columns: out['日期'] = pd.to_datetime(df['日期'], errors='coerce').dt.normalize().to_numpy()
+    return out[out['最新价'] > 0].drop_duplicates('代码', keep='last').reset_index(drop=True)
+
+class QuoteSource:
+    def snapshots(self):
+        """逐个产出 (时间 datetime, 报价 DataFrame)"""
+        raise NotImplementedError
+
+class ReplaySource(QuoteSource):
+    """回放本地报价文件；speed=0 全速回放，speed=1 按文件中的时间间隔原速回放"""
+    def __init__(self, path, speed=0.0):
+        self.path, self.speed = path, speed
+
+    def snapshots(self):
+        df = pd.read_csv(self.path, dtype={'代码': str}, encoding='utf-8-sig')
+        df['时间'] = pd.to_datetime(df['时间'])
+        prev = None
+        for ts, part in df.groupby('时间', sort=True):
+            if self.speed and prev is not None: time.sleep((ts - prev).total_seconds() / self.speed)
+            prev = ts
+            yield ts.to_pydatetime(), normalize(part)
+
+class FakeSource(QuoteSource):
+    """以各基金最新收盘价为起点随机游走的模拟报价；成交额按昨日成交额的日内进度累计"""
+    def __init__(self, last_close, last_amount=None, n_snapshots=240, day=None, vol=0.002, seed=None):
+        self.codes = list(last_close)
+        self.close = np.array([last_close[c] for c in self.codes], dtype=float)
+        self.amount = np.array([(last_amount or {}).get(c, np.nan) for c in self.codes], dtype=float)
+        self.n, self.vol, self.seed = n_snapshots, vol, seed
+        self.day = pd.Timestamp(day or datetime.now().date())
+
+    def snapshots(self):
+        rng = np.random.default_rng(self.seed)
+        price = self.close.copy()
+        start = self.day + pd.Timedelta(hours=9, minutes=30)
+        for i in range(self.n):
+            price = np.round(price * np.exp(rng.normal(0, self.vol, len(price))), 3)
+            progress = (i + 1) / self.n
+            minute = i + (90 if i >= 120 else 0)  # 跳过午间休市
+            yield (start + pd.Timedelta(minutes=minute)).to_pydatetime(), \
+                pd.DataFrame({'代码': self.codes, '最新价': price, '成交额': self.amount * progress}, columns=QUOTE_COLS)
+
+def is_trading_day(day):
+    """周末直接判否；其余查新浪交易日历，接口不可用时按工作日处理"""
+    day = pd.Timestamp(day).normalize()
+    if day.weekday() >= 5: return False
+    try:
+        import akshare as ak
+        return day in set(pd.to_datetime(ak.tool_trade_date_hist_sina()['trade_date']))
+    except Exception as e:
+        print(f"⚠️ 交易日历获取失败，按工作日处理: {e}")
+        return True
+
+class AkshareSource(QuoteSource):
+    """轮询 akshare 场内基金实时行情（ETF + LOF），interval 秒一次，仅在交易时段内产出"""
+    def __init__(self, interval=30.0):
+        self.interval = interval
+
+    def fetch(self):
+        import akshare as ak
+        frames = []
+        for func in (ak.fund_etf_spot_em, ak.fund_lof_spot_em):
+            try: frames.append(func())
+            except Exception as e: print(f"⚠️ 实时行情获取失败 {func.__name__}: {e}")
+        return normalize(pd.concat(frames, ignore_index=True)) if frames else pd.DataFrame(columns=QUOTE_COLS)
+
+    def snapshots(self):
+        if not is_trading_day(datetime.now()):
+            print(f"📅 {datetime.now():%Y-%m-%d} 非交易日，不产出报价")
+            return
+        while True:
+            now = datetime.now()
+            hm = now.strftime('%H:%M')
+            if hm >= SESSIONS[-1][1]: return
+            if any(a <= hm < b for a, b in SESSIONS):
+                t0 = time.monotonic()
+                quotes = self.fetch()
+                if not quotes.empty: yield now, quotes
+                time.sleep(max(0.0, self.interval - (time.monotonic() - t0)))
+            else:
+                time.sleep(min(self.interval, 30))
+
+def last_values(field='close'):
+    """全市场矩阵中每只基金最后一个有效值 {代码: 值}"""
+    _, codes, m = price_store.load_matrix((field,))
+    values = m[field]
+    if not len(codes): return {}
+    valid = ~np.isnan(values)
+    last = len(values) - 1 - np.argmax(valid[::-1], axis=0)
+    return {c: values[last[j], j] for j, c in enumerate(codes) if valid[:, j].any()}
+
+def make_source(spec, interval=30.0):
+    """'akshare' -> 实盘轮询；'fake' -> 模拟报价；其他视为本地报价文件路径（回放）"""
+    if spec == 'akshare': return AkshareSource(interval)
+    if spec == 'fake': return FakeSource(last_values('close'), last_values('amount'))
+    if not os.path.exists(spec): raise FileNotFoundError(f"报价文件不存在: {spec}")
+    return ReplaySource(spec)
@@ -0,0 +1,178 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from multiprocessing import Pool, cpu_count
+import price_store
+import indicator_cache
+import universe_manifest
+import run_profile
+import etf_grid_hunter as grid
+import strategy_engine as strategy
+
+# ==============================================================================
+# 历史回放：按实盘扫描器的原规则，对每只基金的每个历史交易日“假装当天收盘后运行”
+# 1. [口径]：analyze_fund / process_file 只看 iloc[-1]；这里对全历史一次算出指标（均为因果滚动/递推），
+#    再按 t 取值复刻当日的决策，记录仍由 build_analysis / build_signal 生成，字段与格式与实盘一致
+# 2. [输出]：<out>/results/年/月/scan_YYYYMMDD.csv（etf_grid_hunter）、<out>/年/月/sig_DD_150000.csv（strategy_engine），
+#    以及按 10 天冷却期回填的 <out>/signal_tracker.csv；默认输出到 replay/，不污染实盘归档与 signal_archive
+# 3. [并行]：与引擎全量模式相同，按代码分块派发，工作进程自行 mmap 读取行情，只回传信号记录
+# ==============================================================================
+
+REPLAY_DIR = 'replay'
+SIG_TIME = '150000'   # 回放的 sig 文件统一记为收盘后 15:00:00 生成
+
+def trailing_mean(values, window):
+    """截至每个 t 的最近 window 个值的均值（跳过 NaN），等价于逐日 tail(window).mean()"""
+    padded = np.concatenate([np.full(window - 1, np.nan), values])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        win = sliding_window_view(padded, window)
+        return np.nansum(win, axis=1) / (~np.isnan(win)).sum(axis=1)
+
+def date_mask(dates, start, end):
+    keep = np.ones(len(dates), dtype=bool)
+    if start: keep &= dates >= np.datetime64(start)
+    if end: keep &= dates <= np.datetime64(end)
+    return keep
+
+def replay_grid(code, df, start=None, end=None):
+    """etf_grid_hunter.analyze_fund 的逐日回放：返回全部非“观望”日的决策记录"""
+    ind = indicator_cache.get_indicators(code, df, grid.GRID_SPEC)
+    close = df['收盘'].to_numpy(dtype=float)
+    amount = df['成交额'].to_numpy(dtype=float)
+    rsi, ma20 = ind['RSI'], ind['MA20']
+    vol_ratio = trailing_mean(amount, 5) / (trailing_mean(amount, 20) + 1e-9)
+    dates = df['日期'].to_numpy().astype('datetime64[D]')
+    mask = (np.arange(len(df)) >= grid.MIN_BARS - 1) & date_mask(dates, start, end)
+    mask &= grid.signal_codes(rsi, close, ma20, vol_ratio) != 0
+    day = df['日期'].dt.strftime('%Y-%m-%d').to_numpy()
+    return [grid.build_analysis(day[t], code, close[t], rsi[t], ma20[t], vol_ratio[t]) for t in np.flatnonzero(mask)]
+
+def replay_strategy(code, df, start=None, end=None):
+    """strategy_engine.process_file 的逐日回放：流动性过滤、回撤观察池、强力底背离与评分"""
+    ind = indicator_cache.get_indicators(code, df, strategy.SCAN_SPEC)
+    n = len(df)
+    close, rsi6, ma6 = df['收盘'].to_numpy(dtype=float), ind['rsi6'], ind['ma6']
+    dates = df['日期'].to_numpy().astype('datetime64[D]')
+    mask = (np.arange(n) >= strategy.MIN_BARS - 1) & date_mask(dates, start, end) & ind['in_watch'].astype(bool)
+    if '成交额' in df.columns:
+        mask &= ~(trailing_mean(df['成交额'].to_numpy(dtype=float), 5) < strategy.LIQUIDITY_LIMIT)
+
+    # check_strong_divergence：至少 25 根K线，第 t 天与其前 20 根中的最低收盘比较
+    window = 20
+    divergence = np.zeros(n, dtype=bool)
+    if n > window:
+        t = np.arange(window, n)
+        m = np.argmin(sliding_window_view(close, window + 1)[:, :window], axis=1) + t - window
+        divergence[window:] = (t + 1 >= window + 5) & (close[t] < close[m] * 0.99) & (rsi6[t] > rsi6[m] + 5)
+    day = df['日期'].dt.strftime('%Y-%m-%d').to_numpy()
+    return [strategy.build_signal(day[t], code, close[t], rsi6[t], ind['rsi14'][t], ind['bias6'][t], ind['bias20'][t],
+                                  ind['retr'][t], bool(divergence[t]), ma6[t] > ma6[t - 1])
+            for t in np.flatnonzero(mask)]
+
+def replay_chunk(args):
+    """工作进程入口：(代码列表, 引擎列表, 起, 止) -> {引擎: 记录 DataFrame}"""
+    codes, engines, start, end = args
+    records = {e: [] for e in engines}
+    for code in codes:
+        df = price_store.load_fund(code)
+        if df is None or len(df) < grid.MIN_BARS: continue
+        if 'grid' in records: records['grid'].extend(replay_grid(code, df, start, end))
+        if 'strategy' in records: records['strategy'].extend(replay_strategy(code, df, start, end))
+    return {e: pd.DataFrame(r) for e, r in records.items()}
+
+def write_scans(df, name_map, out_dir):
+    """按日写 scan_YYYYMMDD.csv：与实盘相同，买入按 RSI 升序、卖出按 RSI 降序，简称插在第三列"""
+    n = 0
+    for day, part in df.groupby('日期', sort=True):
+        buys = part[part['信号'] == '建议买入'].sort_values('RSI', kind='stable')
+        sells = part[part['信号'] == '建议卖出'].sort_values('RSI', ascending=False, kind='stable')
+        output_df = pd.concat([buys, sells], ignore_index=True)
+        output_df.insert(2, '简称', output_df['代码'].map(lambda x: name_map.get(x, '未知')))
+        dir_path = os.path.join(out_dir, 'results', day[:4], day[5:7])
+        os.makedirs(dir_path, exist_ok=True)
+        output_df.to_csv(os.path.join(dir_path, f"scan_{day.replace('-', '')}.csv"), index=False, encoding='utf-8-sig')
+        n += 1
+    return n
+
+def write_sigs(df, out_dir):
+    """按日写 sig_DD_150000.csv，与 strategy_engine 实盘落盘格式一致"""
+    n = 0
+    for day, part in df.groupby('date', sort=True):
+        folder = os.path.join(out_dir, day[:4], day[5:7])
+        os.makedirs(folder, exist_ok=True)
+        part.to_csv(os.path.join(folder, f"sig_{day[8:10]}_{SIG_TIME}.csv"), index=False)
+        n += 1
+    return n
+
+def backfill_tracker(df, name_map):
+    """按实盘 update_tracker 的口径逐日记账（同一代码 10 天冷却期），再统一刷新 T+N 收益"""
+    cols = ['代码', '简称', '入场日期', '买入价', 'T+7收益%', 'T+14收益%', 'T+20收益%', 'T+60收益%', '状态']
+    buys = df[df['is_signal'].astype(bool)].sort_values('日期', kind='stable')
+    last_entry, rows = {}, []
+    for code, day, price in zip(buys['代码'], pd.to_datetime(buys['日期']), buys['价格']):
+        last = last_entry.get(code)
+        if last is None or (day - last).days > 10:
+            rows.append([code, name_map.get(code, '未知'), day.strftime('%Y-%m-%d'), price,
+                         np.nan, np.nan, np.nan, np.nan, '持有中'])
+            last_entry[code] = day
+    return grid.refresh_tracker(pd.DataFrame(rows, columns=cols), grid.HistoryMap())
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='历史回放：按实盘扫描规则逐日重算 etf_grid_hunter / strategy_engine 的输出')
+    parser.add_argument('--engine', choices=['grid', 'strategy', 'all'], default='all', help='回放哪个扫描器')
+    parser.add_argument('--start', help='起始日期 YYYY-MM-DD')
+    parser.add_argument('--end', help='结束日期 YYYY-MM-DD')
+    parser.add_argument('--out', default=REPLAY_DIR, help='输出根目录')
+    parser.add_argument('--profile', action='store_true', help='开启运行剖析（同 RUN_PROFILE=1）')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.profile: run_profile.enable()
+    engines = ['grid', 'strategy'] if args.engine == 'all' else [args.engine]
+    name_map = {}
+    if 'grid' in engines:
+        name_map = grid.load_name_map()
+        if name_map is None:
+            print("❌ 错误：无法读取 ETF 列表文件，请确认路径。")
+            return
+    with run_profile.stage('build_store'):
+        price_store.build_store(price_store.DATA_DIR)
+    with run_profile.stage('select'):
+        codes = universe_manifest.select(min_rows=grid.MIN_BARS, data_dir=price_store.DATA_DIR)
+    if 'grid' in engines and 'strategy' not in engines: codes = [c for c in codes if c in name_map]
+    print(f"⏪ 历史回放 [{'/'.join(engines)}]：{len(codes)} 个品种，区间 {args.start or '最早'} ~ {args.end or '最新'}")
+
+    with run_profile.stage('replay'):
+        frames = {e: [] for e in engines}
+        tasks = [(c, engines, args.start, args.end) for c in price_store.chunk_codes(codes, cpu_count() * 4)]
+        with Pool(cpu_count()) as p:
+            for res in run_profile.results(p.imap(run_profile.task(replay_chunk), tasks)):
+                for e, part in res.items():
+                    if len(part): frames[e].append(part)
+
+    with run_profile.stage('write'):
+        if 'grid' in engines and frames['grid']:
+            df = pd.concat(frames['grid'], ignore_index=True)
+            df = df[df['代码'].isin(name_map)]
+            n_days = write_scans(df, name_map, args.out)
+            print(f"💾 etf_grid_hunter: {n_days} 个交易日、{len(df)} 条决策 -> {args.out}/results/年/月/scan_*.csv")
+            tracker = backfill_tracker(df, name_map)
+            tracker_file = os.path.join(args.out, grid.TRACKER_FILE)
+            tracker.to_csv(tracker_file, index=False, encoding='utf-8-sig')
+            print(f"📒 回填账本: {len(tracker)} 笔入场 -> {tracker_file}")
+            for t in grid.TRACK_DAYS:
+                valid = tracker[f'T+{t}收益%'].dropna().astype(float)
+                if len(valid):
+                    print(f" >> T+{t:2d}表现: 胜率 {(valid > 0).mean() * 100:5.1f}% | 平均收益 {valid.mean():5.2f}% (样本数:{len(valid)})")
+        if 'strategy' in engines and frames['strategy']:
+            df = pd.concat(frames['strategy'], ignore_index=True)
+            n_days = write_sigs(df, args.out)
+            print(f"💾 strategy_engine: {n_days} 个交易日、{len(df)} 条观察池信号 -> {args.out}/年/月/sig_*.csv")
+    indicator_cache.prune_cache()
+    run_profile.finish('replay', funds=len(codes), engines=engines)
+
+if __name__ == "__main__":
+    run_profile.run(main, 'replay')
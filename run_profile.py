@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import pickle
+import resource
+from datetime import datetime
+from contextlib import contextmanager
+
+# ==============================================================================
+# 运行剖析：按阶段记录墙钟时间、CPU 时间、读取字节数，以及各工作进程的 CPU 与结果回传体积
+# 1. [开启方式]：环境变量 RUN_PROFILE=1（或引擎的 --profile 参数），未开启时各钩子直接透传，零开销
+# 2. [逐基金耗时]：fund_map 记录每只基金的耗时，汇总出最慢的 N 只
+# 3. [输出]：finish() 追加一行 JSON 到运行日志，并在控制台打印摘要；readme_section() 供 README 附加剖析小节
+# 4. [cProfile]：RUN_CPROFILE=目录 时 run() 在 cProfile 下执行入口函数，并把统计写到 <目录>/<引擎>.prof
+# ==============================================================================
+
+ENABLED = os.environ.get('RUN_PROFILE', '0') not in ('', '0')
+RUN_LOG = os.environ.get('RUN_LOG', 'run_log.jsonl')
+CPROFILE_DIR = os.environ.get('RUN_CPROFILE', '')
+TOP_N = int(os.environ.get('RUN_PROFILE_TOP', '10'))
+
+_stages = []      # 主进程内已结束的阶段
+_workers = {}     # pid -> 累计统计
+_fund_times = []  # 当前进程内的逐基金耗时 (代码, 秒)，阶段结束或工作块返回时清空
+_slowest = []
+
+def enable():
+    """命令行参数开启剖析；写入环境变量，使之后启动的工作进程同样开启"""
+    global ENABLED
+    ENABLED = True
+    os.environ['RUN_PROFILE'] = '1'
+
+def io_counters():
+    """(read 系统调用字节数, 实际磁盘读取字节数)；mmap 命中页缓存的读取不计入，非 Linux 平台返回 (0, 0)"""
+    try:
+        with open('/proc/self/io') as f:
+            io = dict(line.split(': ') for line in f.read().splitlines())
+        return int(io['rchar']), int(io['read_bytes'])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+def fund_map(func, codes):
+    """逐基金调用 func；开启剖析时记录每只基金的耗时"""
+    if not ENABLED:
+        yield from map(func, codes)
+        return
+    for code in codes:
+        t0 = time.perf_counter()
+        res = func(code)
+        _fund_times.append((str(code), time.perf_counter() - t0))
+        yield res
+
+def _keep_slowest(times):
+    global _slowest
+    _slowest = sorted(_slowest + times, key=lambda x: -x[1])[:TOP_N]
+
+def _keep_top(times):
+    return [list(x) for x in sorted(times, key=lambda x: -x[1])[:TOP_N]]
+
+class WorkerTask:
+    """工作进程入口的包装：返回 (原结果, 本块统计)，统计含 CPU、墙钟、读取字节、逐基金耗时与结果序列化体积"""
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, arg):
+        del _fund_times[:]
+        w0, c0, (r0, d0) = time.perf_counter(), time.process_time(), io_counters()
+        res = self.func(arg)
+        w1, c1, (r1, d1) = time.perf_counter(), time.process_time(), io_counters()
+        t0 = time.perf_counter()
+        size = len(pickle.dumps(res, protocol=pickle.HIGHEST_PROTOCOL))
+        stats = {'pid': os.getpid(), 'wall': w1 - w0, 'cpu': c1 - c0, 'read': r1 - r0, 'disk_read': d1 - d0,
+                 'result_bytes': size, 'pickle_s': time.perf_counter() - t0, 'funds': _keep_top(_fund_times)}
+        del _fund_times[:]
+        return res, stats
+
+def task(func):
+    """包装 Pool/Executor 的工作函数；未开启剖析时原样返回"""
+    return WorkerTask(func) if ENABLED else func
+
+def results(iterable):
+    """解包 task() 包装后的返回值并累计工作进程统计；未开启剖析时原样返回"""
+    if not ENABLED: return iterable
+    return _unwrap(iterable)
+
+def _unwrap(iterable):
+    for res, st in iterable:
+        w = _workers.setdefault(st['pid'], {'pid': st['pid'], 'chunks': 0, 'wall': 0.0, 'cpu': 0.0, 'read': 0,
+                                             'disk_read': 0, 'result_bytes': 0, 'pickle_s': 0.0})
+        w['chunks'] += 1
+        for k in ('wall', 'cpu', 'read', 'disk_read', 'result_bytes', 'pickle_s'): w[k] += st[k]
+        _keep_slowest([tuple(x) for x in st['funds']])
+        yield res
+
+@contextmanager
+def stage(name):
+    """记录一个阶段：墙钟时间、主进程 CPU、已回收子进程 CPU、读取字节数"""
+    if not ENABLED:
+        yield
+        return
+    w0, c0, (r0, d0) = time.perf_counter(), time.process_time(), io_counters()
+    ch0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+    try:
+        yield
+    finally:
+        ch1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        r1, d1 = io_counters()
+        _stages.append({'stage': name, 'wall': round(time.perf_counter() - w0, 4), 'cpu': round(time.process_time() - c0, 4),
+                        'child_cpu': round((ch1.ru_utime + ch1.ru_stime) - (ch0.ru_utime + ch0.ru_stime), 4),
+                        'read': r1 - r0, 'disk_read': d1 - d0})
+        _keep_slowest(list(_fund_times))
+        del _fund_times[:]
+
+def report(engine):
+    """当前累计的剖析结果"""
+    return {
+        'engine': engine, 'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'pid': os.getpid(),
+        'stages': _stages,
+        'workers': [dict(w, wall=round(w['wall'], 4), cpu=round(w['cpu'], 4), pickle_s=round(w['pickle_s'], 4))
+                    for w in sorted(_workers.values(), key=lambda w: w['pid'])],
+        'slowest': [{'code': c, 'seconds': round(s, 4)} for c, s in _slowest],
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def _mb(n):
+    return f"{n / 1024 / 1024:.1f}MB"
+
+def summary_lines(rep):
+    lines = [f"{'阶段':<16} {'墙钟s':>8} {'CPU s':>8} {'子进程CPU s':>11} {'读取':>10}"]
+    for s in rep['stages']:
+        lines.append(f"{s['stage']:<16} {s['wall']:>8.3f} {s['cpu']:>8.3f} {s['child_cpu']:>11.3f} {_mb(s['read']):>10}")
+    for w in rep['workers']:
+        lines.append(f"工作进程 {w['pid']}: {w['chunks']} 块 | CPU {w['cpu']:.2f}s | 墙钟 {w['wall']:.2f}s | "
+                     f"读取 {_mb(w['read'])} | 回传 {_mb(w['result_bytes'])} (序列化 {w['pickle_s']:.3f}s)")
+    if rep['slowest']:
+        lines.append("最慢品种: " + ", ".join(f"{x['code']} {x['seconds'] * 1000:.0f}ms" for x in rep['slowest']))
+    return lines
+
+def readme_section(engine):
+    """README 附加的剖析小节（Markdown）；未开启剖析时返回空字符串"""
+    if not ENABLED: return ''
+    rep = report(engine)
+    content = "## ⏱️ 运行剖析\n| 阶段 | 墙钟s | CPU s | 子进程CPU s | 读取 |\n|:--|--:|--:|--:|--:|\n"
+    for s in rep['stages']:
+        content += f"| {s['stage']} | {s['wall']:.3f} | {s['cpu']:.3f} | {s['child_cpu']:.3f} | {_mb(s['read'])} |\n"
+    if rep['slowest']:
+        content += "\n> 最慢品种: " + ", ".join(f"`{x['code']}` {x['seconds'] * 1000:.0f}ms" for x in rep['slowest']) + "\n"
+    return content + "\n"
+
+def finish(engine, **extra):
+    """追加运行日志并打印摘要；未开启剖析时什么也不做"""
+    if not ENABLED: return None
+    rep = dict(report(engine), **extra)
+    with open(RUN_LOG, 'a', encoding='utf-8') as f: f.write(json.dumps(rep, ensure_ascii=False) + '\n')
+    print(f"\n⏱️ 运行剖析（已追加至 {RUN_LOG}）")
+    for line in summary_lines(rep): print("   " + line)
+    return rep
+
+def run(main, engine):
+    """脚本入口：RUN_CPROFILE 指定目录时在 cProfile 下运行 main()（只覆盖主进程），统计写入 <目录>/<引擎>.prof"""
+    if not CPROFILE_DIR: return main()
+    import cProfile
+    os.makedirs(CPROFILE_DIR, exist_ok=True)
+    prof = cProfile.Profile()
+    try:
+        return prof.runcall(main)
+    finally:
+        path = os.path.join(CPROFILE_DIR, f'{engine}.prof')
+        prof.dump_stats(path)
+        print(f"🔬 cProfile 统计已写入: {path}（python -m pstats {path} 查看）", file=sys.stderr)
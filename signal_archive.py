@@ -0,0 +1,93 @@
+import os
+import json
+import glob
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# 信号归档：把每次扫描落盘的 sig_*.csv 快照合并进只追加的按月分区归档
+# 1. [增量合并]：index.json 记录已归档的快照，每次只读取新出现的文件
+# 2. [首次触发索引]：每个代码最早一次信号（建仓日、建仓价、评分），盈亏统计直接查索引
+# 3. [分区]：归档行按信号日期写入 signal_archive/YYYY-MM.csv，便于按时间段回看
+# ==============================================================================
+
+ARCHIVE_DIR = 'signal_archive'
+INDEX_FILE = 'index.json'
+SOURCE_GLOB = '202*/**/*.csv'
+ARCHIVE_COLS = ['date', 'fund_code', '评分', 'price', 'source']
+
+def _index_path(archive_dir):
+    return os.path.join(archive_dir, INDEX_FILE)
+
+def load_index(archive_dir=ARCHIVE_DIR):
+    """{'ingested': {快照路径: 文件大小}, 'first': {代码: {'date', 'price', '评分'}}}"""
+    path = _index_path(archive_dir)
+    if os.path.exists(path):
+        try:
+            with open(path, encoding='utf-8') as f: return json.load(f)
+        except (OSError, ValueError):
+            pass
+    return {'ingested': {}, 'first': {}}
+
+def _save_index(index, archive_dir):
+    tmp = _index_path(archive_dir) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f: f.write(json.dumps(index, ensure_ascii=False))
+    os.replace(tmp, _index_path(archive_dir))
+
+def normalize(df, source):
+    """快照 -> 归档行：只保留带 date/fund_code 的信号，代码统一为6位字符串"""
+    if 'date' not in df.columns or 'fund_code' not in df.columns: return pd.DataFrame(columns=ARCHIVE_COLS)
+    code = pd.to_numeric(df['fund_code'], errors='coerce')
+    ok = code.notna() & df['date'].notna()
+    return pd.DataFrame({
+        'date': df.loc[ok, 'date'].astype(str).str[:10],
+        'fund_code': code[ok].astype('int64').astype(str).str.zfill(6),
+        '评分': df.loc[ok, '评分'] if '评分' in df.columns else 1,
+        'price': pd.to_numeric(df.loc[ok, 'price'], errors='coerce') if 'price' in df.columns else np.nan,
+        'source': source,
+    }, columns=ARCHIVE_COLS)
+
+def sync(pattern=SOURCE_GLOB, archive_dir=ARCHIVE_DIR):
+    """归档尚未处理的快照并刷新首次触发索引，返回 (索引, 新增行数)"""
+    index = load_index(archive_dir)
+    ingested = index['ingested']
+    new_files = [p for p in sorted(glob.glob(pattern, recursive=True))
+                 if 'perf' not in p and p.replace(os.sep, '/') not in ingested]
+    frames = []
+    for path in new_files:
+        key = path.replace(os.sep, '/')
+        try: frames.append(normalize(pd.read_csv(path), key))
+        except Exception: pass
+        ingested[key] = os.path.getsize(path)
+    rows = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=ARCHIVE_COLS)
+
+    if len(rows):
+        os.makedirs(archive_dir, exist_ok=True)
+        # 同一日期按快照归档顺序取先到者，与“按日期排序后去重保留第一条”一致
+        rows = rows.sort_values('date', kind='stable')
+        for month, part in rows.groupby(rows['date'].str[:7]):
+            part_path = os.path.join(archive_dir, f'{month}.csv')
+            part.to_csv(part_path, mode='a', header=not os.path.exists(part_path), index=False, encoding='utf-8')
+        first = index['first']
+        for r in rows.drop_duplicates('fund_code', keep='first').itertuples(index=False):
+            old = first.get(r.fund_code)
+            if old is None or r.date < old['date']:
+                first[r.fund_code] = {'date': r.date, 'price': None if pd.isna(r.price) else float(r.price),
+                                      '评分': None if pd.isna(r.评分) else float(r.评分)}
+    if new_files:
+        os.makedirs(archive_dir, exist_ok=True)
+        _save_index(index, archive_dir)
+    return index, len(rows)
+
+def load_partitions(start=None, end=None, archive_dir=ARCHIVE_DIR):
+    """读取 [start, end] 月份（YYYY-MM）范围内的归档行"""
+    frames = []
+    for path in sorted(glob.glob(os.path.join(archive_dir, '*.csv'))):
+        month = os.path.splitext(os.path.basename(path))[0]
+        if (start and month < start) or (end and month > end): continue
+        frames.append(pd.read_csv(path, dtype={'fund_code': str}))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=ARCHIVE_COLS)
+
+if __name__ == "__main__":
+    idx, n = sync()
+    print(f"🗄️ 信号归档: 新增 {n} 行 | 已归档快照 {len(idx['ingested'])} 个 | 触发代码 {len(idx['first'])} 只")
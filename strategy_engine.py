@@ -1,9 +1,19 @@
 import os
-import glob
+import json
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta, timezone
 from multiprocessing import Pool, cpu_count
+import price_store
+import indicator_cache
+import stream_indicators as si
+import signal_archive
+import universe_manifest
+import run_profile
+import fund_outcomes
+import engine_core
+import fund_clusters
+import memory_budget
 
 # ==========================================
 # --- 1. 核心锁死风控与策略参数 ---
@@ -14,6 +24,10 @@ STOP_BUY_LOSS_RATIO = -5.0 # 组合总亏损超5%，开启禁买令
 RETR_WATCH = -10.0         # 10%回调介入
 RETR_WINDOW = 250          # 250日实战周期
 LIQUIDITY_LIMIT = 10000000 # 日均成交额低于1000万不入池
+MIN_BARS = 60              # K线不足60根不参与扫描
+SCAN_MODE = os.environ.get('SCAN_MODE', 'stream')  # stream: 流式状态逐日续算 / full: 完整 pandas 计算
+STREAM_NAME = 'strategy_engine'
+PERF_CACHE_FILE = 'strategy_perf.json'   # 建仓盈亏缓存，存于 .scan_state/
 
 # ==========================================
 # --- 2. 映射逻辑：加载 ETF 名称 ---
@@ -45,128 +59,217 @@ def calculate_rsi(series, period=6):
     rs = gain / loss.replace(0, np.nan)
     return 100 - (100 / (1 + rs.fillna(0)))
 
+def compute_indicators(df, seed=None, start=0):
+    """扫描所需的全部指标；seed 非空时 persist_days 从缓存的连续天数接着累加"""
+    close = df['收盘']
+    ma6 = close.rolling(window=6).mean()
+    ma20 = close.rolling(window=20).mean()
+    max_high = close.rolling(window=RETR_WINDOW).max()
+    retr = ((close - max_high) / max_high) * 100
+    in_watch = retr <= RETR_WATCH
+    if seed is None:
+        persist = in_watch.groupby((in_watch != in_watch.shift()).cumsum()).cumcount() + 1
+        persist[~in_watch] = 0
+        persist = persist.to_numpy()
+    else:
+        persist, prev = np.zeros(len(df)), seed['persist_days']
+        for i in range(start, len(df)):
+            prev = prev + 1 if in_watch.iloc[i] else 0
+            persist[i] = prev
+    cols = {
+        'rsi6': calculate_rsi(close, 6).to_numpy(),
+        'rsi14': calculate_rsi(close, 14).to_numpy(),
+        'ma6': ma6.to_numpy(),
+        'ma20': ma20.to_numpy(),
+        'bias6': (((close - ma6) / ma6) * 100).to_numpy(),
+        'bias20': (((close - ma20) / ma20) * 100).to_numpy(),
+        'max_high': max_high.to_numpy(),
+        'retr': retr.to_numpy(),
+        'in_watch': in_watch.to_numpy(),
+        'persist_days': persist,
+    }
+    return cols, {'persist_days': int(persist[-1]) if len(persist) else 0}
+
+SCAN_SPEC = indicator_cache.IndicatorSpec('strategy_scan', ['日期', '收盘'], RETR_WINDOW + 10, compute_indicators)
+
+def is_strong_divergence(closes, rsis):
+    """closes/rsis 为最近 window+1 根K线：当前价跌破回看区间最低价1%且RSI高出5以上"""
+    min_idx = int(np.argmin(closes[:-1]))
+    return bool(closes[-1] < closes[min_idx] * 0.99 and rsis[-1] > rsis[min_idx] + 5)
+
 def check_strong_divergence(df, window=20):
     """价格创新低但RSI回升：强力底背离判断"""
     if len(df) < window + 5: return False
-    curr_p = df['收盘'].iloc[-1]
-    curr_rsi = df['rsi6'].iloc[-1]
-    lookback = df.iloc[-(window+1):-1]
-    min_idx = lookback['收盘'].idxmin()
-    min_p = lookback.loc[min_idx, '收盘']
-    min_rsi = lookback.loc[min_idx, 'rsi6']
-    if curr_p < min_p * 0.99 and curr_rsi > min_rsi + 5:
-        return True
-    return False
+    return is_strong_divergence(df['收盘'].to_numpy()[-(window+1):], df['rsi6'].to_numpy()[-(window+1):])
+
+def build_signal(date, code, close, rsi6, rsi14, bias6, bias20, retr, divergence, ma6_up):
+    """观察池内品种的评分与风险提示（完整计算与流式扫描共用）"""
+    score = 1
+    if rsi6 < 30 and rsi14 < 40: score += 2
+    if bias6 < -5 and bias20 < -7: score += 2
+    if divergence: score += 2
+
+    risk_level = "正常"
+    if divergence: risk_level = "📈强力底背离"
+    elif rsi6 > 50: risk_level = "🚩假摔陷阱"
+
+    return {
+        'date': date,
+        'fund_code': code,
+        '名称': NAME_MAP.get(code, "未知品种"),
+        '评分': score,
+        '风险预警': risk_level,
+        '回撤%': round(retr, 2),
+        'RSI6': round(rsi6, 2),
+        'BIAS20': round(bias20, 2),
+        'price': round(close, 4),
+        'ma5_trend': "UP" if ma6_up else "DOWN"
+    }
 
 # ==========================================
 # --- 4. 单文件处理 (算法增强扫描) ---
 # ==========================================
 def process_file(file_path):
     try:
-        try: df = pd.read_csv(file_path, encoding='utf-8')
-        except: df = pd.read_csv(file_path, encoding='gbk')
-        if 'net_value' in df.columns: df = df.rename(columns={'date': '日期', 'net_value': '收盘'})
-        if '日期' not in df.columns or '收盘' not in df.columns: return None
-
-        df['日期'] = pd.to_datetime(df['日期'])
-        df = df.sort_values(by='日期').reset_index(drop=True)
-        if len(df) < 60: return None 
-        
-        if '成交额' in df.columns and df['成交额'].iloc[-5:].mean() < LIQUIDITY_LIMIT: return None
-
-        # 计算增强指标
-        df['rsi6'] = calculate_rsi(df['收盘'], 6)
-        df['rsi14'] = calculate_rsi(df['收盘'], 14)
-        df['ma6'] = df['收盘'].rolling(window=6).mean()
-        df['ma20'] = df['收盘'].rolling(window=20).mean()
-        df['bias6'] = ((df['收盘'] - df['ma6']) / df['ma6']) * 100
-        df['bias20'] = ((df['收盘'] - df['ma20']) / df['ma20']) * 100
-        df['max_high'] = df['收盘'].rolling(window=RETR_WINDOW).max()
-        df['retr'] = ((df['收盘'] - df['max_high']) / df['max_high']) * 100
+        df = price_store.load_fund(file_path)
+        if df is None or len(df) < MIN_BARS: return fund_outcomes.skip(file_path, fund_outcomes.no_data_reason(file_path, MIN_BARS))
         
-        df['in_watch'] = df['retr'] <= RETR_WATCH
-        df['persist_days'] = df['in_watch'].groupby((df['in_watch'] != df['in_watch'].shift()).cumsum()).cumcount() + 1
-        df.loc[~df['in_watch'], 'persist_days'] = 0
+        if '成交额' in df.columns and df['成交额'].iloc[-5:].mean() < LIQUIDITY_LIMIT: return fund_outcomes.skip(file_path, '流动性不足')
 
-        curr = df.iloc[-1]
+        # 计算增强指标（命中缓存时直接读回，新增K线只补算末尾）
         code = os.path.splitext(os.path.basename(file_path))[0].zfill(6)
+        for c, v in indicator_cache.get_indicators(code, df, SCAN_SPEC).items(): df[c] = v
+        df['in_watch'] = df['in_watch'].astype(bool)
+
+        curr = df.iloc[-1]
+        fund_outcomes.record(code)
         
         if curr['in_watch']:
-            score = 1
-            divergence = check_strong_divergence(df)
-            if curr['rsi6'] < 30 and curr['rsi14'] < 40: score += 2
-            if curr['bias6'] < -5 and curr['bias20'] < -7: score += 2
-            if divergence: score += 2
-            
-            risk_level = "正常"
-            if divergence: risk_level = "📈强力底背离"
-            elif curr['rsi6'] > 50: risk_level = "🚩假摔陷阱"
-                
-            return {
-                'date': str(curr['日期']).split(' ')[0],
-                'fund_code': code,
-                '名称': NAME_MAP.get(code, "未知品种"),
-                '评分': score,
-                '风险预警': risk_level,
-                '回撤%': round(curr['retr'], 2),
-                'RSI6': round(curr['rsi6'], 2),
-                'BIAS20': round(curr['bias20'], 2),
-                'price': round(curr['收盘'], 4),
-                'ma5_trend': "UP" if curr['ma6'] > df['ma6'].iloc[-2] else "DOWN"
-            }
-    except: return None
+            return build_signal(str(curr['日期']).split(' ')[0], code, curr['收盘'], curr['rsi6'], curr['rsi14'],
+                                curr['bias6'], curr['bias20'], curr['retr'], check_strong_divergence(df),
+                                curr['ma6'] > df['ma6'].iloc[-2])
+    except Exception as e: return fund_outcomes.error(file_path, e)
+
+def process_chunk(codes):
+    """工作进程入口：只接收代码列表，行情由各进程自行 mmap 读取；返回 (信号, 逐品种处理结果)"""
+    return [r for r in run_profile.fund_map(process_file, codes) if r is not None], fund_outcomes.drain()
+
+# ==========================================
+# --- 4b. 流式扫描：状态跨运行保存，每日只消费新增K线 ---
+# ==========================================
+def new_stream():
+    return si.FundStream({
+        'rsi6': si.SimpleRSI(6, fill_zero=True), 'rsi14': si.SimpleRSI(14, fill_zero=True),
+        'ma6': si.RollingMean(6), 'ma20': si.RollingMean(20), 'max_high': si.RollingMax(RETR_WINDOW),
+        'persist_days': si.RunLength(), 'amount': si.Window(5), 'recent': si.Window(21),
+    })
+
+def feed_stream(stream, cols, i):
+    close = cols['close'][i]
+    stream.extra['prev_ma6'] = stream['ma6'].value
+    rsi6 = stream['rsi6'].update(close)
+    stream['rsi14'].update(close)
+    stream['ma6'].update(close)
+    stream['ma20'].update(close)
+    max_high = stream['max_high'].update(close)
+    stream['persist_days'].update(((close - max_high) / max_high) * 100 <= RETR_WATCH)
+    stream['amount'].update(cols['amount'][i])
+    stream['recent'].update((close, rsi6))
+    stream.extra['close'] = close
+
+def process_stream(code, stream):
+    """流式版 process_file，返回 (新状态, 信号或 None)"""
+    stream, _ = si.advance(stream, code, new_stream, feed_stream)
+    if stream is None or stream.n < MIN_BARS: return stream, fund_outcomes.skip(code, fund_outcomes.no_data_reason(code, MIN_BARS))
+    amount = np.array(stream['amount'].buf)
+    amount = amount[~np.isnan(amount)]
+    if len(amount) and amount.mean() < LIQUIDITY_LIMIT: return stream, fund_outcomes.skip(code, '流动性不足')
+    fund_outcomes.record(code)
+    if stream['persist_days'].value == 0: return stream, None
+
+    close = stream.extra['close']
+    ma6, ma20, max_high = stream['ma6'].value, stream['ma20'].value, stream['max_high'].value
+    recent = np.array(stream['recent'].buf)
+    divergence = stream.n >= 25 and is_strong_divergence(recent[:, 0], recent[:, 1])
+    return stream, build_signal(stream.last_date, code, close, stream['rsi6'].value, stream['rsi14'].value,
+                                ((close - ma6) / ma6) * 100, ((close - ma20) / ma20) * 100,
+                                ((close - max_high) / max_high) * 100, divergence, ma6 > stream.extra['prev_ma6'])
+
+def scan_stream(codes):
+    states = si.load_states(STREAM_NAME)
+    results = []
+
+    def step(f):
+        code = price_store.code_from_path(f)
+        return code, process_stream(code, states.get(code))
+
+    for code, (stream, res) in run_profile.fund_map(step, codes):
+        if stream is not None: states[code] = stream
+        if res is not None: results.append(res)
+    si.save_states(STREAM_NAME, states)
+    return results
 
 # ==========================================
 # --- 5. 盈亏统计 (去重聚焦逻辑) ---
 # ==========================================
+def perf_row(code, sig):
+    """单个建仓记录的最新盈亏：建仓日起的收盘序列计算最高浮盈、当前盈亏与 MA5/MA10 死叉"""
+    series = price_store.matrix_series(code)
+    if series is None: return None
+    dates, close = series
+    after = close[dates >= np.datetime64(sig['date'])]
+    if len(after) == 0: return None
+    ma5 = pd.Series(after).rolling(window=5).mean().iloc[-1]
+    ma10 = pd.Series(after).rolling(window=10).mean().iloc[-1]
+
+    entry_price = np.nan if sig['price'] is None else sig['price']
+    max_profit = (after.max() - entry_price) / entry_price * 100
+    curr_profit = (after[-1] - entry_price) / entry_price * 100
+    is_dead_cross = bool(ma5 < ma10 and len(after) > 5)
+    return {
+        '日期': sig['date'], '代码': code,
+        '评分': np.nan if sig['评分'] is None else sig['评分'], '最新价': round(float(after[-1]), 4),
+        '最高浮盈%': round(max_profit, 2), '总盈亏%': round(curr_profit, 2),
+        '状态': "✅趋势向上" if not is_dead_cross else "🚨趋势走弱",
+        '死叉': "YES" if is_dead_cross else "NO"
+    }
+
 def get_performance_stats():
-    history_files = glob.glob('202*/**/*.csv', recursive=True)
-    all_raw_signals = []
-    for h_file in history_files:
-        if 'perf' in h_file: continue
-        try: all_raw_signals.append(pd.read_csv(h_file))
-        except: continue
-    
-    if not all_raw_signals: return pd.DataFrame()
-    
-    # 核心改进：按代码去重，只保留该品种最早的触发日期（即建仓日）
-    full_df = pd.concat(all_raw_signals).sort_values('date')
-    unique_signals = full_df.drop_duplicates(subset=['fund_code'], keep='first')
-    
+    """按代码去重，只跟踪该品种最早的触发日期（即建仓日）
+
+    建仓记录来自信号归档的首次触发索引；每只基金的结果按 (建仓日, 建仓价, 行情指纹) 缓存，
+    只有行情发生变化的品种才重新计算。
+    """
+    index, _ = signal_archive.sync()
+    if not index['first']: return pd.DataFrame()
+    cache_path = os.path.join(si.STATE_DIR, PERF_CACHE_FILE)
+    try:
+        with open(cache_path, encoding='utf-8') as f: cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
     perf_list = []
-    for _, sig in unique_signals.iterrows():
-        code = str(sig['fund_code']).zfill(6)
-        raw_path = f'fund_data/{code}.csv'
-        if not os.path.exists(raw_path): continue
-        try:
-            raw_df = pd.read_csv(raw_path)
-            if 'net_value' in raw_df.columns: raw_df = raw_df.rename(columns={'date': '日期', 'net_value': '收盘'})
-            raw_df['日期'] = pd.to_datetime(raw_df['日期']).dt.strftime('%Y-%m-%d')
-            
-            # 找到信号发生后的数据
-            after_df = raw_df[raw_df['日期'] >= str(sig['date'])].copy()
-            if after_df.empty: continue
-            
-            after_df['ma5'] = after_df['收盘'].rolling(window=5).mean()
-            after_df['ma10'] = after_df['收盘'].rolling(window=10).mean()
-            
-            latest = after_df.iloc[-1]
-            entry_price = sig['price']
-            max_p = after_df['收盘'].max()
-            
-            max_profit = (max_p - entry_price) / entry_price * 100
-            curr_profit = (latest['收盘'] - entry_price) / entry_price * 100
-            is_dead_cross = latest['ma5'] < latest['ma10'] and len(after_df) > 5
-
-            perf_list.append({
-                '日期': sig['date'], '代码': code, '名称': NAME_MAP.get(code, "未知"),
-                '评分': sig.get('评分', 1), '最新价': round(latest['收盘'], 4), 
-                '最高浮盈%': round(max_profit, 2), '总盈亏%': round(curr_profit, 2),
-                '状态': "✅趋势向上" if not is_dead_cross else "🚨趋势走弱",
-                '死叉': "YES" if is_dead_cross else "NO"
-            })
-        except: continue
-    return pd.DataFrame(perf_list)
+    for code, sig in sorted(index['first'].items(), key=lambda kv: kv[1]['date']):
+        key = [sig['date'], sig['price'], price_store.fingerprint(code)]
+        hit = cache.get(code)
+        if hit and hit['key'] == key:
+            row = hit['row']
+        else:
+            try:
+                row = perf_row(code, sig)
+                outcome = [fund_outcomes.OK, ''] if row is not None else [fund_outcomes.SKIPPED, '无行情或建仓日之后无K线']
+            except Exception as e:
+                row, outcome = None, [fund_outcomes.ERROR, f'{type(e).__name__}: {str(e)[:200]}']
+            cache[code] = {'key': key, 'row': row, 'outcome': outcome}
+        status, reason = cache[code].get('outcome') or [fund_outcomes.OK if row is not None else fund_outcomes.SKIPPED, '']
+        fund_outcomes.record(code, status, reason, stage='perf')
+        if row is not None: perf_list.append(dict(row, 名称=NAME_MAP.get(code, "未知")))
+
+    os.makedirs(si.STATE_DIR, exist_ok=True)
+    with open(cache_path + '.tmp', 'w', encoding='utf-8') as f: f.write(json.dumps(cache, ensure_ascii=False))
+    os.replace(cache_path + '.tmp', cache_path)
+    cols = ['日期', '代码', '名称', '评分', '最新价', '最高浮盈%', '总盈亏%', '状态', '死叉']
+    return pd.DataFrame(perf_list, columns=cols) if perf_list else pd.DataFrame()
 
 # ==========================================
 # --- 6. 最终决策报告生成 ---
@@ -196,6 +299,8 @@ def update_readme(current_res, perf_df):
         perf_df['操作建议'] = perf_df.apply(decide_sell, axis=1)
         content += perf_df[['日期', '代码', '名称', '评分', '最高浮盈%', '总盈亏%', '操作建议']].to_markdown(index=False) + "\n\n"
 
+    content += run_profile.readme_section('strategy_engine')
+
     with open('README.md', 'w', encoding='utf-8') as f: f.write(content)
 
 # ==========================================
@@ -203,15 +308,68 @@ def update_readme(current_res, perf_df):
 # ==========================================
 def main():
     if not os.path.exists('fund_data'): return
-    files = glob.glob('fund_data/*.csv')
-    with Pool(cpu_count()) as p:
-        results = [r for r in p.map(process_file, files) if r is not None]
+    with run_profile.stage('build_store'):
+        price_store.build_store('fund_data')
+    # 按品种清单预筛选：K线不足或近5日成交额不达标的品种不派发
+    with run_profile.stage('select'):
+        codes = universe_manifest.select(min_rows=MIN_BARS, min_amount5=LIQUIDITY_LIMIT, data_dir='fund_data')
+    with run_profile.stage('scan'):
+        if SCAN_MODE == 'stream':
+            results = scan_stream(codes)
+        elif memory_budget.ENABLED:
+            spool, _ = memory_budget.run_chunks(process_chunk, memory_budget.code_chunks(codes), STREAM_NAME)
+            results = list(spool)
+            spool.close()
+        else:
+            with Pool(cpu_count()) as p:
+                chunks = p.imap(run_profile.task(process_chunk), price_store.chunk_codes(codes, cpu_count() * 4))
+                results = []
+                for chunk, outcomes in run_profile.results(chunks):
+                    results.extend(chunk)
+                    fund_outcomes.extend(outcomes)
+    results = publish(results)
+    fund_outcomes.summarize('strategy_engine')
+    indicator_cache.prune_cache()
+    run_profile.finish('strategy_engine', funds=len(codes), mode=SCAN_MODE, signals=len(results))
+
+def publish(results):
+    """信号落盘：同簇信号去重后写当日 sig_DD_HHMMSS.csv，刷新建仓追踪并重写 README"""
+    results, dropped = fund_clusters.dedupe(results, 'fund_code', lambda r: (r['评分'], -r['回撤%']))
+    if dropped: print(f"🔗 相关性去重：略过 {len(dropped)} 个与同簇品种重复的观察池信号")
     if results:
         now = datetime.now()
         folder = now.strftime('%Y/%m')
         os.makedirs(folder, exist_ok=True)
         pd.DataFrame(results).to_csv(f"{folder}/sig_{now.strftime('%d_%H%M%S')}.csv", index=False)
-    update_readme(results, get_performance_stats())
+    with run_profile.stage('perf_stats'):
+        perf_df = get_performance_stats()
+    with run_profile.stage('readme'):
+        update_readme(results, perf_df)
+    return results
+
+class ScanStrategy(engine_core.Strategy):
+    """统一引擎内核中的 strategy_engine：与 process_file 同一口径，输出与单独运行相同"""
+    name, min_bars = 'strategy_engine', MIN_BARS
+
+    def universe(self):
+        if not os.path.exists('fund_data'): return None
+        return universe_manifest.select(min_rows=MIN_BARS, min_amount5=LIQUIDITY_LIMIT, data_dir='fund_data')
+
+    def scan(self, code, ctx):
+        df = ctx.df
+        if '成交额' in df.columns and df['成交额'].iloc[-5:].mean() < LIQUIDITY_LIMIT: return fund_outcomes.skip(code, '流动性不足', self.name)
+        fund_outcomes.record(code, stage=self.name)
+        retr = ctx.get('retr', RETR_WINDOW)
+        if not retr[-1] <= RETR_WATCH: return None
+        close, rsi6, ma6 = ctx.get('close'), ctx.get('rsi_sma_z', 6), ctx.get('ma', 6)
+        divergence = len(df) >= 25 and is_strong_divergence(close[-21:], rsi6[-21:])
+        return build_signal(str(df['日期'].iloc[-1]).split(' ')[0], code, close[-1], rsi6[-1], ctx.get('rsi_sma_z', 14)[-1],
+                            ctx.get('bias', 6)[-1], ctx.get('bias', 20)[-1], retr[-1], divergence, ma6[-1] > ma6[-2])
+
+    def publish(self, results):
+        publish(list(results))
+
+STRATEGY = ScanStrategy()
 
 if __name__ == "__main__":
-    main()
+    run_profile.run(main, 'strategy_engine')
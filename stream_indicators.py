@@ -0,0 +1,319 @@
+import os
+import json
+import math
+from collections import deque
+import price_store
+from indicator_cache import ewm_step
+
+# ==============================================================================
+# 流式指标：每来一根新K线只做 O(1) 更新，状态可序列化到磁盘跨运行延续
+# 1. [指标]：Wilder RSI、简单 RSI、滚动均值、单调队列滚动最值、KDJ、连续天数计数
+# 2. [基金状态]：FundStream 把多个指标打包，记录已消费的行数与最后一根K线用于校验
+# 3. [持久化]：load_states/save_states 以 JSON 保存全部基金的流式状态
+# ==============================================================================
+
+STATE_DIR = '.scan_state'
+NAN = float('nan')
+
+def _isnan(x):
+    return x != x
+
+class RollingMean:
+    """滚动均值：复刻 pandas rolling(window).mean() 的 Kahan 补偿增删顺序，逐位一致"""
+    def __init__(self, window):
+        self.window = window
+        self.buf = deque(maxlen=window)
+        # [nobs, sum_x, neg_ct, compensation_add, compensation_remove, num_same, prev_value]
+        self.acc = [0, 0.0, 0, 0.0, 0.0, 0, NAN]
+        self.value = NAN
+
+    def _add(self, val):
+        a = self.acc
+        if val == val:
+            a[0] += 1
+            y = val - a[3]
+            t = a[1] + y
+            a[3] = t - a[1] - y
+            a[1] = t
+            if val < 0: a[2] += 1
+            if val == a[6]: a[5] += 1
+            else: a[5] = 1
+            a[6] = val
+
+    def _remove(self, val):
+        a = self.acc
+        if val == val:
+            a[0] -= 1
+            y = -val - a[4]
+            t = a[1] + y
+            a[4] = t - a[1] - y
+            a[1] = t
+            if val < 0: a[2] -= 1
+
+    def update(self, x):
+        if len(self.buf) == self.window: self._remove(self.buf[0])
+        self.buf.append(x)
+        self._add(x)
+        nobs, sum_x, neg_ct, _, _, num_same, prev = self.acc
+        if nobs >= self.window and nobs > 0:
+            result = sum_x / nobs
+            if num_same >= nobs: result = prev
+            elif neg_ct == 0 and result < 0: result = 0.0
+            elif neg_ct == nobs and result > 0: result = 0.0
+            self.value = result
+        else:
+            self.value = NAN
+        return self.value
+
+    def to_dict(self):
+        return {'window': self.window, 'buf': list(self.buf), 'acc': list(self.acc), 'value': self.value}
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls(d['window'])
+        obj.buf.extend(d['buf'])
+        obj.acc, obj.value = list(d['acc']), d['value']
+        return obj
+
+class RollingMax:
+    """单调递减队列维护窗口最大值，每次更新均摊 O(1)"""
+    sign = 1.0
+
+    def __init__(self, window):
+        self.window = window
+        self.i = 0
+        self.q = deque()        # (序号, 值)，值单调不增
+        self.nan_idx = deque()  # 窗口内 NaN 的序号
+        self.value = NAN
+
+    def update(self, x):
+        i = self.i
+        self.i += 1
+        while self.q and self.q[0][0] <= i - self.window: self.q.popleft()
+        while self.nan_idx and self.nan_idx[0] <= i - self.window: self.nan_idx.popleft()
+        if _isnan(x):
+            self.nan_idx.append(i)
+        else:
+            v = self.sign * x
+            while self.q and self.q[-1][1] <= v: self.q.pop()
+            self.q.append((i, v))
+        if self.i < self.window or self.nan_idx or not self.q: self.value = NAN
+        else: self.value = self.sign * self.q[0][1]
+        return self.value
+
+    def to_dict(self):
+        return {'window': self.window, 'i': self.i, 'q': [list(p) for p in self.q], 'nan_idx': list(self.nan_idx)}
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls(d['window'])
+        obj.i = d['i']
+        obj.q = deque(tuple(p) for p in d['q'])
+        obj.nan_idx = deque(d['nan_idx'])
+        obj.value = NAN if obj.i < obj.window or obj.nan_idx or not obj.q else obj.sign * obj.q[0][1]
+        return obj
+
+class RollingMin(RollingMax):
+    """取负后复用最大值队列"""
+    sign = -1.0
+
+class WilderRSI:
+    """Wilder RSI：涨跌幅做 EWM(alpha=1/period)，与 etf_grid_hunter 的全历史 RSI 逐位一致"""
+    def __init__(self, period=14):
+        self.period = period
+        self.com = (1 - 1 / period) / (1 / period)
+        self.prev = NAN
+        self.gain = [NAN, 1.0]
+        self.loss = [NAN, 1.0]
+        self.value = NAN
+
+    def update(self, close):
+        delta = close - self.prev
+        g = ewm_step(self.gain, delta if delta > 0 else 0.0, self.com)
+        l = ewm_step(self.loss, -delta if delta < 0 else 0.0, self.com)
+        self.prev = close
+        self.value = 100 - (100 / (1 + g / (l + 1e-9)))
+        return self.value
+
+    def to_dict(self):
+        return {'period': self.period, 'prev': self.prev, 'gain': self.gain, 'loss': self.loss, 'value': self.value}
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls(d['period'])
+        obj.prev, obj.gain, obj.loss, obj.value = d['prev'], list(d['gain']), list(d['loss']), d['value']
+        return obj
+
+class SimpleRSI:
+    """简单 RSI：涨跌幅做滚动均值。fill_zero=True 对应 strategy_engine 的写法（无下跌或未满窗口记为 0）"""
+    def __init__(self, period=14, fill_zero=False):
+        self.period = period
+        self.fill_zero = fill_zero
+        self.prev = NAN
+        self.gain = RollingMean(period)
+        self.loss = RollingMean(period)
+        self.value = NAN
+
+    def update(self, close):
+        delta = close - self.prev
+        g = self.gain.update(delta if delta > 0 else 0.0)
+        l = self.loss.update(-delta if delta < 0 else 0.0)
+        self.prev = close
+        if self.fill_zero:
+            rs = g / l if l != 0 and not _isnan(l) and not _isnan(g) else 0.0
+        else:
+            rs = g / l if l != 0 else (NAN if g == 0 or _isnan(g) else math.inf)
+        self.value = 100 - (100 / (1 + rs))
+        return self.value
+
+    def to_dict(self):
+        return {'period': self.period, 'fill_zero': self.fill_zero, 'prev': self.prev,
+                'gain': self.gain.to_dict(), 'loss': self.loss.to_dict(), 'value': self.value}
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls(d['period'], d['fill_zero'])
+        obj.prev, obj.value = d['prev'], d['value']
+        obj.gain, obj.loss = RollingMean.from_dict(d['gain']), RollingMean.from_dict(d['loss'])
+        return obj
+
+class KDJ:
+    """收盘价 KDJ：RSV 用 n 日最高/最低收盘，K、D 为 EWM(com)，J = 3K - 2D"""
+    def __init__(self, n=9, com=2):
+        self.n, self.com = n, com
+        self.low = RollingMin(n)
+        self.high = RollingMax(n)
+        self.k = [NAN, 1.0]
+        self.d = [NAN, 1.0]
+        self.value = (NAN, NAN, NAN)
+
+    def update(self, close):
+        lo, hi = self.low.update(close), self.high.update(close)
+        rsv = (close - lo) / (hi - lo) * 100 if hi != lo else NAN
+        k = ewm_step(self.k, rsv, self.com)
+        d = ewm_step(self.d, k, self.com)
+        self.value = (k, d, 3 * k - 2 * d)
+        return self.value
+
+    def to_dict(self):
+        return {'n': self.n, 'com': self.com, 'low': self.low.to_dict(), 'high': self.high.to_dict(),
+                'k': self.k, 'd': self.d, 'value': list(self.value)}
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls(d['n'], d['com'])
+        obj.low, obj.high = RollingMin.from_dict(d['low']), RollingMax.from_dict(d['high'])
+        obj.k, obj.d, obj.value = list(d['k']), list(d['d']), tuple(d['value'])
+        return obj
+
+class RunLength:
+    """连续满足条件的天数，条件不满足时归零（对应 persist_days）"""
+    def __init__(self):
+        self.value = 0
+
+    def update(self, cond):
+        self.value = self.value + 1 if cond else 0
+        return self.value
+
+    def to_dict(self):
+        return {'value': self.value}
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls()
+        obj.value = d['value']
+        return obj
+
+class Window:
+    """保留最近 size 个任意值（如 (收盘, RSI6) 对），用于底背离等需要回看的判断"""
+    def __init__(self, size):
+        self.size = size
+        self.buf = deque(maxlen=size)
+
+    def update(self, item):
+        self.buf.append(item)
+        return self.buf
+
+    def to_dict(self):
+        return {'size': self.size, 'buf': [list(x) if isinstance(x, tuple) else x for x in self.buf]}
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls(d['size'])
+        for x in d['buf']: obj.update(tuple(x) if isinstance(x, list) else x)
+        return obj
+
+INDICATOR_TYPES = {c.__name__: c for c in
+                   [RollingMean, RollingMax, RollingMin, WilderRSI, SimpleRSI, KDJ, RunLength, Window]}
+
+class FundStream:
+    """单只基金的流式状态：一组具名指标 + 已消费行数 n + 最后一根K线（日期/收盘）"""
+    def __init__(self, indicators):
+        self.ind = indicators
+        self.n = 0
+        self.last_date = None
+        self.last_close = None
+        self.extra = {}
+
+    def __getitem__(self, name):
+        return self.ind[name]
+
+    def matches(self, dates, closes):
+        """本地历史未被改写（未重新复权）时才允许从断点续算"""
+        n = self.n
+        if n == 0 or n > len(dates): return False
+        return str(dates[n - 1]) == self.last_date and float(closes[n - 1]) == self.last_close
+
+    def to_dict(self):
+        return {'n': self.n, 'last_date': self.last_date, 'last_close': self.last_close, 'extra': self.extra,
+                'ind': {k: [type(v).__name__, v.to_dict()] for k, v in self.ind.items()}}
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls({k: INDICATOR_TYPES[t].from_dict(v) for k, (t, v) in d['ind'].items()})
+        obj.n, obj.last_date, obj.last_close = d['n'], d['last_date'], d['last_close']
+        obj.extra = d.get('extra', {})
+        return obj
+
+def advance(stream, code, factory, feed):
+    """把基金状态推进到仓库中的最新一根K线
+
+    factory() 创建空状态；feed(stream, cols, i) 消费第 i 根K线（cols 为解码后的字段数组）。
+    状态缺失或历史被改写时从头预热，否则只消费断点之后的新K线。返回 (stream, 新消费行数)，
+    基金不在仓库中时返回 (None, 0)。
+    """
+    raw = price_store.load_arrays(code)
+    if raw is None: return None, 0
+    n = len(raw['date'])
+    if stream is None or not stream.matches(raw['date'], raw['close']):
+        stream, start = factory(), 0
+    else:
+        start = stream.n
+    if start < n:
+        cols = {f: price_store.decode(f, raw[f][start:]) for f in raw}
+        for i in range(n - start): feed(stream, cols, i)
+        stream.n = n
+        stream.last_date = str(raw['date'][n - 1])
+        stream.last_close = float(raw['close'][n - 1])
+    return stream, n - start
+
+def _state_path(name, state_dir):
+    return os.path.join(state_dir, f'{name}.json')
+
+def load_states(name, state_dir=STATE_DIR):
+    path = _state_path(name, state_dir)
+    if not os.path.exists(path): return {}
+    try:
+        with open(path, encoding='utf-8') as f: data = json.load(f)
+        return {code: FundStream.from_dict(d) for code, d in data.items()}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def save_states(name, states, state_dir=STATE_DIR):
+    os.makedirs(state_dir, exist_ok=True)
+    path = _state_path(name, state_dir)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        # json.dumps 走 C 编码器，比 json.dump 逐块写文件快一个数量级
+        f.write(json.dumps({code: s.to_dict() for code, s in states.items()}))
+    os.replace(tmp, path)
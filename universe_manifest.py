@@ -0,0 +1,169 @@
+import os
+import io
+import glob
+import json
+import hashlib
+import pandas as pd
+import price_store
+import fund_outcomes
+
+# ==============================================================================
+# 品种清单：每只基金一行摘要（行数、首末日期、近5/20日均成交额、最新收盘）
+# 1. [维护时机]：download_etf 下载完成后刷新；引擎读取时按 大小/内容哈希 发现过期条目并自愈
+# 2. [预筛选]：各引擎派发任务前先按清单剔除K线不足、流动性不足的品种，不再为它们解析行情
+# 3. [读取方式]：只读CSV表头与末尾若干行，不解析整个文件；编码与 price_store 一致，utf-8-sig 失败回退 gbk
+# 4. [入库与缓存]：清单随仓库提交，只存与检出无关的 大小/sha1；本机 mtime 记在未入库的 STAT_FILE，
+#    mtime 与大小都未变时跳过哈希。重新检出只刷新该缓存，不会改写清单
+# ==============================================================================
+
+DATA_DIR = 'fund_data'
+MANIFEST_FILE = 'fund_manifest.csv'
+TAIL_ROWS = 20
+MANIFEST_COLS = ['代码', '行数', '首日', '末日', '均额5', '均额20', '收盘', 'size', 'sha1']
+STAT_FILE = os.path.join('.scan_state', 'manifest_mtime.json')
+
+def _read_csv_bytes(data):
+    """CSV 字节片段 -> DataFrame，编码兜底与 price_store.parse_fund_csv 相同"""
+    try: return pd.read_csv(io.BytesIO(data), encoding='utf-8-sig')
+    except UnicodeDecodeError: return pd.read_csv(io.BytesIO(data), encoding='gbk')
+
+def read_tail(file_path, n_rows, block_size=8192):
+    """只读取CSV表头和末尾 n_rows 行，避免为取最后日期解析整个文件"""
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        pos, data = size, b''
+        while pos > len(header) and data.count(b'\n') <= n_rows + 1:
+            step = min(block_size, pos - len(header))
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = [l for l in data.splitlines() if l.strip()]
+    if pos > len(header): lines = lines[1:]  # 第一行可能被截断
+    body = b'\n'.join(lines[-n_rows:])
+    return _read_csv_bytes(header + body)
+
+def _count_rows(file_path):
+    """数据行数（不含表头与空行），按块统计换行符"""
+    n, last = 0, b'\n'
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            n += chunk.count(b'\n')
+            last = chunk[-1:]
+    if last != b'\n': n += 1
+    return max(n - 1, 0)
+
+def _file_sha1(file_path):
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''): h.update(chunk)
+    return h.hexdigest()
+
+def _first_date(file_path):
+    with open(file_path, 'rb') as f:
+        head = f.readline() + f.readline()
+    df = _read_csv_bytes(head)
+    df.columns = [str(c).strip() for c in df.columns]
+    col = '日期' if '日期' in df.columns else 'date'
+    return str(df[col].iloc[0])[:10] if col in df.columns and len(df) else ''
+
+def scan_file(file_path):
+    """读取单个CSV的摘要（含本机 mtime，落盘时单独存放）；无法解析时登记到 fund_outcomes 并返回 None"""
+    try:
+        st = os.stat(file_path)
+        tail = read_tail(file_path, TAIL_ROWS)
+        tail.columns = [str(c).strip() for c in tail.columns]
+        if 'net_value' in tail.columns: tail = tail.rename(columns={'date': '日期', 'net_value': '收盘'})
+        if '日期' not in tail.columns or '收盘' not in tail.columns:
+            return fund_outcomes.skip(file_path, '缺少日期/收盘列', 'manifest')
+        if tail.empty: return fund_outcomes.skip(file_path, '无数据行', 'manifest')
+        amount = tail['成交额'] if '成交额' in tail.columns else pd.Series(dtype=float)
+        return {
+            '代码': price_store.code_from_path(file_path),
+            '行数': _count_rows(file_path),
+            '首日': _first_date(file_path),
+            '末日': str(tail['日期'].iloc[-1])[:10],
+            '均额5': amount.iloc[-5:].mean(),
+            '均额20': amount.iloc[-20:].mean(),
+            '收盘': float(tail['收盘'].iloc[-1]),
+            'mtime': st.st_mtime,
+            'size': st.st_size,
+            'sha1': _file_sha1(file_path),
+        }
+    except Exception as e:
+        return fund_outcomes.error(file_path, e, 'manifest')
+
+def load_stats(stat_file=STAT_FILE):
+    """本机 mtime 缓存 {代码: [mtime, size]}；缺失或损坏时为空，退化为逐个比对哈希"""
+    try:
+        with open(stat_file, encoding='utf-8') as f: return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_stats(stats, stat_file=STAT_FILE):
+    os.makedirs(os.path.dirname(stat_file), exist_ok=True)
+    tmp = stat_file + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f: json.dump(stats, f, sort_keys=True)
+    os.replace(tmp, stat_file)
+
+def load_manifest(data_dir=DATA_DIR, manifest_file=MANIFEST_FILE, refresh=True):
+    """读取清单（索引为代码）；refresh=True 时重扫内容变化或缺失的条目并写回，内容未变时清单文件不动"""
+    if os.path.exists(manifest_file):
+        # round_trip：未变条目原样写回，清单改写时只有真正变化的行出现在 diff 中
+        manifest = pd.read_csv(manifest_file, dtype={'代码': str, '首日': str, '末日': str}, encoding='utf-8-sig',
+                               float_precision='round_trip')
+    else:
+        manifest = pd.DataFrame(columns=MANIFEST_COLS)
+    manifest = manifest.set_index('代码', drop=False)
+    if not refresh: return manifest
+
+    known = manifest.set_index('代码')[['size', 'sha1']].to_dict('index')
+    stats = load_stats()
+    files = {price_store.code_from_path(f): f for f in glob.glob(os.path.join(data_dir, '*.csv'))}
+    stale, touched = [], False
+    for code, f in files.items():
+        st = os.stat(f)
+        m = known.get(code)
+        if m is None or m['size'] != st.st_size:
+            stale.append(f)
+        elif stats.get(code) != [st.st_mtime, st.st_size]:
+            # 重新检出等只改变 mtime 的情况：内容哈希一致则只刷新本机缓存
+            if m['sha1'] != _file_sha1(f):
+                stale.append(f)
+                continue
+            stats[code] = [st.st_mtime, st.st_size]
+            touched = True
+    removed = set(known) - set(files)
+    if touched: save_stats(stats)
+    if stale or removed or list(manifest.columns) != MANIFEST_COLS:   # 旧版清单含 mtime 列，改写一次
+        manifest = update_manifest(stale, manifest_file=manifest_file, drop=removed, base=manifest)
+    return manifest
+
+def update_manifest(file_paths, manifest_file=MANIFEST_FILE, drop=(), base=None):
+    """重扫给定文件并写回清单（下载完成后调用），返回最新清单"""
+    old = base if base is not None else load_manifest(manifest_file=manifest_file, refresh=False)
+    rows = [r for r in map(scan_file, file_paths) if r is not None]
+    stats = load_stats()
+    stats.update({r['代码']: [r['mtime'], r['size']] for r in rows})
+    for code in drop: stats.pop(code, None)
+    save_stats(stats)
+    fresh = pd.DataFrame(rows, columns=MANIFEST_COLS).set_index('代码', drop=False)
+    keep = old[~old.index.isin(fresh.index) & ~old.index.isin(list(drop))]
+    manifest = pd.concat([keep, fresh]) if len(keep) else fresh
+    manifest = manifest.sort_index()
+    tmp = manifest_file + '.tmp'
+    manifest[MANIFEST_COLS].to_csv(tmp, index=False, encoding='utf-8-sig')
+    os.replace(tmp, manifest_file)
+    return manifest[MANIFEST_COLS]
+
+def select(min_rows=0, min_amount5=None, data_dir=DATA_DIR):
+    """按清单预筛选代码：行数 >= min_rows，且近5日均成交额不低于 min_amount5（缺失视为满足）"""
+    manifest = load_manifest(data_dir)
+    ok = manifest['行数'] >= min_rows
+    if min_amount5 is not None: ok &= ~(manifest['均额5'] < min_amount5)
+    return sorted(manifest.index[ok])
+
+if __name__ == "__main__":
+    m = load_manifest()
+    print(f"🗂️ 品种清单: {len(m)} 只基金 | 行数>=60: {(m['行数'] >= 60).sum()} | 行数>=300: {(m['行数'] >= 300).sum()}")